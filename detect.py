@@ -46,7 +46,7 @@ ROOT = Path(os.path.relpath(ROOT, Path.cwd()))  # relative
 from ultralytics.utils.plotting import Annotator, colors, save_one_box
 
 from models.common import DetectMultiBackend
-from utils.dataloaders import IMG_FORMATS, VID_FORMATS, LoadImages, LoadScreenshots, LoadStreams
+from utils.dataloaders import IMG_FORMATS, VID_FORMATS, LoadImageBatches, LoadImages, LoadScreenshots, LoadStreams
 from utils.general import (
     LOGGER,
     Profile,
@@ -63,6 +63,9 @@ from utils.general import (
     strip_optimizer,
     xyxy2xywh,
 )
+from utils.pipeline import Pipeline
+from utils.slicing import slice_windows, sliced_inference
+from utils.tracking import ByteTracker, KeyframeScheduler
 from utils.torch_utils import select_device, smart_inference_mode
 
 
@@ -97,6 +100,18 @@ def run(
     half=False,  # use FP16 half-precision inference
     dnn=False,  # use OpenCV DNN for ONNX inference
     vid_stride=1,  # video frame-rate stride
+    pipeline=False,  # run decode, inference, NMS and save as concurrent pipelined stages
+    batch_size=1,  # batch size for image sources, images of equal letterboxed shape are batched together
+    slice_size=0,  # sliced inference tile size (pixels) for high-resolution images, 0 to disable
+    slice_overlap=0.2,  # sliced inference fractional tile overlap
+    slice_full=False,  # sliced inference adds a full-image pass at --imgsz
+    slice_merge="nms",  # sliced inference cross-tile merge, 'nms' or 'wbf'
+    keyframe=False,  # run the detector on video keyframes only and propagate boxes on the frames in between
+    keyframe_thres=0.03,  # keyframe motion score threshold (0-1)
+    keyframe_max=30,  # maximum frames between keyframes
+    track=False,  # track objects across video and stream frames, saving track IDs with the detections
+    track_thres=0.5,  # tracker high-confidence detection threshold
+    track_buffer=30,  # frames to keep lost tracks
 ):
     """
     Runs YOLOv5 detection inference on various sources like images, videos, directories, streams, etc.
@@ -133,6 +148,29 @@ def run(
         half (bool): If True, use FP16 half-precision inference. Default is False.
         dnn (bool): If True, use OpenCV DNN backend for ONNX inference. Default is False.
         vid_stride (int): Stride for processing video frames, to skip frames between processing. Default is 1.
+        pipeline (bool): If True, run decode, pre-process, inference, NMS and save as concurrent stages joined by
+            bounded queues, logging per-stage throughput. Output order is unchanged. Default is False.
+        batch_size (int): Batch size for file sources. Images with the same letterboxed shape run in one forward pass
+            and results are split back out per file, identical to batch size 1. Default is 1.
+        slice_size (int): Tile size for sliced inference of high-resolution imagery with small objects (--slice).
+            Each image is cut into overlapping tiles at native resolution, run `batch_size` tiles (8 if 1) per forward
+            pass, and tile detections are merged in image coordinates. Not supported for streams. 0 disables slicing.
+            Default is 0.
+        slice_overlap (float): Fractional overlap between neighbouring tiles. Default is 0.2.
+        slice_full (bool): If True, add a full-image pass letterboxed to `imgsz` for objects larger than a tile.
+            Default is False.
+        slice_merge (str): Cross-tile merge method, 'nms' or 'wbf' (weighted boxes fusion). Default is 'nms'.
+        keyframe (bool): If True, run the detector on videos and streams only when a block frame-difference score
+            against the last keyframe exceeds `keyframe_thres` or after `keyframe_max` frames, and propagate the last
+            detections with per-box constant velocity on the frames in between. Default is False.
+        keyframe_thres (float): Keyframe motion score threshold, the max mean absolute difference of any cell of a
+            downscaled grayscale frame (0-1). Default is 0.03.
+        keyframe_max (int): Maximum number of frames between keyframes. Default is 30.
+        track (bool): If True, run a ByteTrack-style tracker per video or stream after NMS and label, draw and save
+            detections with track IDs. Detections between --conf-thres and `track_thres` are only used to continue
+            existing tracks, so lower --conf-thres (i.e. 0.1) to benefit from them. Default is False.
+        track_thres (float): Tracker high-confidence detection threshold. Default is 0.5.
+        track_buffer (int): Number of frames to keep unmatched tracks before dropping them. Default is 30.
 
     Returns:
         None
@@ -167,6 +205,22 @@ def run(
     stride, names, pt = model.stride, model.names, model.pt
     imgsz = check_img_size(imgsz, s=stride)  # check image size
 
+    # Sliced inference
+    if slice_size and webcam:
+        LOGGER.warning("WARNING ⚠️ --slice is not supported for streams, disabling sliced inference")
+        slice_size = 0
+    if slice_size and pipeline:
+        LOGGER.warning("WARNING ⚠️ --slice is not compatible with --pipeline, disabling pipelined execution")
+        pipeline = False
+    slice_bs = batch_size if batch_size > 1 else 8  # --batch-size sets tiles per forward pass when slicing
+    batch_size = 1 if slice_size else batch_size
+    if keyframe and (pipeline or batch_size > 1):
+        LOGGER.warning("WARNING ⚠️ --keyframe is not compatible with --pipeline or --batch-size, ignoring them")
+        pipeline, batch_size = False, 1
+    if track and (pipeline or batch_size > 1):
+        LOGGER.warning("WARNING ⚠️ --track is not compatible with --pipeline or --batch-size, ignoring them")
+        pipeline, batch_size = False, 1
+
     # Dataloader
     bs = 1  # batch_size
     if webcam:
@@ -175,68 +229,102 @@ def run(
         bs = len(dataset)
     elif screenshot:
         dataset = LoadScreenshots(source, img_size=imgsz, stride=stride, auto=pt)
+    elif batch_size > 1:
+        dataset = LoadImageBatches(source, imgsz, stride, auto=pt, vid_stride=vid_stride, batch_size=batch_size)
+        bs = batch_size
     else:
         dataset = LoadImages(source, img_size=imgsz, stride=stride, auto=pt, vid_stride=vid_stride)
     vid_path, vid_writer = [None] * bs, [None] * bs
+    schedulers = [KeyframeScheduler(keyframe_thres, keyframe_max) for _ in range(bs)] if keyframe else None
+    trackers = [ByteTracker(track_thres, track_buffer=track_buffer) for _ in range(bs)] if track else None
 
     # Run inference
     model.warmup(imgsz=(1 if pt or model.triton else bs, 3, *imgsz))  # warmup
     seen, windows, dt = 0, [], (Profile(device=device), Profile(device=device), Profile(device=device))
-    for path, im, im0s, vid_cap, s in dataset:
-        with dt[0]:
-            im = torch.from_numpy(im).to(model.device)
-            im = im.half() if model.fp16 else im.float()  # uint8 to fp16/32
-            im /= 255  # 0 - 255 to 0.0 - 1.0
-            if len(im.shape) == 3:
-                im = im[None]  # expand for batch dim
-            if model.xml and im.shape[0] > 1:
-                ims = torch.chunk(im, im.shape[0], 0)
-
-        # Inference
-        with dt[1]:
-            visualize = increment_path(save_dir / Path(path).stem, mkdir=True) if visualize else False
-            if model.xml and im.shape[0] > 1:
-                pred = None
-                for image in ims:
-                    if pred is None:
-                        pred = model(image, augment=augment, visualize=visualize).unsqueeze(0)
-                    else:
-                        pred = torch.cat((pred, model(image, augment=augment, visualize=visualize).unsqueeze(0)), dim=0)
-                pred = [pred, None]
-            else:
-                pred = model(im, augment=augment, visualize=visualize)
-        # NMS
-        with dt[2]:
-            pred = non_max_suppression(pred, conf_thres, iou_thres, classes, agnostic_nms, max_det=max_det)
-
-        # Second-stage classifier (optional)
-        # pred = utils.general.apply_classifier(pred, classifier_model, im, im0s)
-
-        # Define the path for the CSV file
-        csv_path = save_dir / "predictions.csv"
-
-        # Create or append to the CSV file
-        def write_to_csv(image_name, prediction, confidence):
-            """Writes prediction data for an image to a CSV file, appending if the file exists."""
-            data = {"Image Name": image_name, "Prediction": prediction, "Confidence": confidence}
-            with open(csv_path, mode="a", newline="") as f:
-                writer = csv.DictWriter(f, fieldnames=data.keys())
-                if not csv_path.is_file():
-                    writer.writeheader()
-                writer.writerow(data)
-
-        # Process predictions
+    propagated = 0  # images whose detections were propagated from a keyframe, the detector did not run on them
+    csv_path = save_dir / "predictions.csv"  # Define the path for the CSV file
+
+    # Create or append to the CSV file
+    def write_to_csv(image_name, prediction, confidence):
+        """Writes prediction data for an image to a CSV file, appending if the file exists."""
+        data = {"Image Name": image_name, "Prediction": prediction, "Confidence": confidence}
+        with open(csv_path, mode="a", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=data.keys())
+            if not csv_path.is_file():
+                writer.writeheader()
+            writer.writerow(data)
+
+    def preprocess(im):
+        """Converts a uint8 HWC/BCHW numpy image to a normalized model-input tensor on the model device."""
+        im = torch.from_numpy(im).to(model.device)
+        im = im.half() if model.fp16 else im.float()  # uint8 to fp16/32
+        im /= 255  # 0 - 255 to 0.0 - 1.0
+        if len(im.shape) == 3:
+            im = im[None]  # expand for batch dim
+        return im
+
+    def inference(im, path):
+        """Runs the model on a preprocessed batch, one image at a time for OpenVINO batches."""
+        vis = increment_path(save_dir / Path(path).stem, mkdir=True) if visualize else False
+        if model.xml and im.shape[0] > 1:
+            pred = None
+            for image in torch.chunk(im, im.shape[0], 0):
+                if pred is None:
+                    pred = model(image, augment=augment, visualize=vis).unsqueeze(0)
+                else:
+                    pred = torch.cat((pred, model(image, augment=augment, visualize=vis).unsqueeze(0)), dim=0)
+            return [pred, None]
+        return model(im, augment=augment, visualize=vis)
+
+    def nms(pred):
+        """Applies non-max suppression to raw model output, returning a list of per-image detections."""
+        return non_max_suppression(pred, conf_thres, iou_thres, classes, agnostic_nms, max_det=max_det)
+
+    def sliced_inference_im0(im0):
+        """Runs sliced inference on an original BGR image, returning (n, 6) detections in its pixels."""
+        return sliced_inference(
+            model,
+            im0,
+            slice_size,
+            slice_overlap,
+            slice_bs,
+            conf_thres,
+            iou_thres,
+            classes,
+            agnostic_nms,
+            max_det,
+            full_size=max(imgsz) if slice_full else 0,
+            merge=slice_merge,
+            augment=augment,
+        )
+
+    def video_info(vid_cap):
+        """Returns (fps, w, h) of an open video capture for the video writer, or None for images and streams."""
+        if save_img and vid_cap:
+            return (
+                vid_cap.get(cv2.CAP_PROP_FPS),
+                int(vid_cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                int(vid_cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+            )
+
+    def write_results(path, im, im0s, vid_info, s, frame, mode, pred, t, ids=None):
+        """Annotates, displays and saves `pred` and optional track `ids` of one batch, logs inference time `t`."""
+        nonlocal seen
+        batched = isinstance(s, list)  # LoadImageBatches, one print string per image
+        strings = s
         for i, det in enumerate(pred):  # per image
             seen += 1
             if webcam:  # batch_size >= 1
-                p, im0, frame = path[i], im0s[i].copy(), dataset.count
+                p, im0 = path[i], im0s[i].copy()
                 s += f"{i}: "
+            elif batched:
+                p, im0, s = path[i], im0s[i].copy(), strings[i]
             else:
-                p, im0, frame = path, im0s.copy(), getattr(dataset, "frame", 0)
+                p, im0 = path, im0s.copy()
 
             p = Path(p)  # to Path
             save_path = str(save_dir / p.name)  # im.jpg
-            txt_path = str(save_dir / "labels" / p.stem) + ("" if dataset.mode == "image" else f"_{frame}")  # im.txt
+            txt_path = str(save_dir / "labels" / p.stem) + ("" if mode == "image" else f"_{frame}")  # im.txt
             s += "{:g}x{:g} ".format(*im.shape[2:])  # print string
             gn = torch.tensor(im0.shape)[[1, 0, 1, 0]]  # normalization gain whwh
             imc = im0.copy() if save_crop else im0  # for save_crop
@@ -251,7 +339,8 @@ def run(
                     s += f"{n} {names[int(c)]}{'s' * (n > 1)}, "  # add to string
 
                 # Write results
-                for *xyxy, conf, cls in reversed(det):
+                track_ids = ids[i].tolist() if ids else [None] * len(det)
+                for (*xyxy, conf, cls), tid in zip(reversed(det), reversed(track_ids)):
                     c = int(cls)  # integer class
                     label = names[c] if hide_conf else f"{names[c]}"
                     confidence = float(conf)
@@ -268,12 +357,14 @@ def run(
                         else:
                             coords = (torch.tensor(xyxy).view(1, 4) / gn).view(-1).tolist()  # xyxy
                         line = (cls, *coords, conf) if save_conf else (cls, *coords)  # label format
+                        line += () if tid is None else (tid,)  # track ID
                         with open(f"{txt_path}.txt", "a") as f:
                             f.write(("%g " * len(line)).rstrip() % line + "\n")
 
                     if save_img or save_crop or view_img:  # Add bbox to image
                         c = int(cls)  # integer class
                         label = None if hide_labels else (names[c] if hide_conf else f"{names[c]} {conf:.2f}")
+                        label = f"#{tid} {label}" if label and tid is not None else label
                         annotator.box_label(xyxy, label, color=colors(c, True))
                     if save_crop:
                         save_one_box(xyxy, imc, file=save_dir / "crops" / names[c] / f"{p.stem}.jpg", BGR=True)
@@ -290,29 +381,112 @@ def run(
 
             # Save results (image with detections)
             if save_img:
-                if dataset.mode == "image":
+                if mode == "image":
                     cv2.imwrite(save_path, im0)
                 else:  # 'video' or 'stream'
                     if vid_path[i] != save_path:  # new video
                         vid_path[i] = save_path
                         if isinstance(vid_writer[i], cv2.VideoWriter):
                             vid_writer[i].release()  # release previous video writer
-                        if vid_cap:  # video
-                            fps = vid_cap.get(cv2.CAP_PROP_FPS)
-                            w = int(vid_cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-                            h = int(vid_cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-                        else:  # stream
-                            fps, w, h = 30, im0.shape[1], im0.shape[0]
+                        fps, w, h = vid_info or (30, im0.shape[1], im0.shape[0])  # video or stream
                         save_path = str(Path(save_path).with_suffix(".mp4"))  # force *.mp4 suffix on results videos
                         vid_writer[i] = cv2.VideoWriter(save_path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (w, h))
                     vid_writer[i].write(im0)
 
-        # Print time (inference-only)
-        LOGGER.info(f"{s}{'' if len(det) else '(no detections), '}{dt[1].dt * 1E3:.1f}ms")
+            if batched:  # Print time (batch inference-only)
+                LOGGER.info(f"{s}{'' if len(det) else '(no detections), '}{t * 1E3:.1f}ms")
+
+        if not batched:  # Print time (inference-only)
+            LOGGER.info(f"{s}{'' if len(det) else '(no detections), '}{t * 1E3:.1f}ms")
+
+    if pipeline:
+        # Decode, pre-process, inference, NMS and save run concurrently, joined by bounded FIFO queues
+        def decode():
+            """Yields decoded batches with the per-batch dataset state the save stage needs."""
+            for path, im, im0s, vid_cap, s in dataset:
+                if webcam:  # LoadStreams reuses its buffers on the next call
+                    im, im0s = im.copy(), [x.copy() for x in im0s]
+                frame = dataset.count if webcam else getattr(dataset, "frame", 0)
+                yield path, im, im0s, video_info(vid_cap), s, frame, dataset.mode
+
+        def pre_stage(x):
+            """Pipeline stage wrapping preprocess()."""
+            return x[0], preprocess(x[1]), *x[2:]
+
+        def inference_stage(x):
+            """Pipeline stage wrapping inference(), appending the inference time of this batch."""
+            with Profile(device=device) as p:  # dt[1] only updates once this stage returns
+                pred = inference(x[1], x[0])
+            return *x, pred, p.dt
+
+        def nms_stage(x):
+            """Pipeline stage wrapping nms()."""
+            return *x[:7], nms(x[7]), x[8]
+
+        stages = [smart_inference_mode()(f) for f in (pre_stage, inference_stage, nms_stage)]  # thread-local mode
+        profiles = (Profile(), *dt, Profile())
+        names = ("decode", "pre-process", "inference", "NMS", "save")
+        pipe = Pipeline(decode(), stages, sink=lambda x: write_results(*x), profiles=profiles, names=names)
+        pipe.run()
+        LOGGER.info(pipe.summary())
+    else:
+        for path, im, im0s, vid_cap, s in dataset:
+            key = True  # run the detector on this frame
+            if schedulers and dataset.mode != "image":  # keyframe scheduling, every stream is checked
+                frames, paths = (im0s, path) if webcam else ([im0s], [path])
+                key = any([x.is_keyframe(f, p) for x, f, p in zip(schedulers, frames, paths)])
+                s += "keyframe " if key else "propagated "
+
+            if not key:  # propagate the last keyframe detections, no pre-process, inference or NMS
+                pred = [x.predict() for x in schedulers]
+                propagated += len(pred)
+                shape = (1, 3, *im0s.shape[:2]) if slice_size else (len(pred), *im.shape[-3:])
+                im = torch.empty(shape, device="meta")  # shape-only, boxes are in the keyframe input pixels
+            elif slice_size:  # tiles of the original image, NMS and cross-tile merge included in inference time
+                s += f"{len(slice_windows(im0s.shape, slice_size, slice_overlap))} tiles "
+                with dt[1]:
+                    pred = [sliced_inference_im0(im0s)]
+                im = torch.empty((1, 3, *im0s.shape[:2]), device="meta")  # shape-only, boxes are in im0 pixels
+            else:
+                with dt[0]:
+                    im = preprocess(im)
+
+                # Inference
+                with dt[1]:
+                    pred = inference(im, path)
+                # NMS
+                with dt[2]:
+                    pred = nms(pred)
+
+            if key and schedulers and dataset.mode != "image":
+                pred = [x.update(d) for x, d in zip(schedulers, pred)]  # keep a copy before boxes are rescaled
+
+            ids = None
+            if trackers and dataset.mode != "image":  # one tracker per stream, in input pixels
+                paths = path if webcam else [path]
+                tracks = [x.update(d, p) for x, d, p in zip(trackers, pred, paths)]  # (n, 7) xyxy, id, conf, cls
+                pred = [torch.from_numpy(x[:, [0, 1, 2, 3, 5, 6]]).to(d.device) for x, d in zip(tracks, pred)]
+                ids = [x[:, 4].astype(int) for x in tracks]
+
+            # Second-stage classifier (optional)
+            # pred = utils.general.apply_classifier(pred, classifier_model, im, im0s)
+
+            # Process predictions
+            frame = dataset.count if webcam else getattr(dataset, "frame", 0)
+            t = dt[1].dt if key else 0.0  # propagated frames run no inference
+            write_results(path, im, im0s, video_info(vid_cap), s, frame, dataset.mode, pred, t, ids)
 
     # Print results
-    t = tuple(x.t / seen * 1e3 for x in dt)  # speeds per image
+    t = tuple(x.t / max(seen - propagated, 1) * 1e3 for x in dt)  # speeds per image the detector ran on
     LOGGER.info(f"Speed: %.1fms pre-process, %.1fms inference, %.1fms NMS per image at shape {(1, 3, *imgsz)}" % t)
+    if schedulers:
+        for i, x in enumerate(schedulers):
+            LOGGER.info(f"{f'{i}: ' if bs > 1 else ''}{x.summary()}")
+    if trackers:
+        for i, x in enumerate(trackers):
+            LOGGER.info(f"{f'{i}: ' if bs > 1 else ''}{x.summary()}")
+    if webcam and sum(dataset.dropped):
+        LOGGER.info(f"Dropped {sum(dataset.dropped)} stream frames not read in time {dataset.dropped}")
     if save_txt or save_img:
         s = f"\n{len(list(save_dir.glob('labels/*.txt')))} labels saved to {save_dir / 'labels'}" if save_txt else ""
         LOGGER.info(f"Results saved to {colorstr('bold', save_dir)}{s}")
@@ -354,6 +528,20 @@ def parse_opt():
         --dnn (bool, optional): Flag to use OpenCV DNN for ONNX inference. Defaults to False.
         --vid-stride (int, optional): Video frame-rate stride, determining the number of frames to skip in between
             consecutive frames. Defaults to 1.
+        --pipeline (bool, optional): Flag to run decode, inference, NMS and save as pipelined stages. Defaults to False.
+        --batch-size (int, optional): Batch size for image sources, batching images of equal letterboxed shape.
+            Defaults to 1.
+        --slice (int, optional): Tile size for sliced inference of high-resolution images, 0 to disable. Defaults to 0.
+        --slice-overlap (float, optional): Fractional overlap between tiles. Defaults to 0.2.
+        --slice-full (bool, optional): Flag to add a full-image pass at --imgsz to sliced inference. Defaults to False.
+        --slice-merge (str, optional): Cross-tile merge method, 'nms' or 'wbf'. Defaults to 'nms'.
+        --keyframe (bool, optional): Flag to run the detector on video keyframes only and propagate boxes in between.
+            Defaults to False.
+        --keyframe-thres (float, optional): Keyframe motion score threshold (0-1). Defaults to 0.03.
+        --keyframe-max (int, optional): Maximum frames between keyframes. Defaults to 30.
+        --track (bool, optional): Flag to track objects in videos and streams and save track IDs. Defaults to False.
+        --track-thres (float, optional): Tracker high-confidence detection threshold. Defaults to 0.5.
+        --track-buffer (int, optional): Frames to keep lost tracks. Defaults to 30.
 
     Returns:
         argparse.Namespace: Parsed command-line arguments as an argparse.Namespace object.
@@ -399,6 +587,22 @@ def parse_opt():
     parser.add_argument("--half", action="store_true", help="use FP16 half-precision inference")
     parser.add_argument("--dnn", action="store_true", help="use OpenCV DNN for ONNX inference")
     parser.add_argument("--vid-stride", type=int, default=1, help="video frame-rate stride")
+    parser.add_argument(
+        "--pipeline", action="store_true", help="run decode, inference, NMS and save as pipelined stages"
+    )
+    parser.add_argument("--batch-size", type=int, default=1, help="batch size for image sources (shape-bucketed)")
+    parser.add_argument(
+        "--slice", type=int, default=0, dest="slice_size", help="sliced inference tile size (pixels), 0 to disable"
+    )
+    parser.add_argument("--slice-overlap", type=float, default=0.2, help="sliced inference fractional tile overlap")
+    parser.add_argument("--slice-full", action="store_true", help="sliced inference adds a full-image pass")
+    parser.add_argument("--slice-merge", default="nms", choices=("nms", "wbf"), help="sliced inference tile merge")
+    parser.add_argument("--keyframe", action="store_true", help="run the detector on video keyframes only")
+    parser.add_argument("--keyframe-thres", type=float, default=0.03, help="keyframe motion score threshold (0-1)")
+    parser.add_argument("--keyframe-max", type=int, default=30, help="maximum frames between keyframes")
+    parser.add_argument("--track", action="store_true", help="track objects in videos and streams, save track IDs")
+    parser.add_argument("--track-thres", type=float, default=0.5, help="tracker high-confidence detection threshold")
+    parser.add_argument("--track-buffer", type=int, default=30, help="frames to keep lost tracks")
     opt = parser.parse_args()
     opt.imgsz *= 2 if len(opt.imgsz) == 1 else 1  # expand
     print_args(vars(opt))
@@ -36,7 +36,8 @@ except (ImportError, AssertionError):
 from ultralytics.utils.plotting import Annotator, colors, save_one_box
 
 from utils import TryExcept
-from utils.dataloaders import exif_transpose, letterbox
+from utils.augmentations import preprocess
+from utils.dataloaders import exif_transpose
 from utils.general import (
     LOGGER,
     ROOT,
@@ -54,6 +55,7 @@ from utils.general import (
     xyxy2xywh,
     yaml_load,
 )
+from utils.slicing import sliced_inference
 from utils.torch_utils import copy_attr, smart_inference_mode
 
 
@@ -809,6 +811,11 @@ class AutoShape(nn.Module):
     classes = None  # (optional list) filter by class, i.e. = [0, 15, 16] for COCO persons, cats and dogs
     max_det = 1000  # maximum number of detections per image
     amp = False  # Automatic Mixed Precision (AMP) inference
+    slice = 0  # (optional) sliced inference tile size for high-resolution images, 0 to disable
+    slice_overlap = 0.2  # sliced inference fractional tile overlap
+    slice_batch = 8  # sliced inference tiles per forward pass
+    slice_full = False  # sliced inference adds a full-image pass at `size`
+    slice_merge = "nms"  # sliced inference cross-tile merge, 'nms' or 'wbf'
 
     def __init__(self, model, verbose=True):
         """Initializes YOLOv5 model for inference, setting up attributes and preparing model for evaluation."""
@@ -884,10 +891,15 @@ class AutoShape(nn.Module):
                 g = max(size) / max(s)  # gain
                 shape1.append([int(y * g) for y in s])
                 ims[i] = im if im.data.contiguous else np.ascontiguousarray(im)  # update
-            shape1 = [make_divisible(x, self.stride) for x in np.array(shape1).max(0)]  # inf shape
-            x = [letterbox(im, shape1, auto=False)[0] for im in ims]  # pad
-            x = np.ascontiguousarray(np.array(x).transpose((0, 3, 1, 2)))  # stack and BHWC to BCHW
-            x = torch.from_numpy(x).to(p.device).type_as(p) / 255  # uint8 to fp16/32
+            if not self.slice:  # sliced inference pre-processes its own tiles
+                shape1 = [make_divisible(x, self.stride) for x in np.array(shape1).max(0)]  # inf shape
+                x = np.empty((n, 3, *shape1), dtype=np.result_type(*{im.dtype for im in ims}))  # BCHW
+                for i, im in enumerate(ims):
+                    preprocess(im, shape1, auto=False, swap_rb=False, out=x[i])  # pad, HWC to CHW into batch
+                x = torch.from_numpy(x).to(p.device).type_as(p) / 255  # uint8 to fp16/32
+
+        if self.slice:  # timed as inference, after pre-processing has stopped
+            return self._sliced(ims, files, size, dt, autocast)
 
         with amp.autocast(autocast):
             # Inference
@@ -910,6 +922,29 @@ class AutoShape(nn.Module):
 
             return Detections(ims, y, files, dt, self.names, x.shape)
 
+    def _sliced(self, ims, files, size, dt, autocast):
+        """Runs sliced inference on each RGB HWC image in `ims`, see utils.slicing.sliced_inference()."""
+        with amp.autocast(autocast), dt[1]:
+            y = [
+                sliced_inference(
+                    self.model,
+                    im,
+                    self.slice,
+                    self.slice_overlap,
+                    self.slice_batch,
+                    self.conf,
+                    self.iou,
+                    self.classes,
+                    self.agnostic,
+                    self.max_det,
+                    full_size=max(size) if self.slice_full else 0,
+                    merge=self.slice_merge,
+                    swap_rb=False,
+                )
+                for im in ims
+            ]
+        return Detections(ims, y, files, dt, self.names, (len(ims), 3, self.slice, self.slice))
+
 
 class Detections:
     """Manages YOLOv5 detection results with methods for visualization, saving, cropping, and exporting detections."""
@@ -50,7 +50,7 @@ from models.yolo import Model
 from utils.autoanchor import check_anchors
 from utils.autobatch import check_train_batch_size
 from utils.callbacks import Callbacks
-from utils.dataloaders import create_dataloader
+from utils.dataloaders import DevicePrefetcher, create_dataloader
 from utils.downloads import attempt_download, is_url
 from utils.general import (
     LOGGER,
@@ -78,6 +78,7 @@ from utils.general import (
     strip_optimizer,
     yaml_save,
 )
+from utils.gpu_augmentations import GPUAugment
 from utils.loggers import LOGGERS, Loggers
 from utils.loggers.comet.comet_utils import check_comet_resume
 from utils.loss import ComputeLoss
@@ -282,13 +283,19 @@ def train(hyp, opt, device, callbacks):
         LOGGER.info("Using SyncBatchNorm()")
 
     # Trainloader
+    gpu_augment = None
+    if opt.gpu_augment:
+        if opt.rect or opt.quad:
+            LOGGER.warning("WARNING ⚠️ --gpu-augment is incompatible with --rect and --quad, disabling GPU augment")
+        else:
+            gpu_augment = GPUAugment(hyp, imgsz)  # workers only decode and letterbox, see GPUAugment.cpu_hyp()
     train_loader, dataset = create_dataloader(
         train_path,
         imgsz,
         batch_size // WORLD_SIZE,
         gs,
         single_cls,
-        hyp=hyp,
+        hyp=GPUAugment.cpu_hyp(hyp) if gpu_augment else hyp,
         augment=True,
         cache=None if opt.cache == "val" else opt.cache,
         rect=opt.rect,
@@ -300,6 +307,8 @@ def train(hyp, opt, device, callbacks):
         shuffle=True,
         seed=opt.seed,
     )
+    if opt.prefetch:
+        train_loader = DevicePrefetcher(train_loader, device)  # batches arrive on device as float32 0.0-1.0
     labels = np.concatenate(dataset.labels, 0)
     mlc = int(labels[:, 0].max())  # max label class
     assert mlc < nc, f"Label class {mlc} exceeds nc={nc} in {data}. Possible class labels are 0-{nc - 1}"
@@ -354,7 +363,7 @@ def train(hyp, opt, device, callbacks):
     scheduler.last_epoch = start_epoch - 1  # do not move
     scaler = torch.cuda.amp.GradScaler(enabled=amp)
     stopper, stop = EarlyStopping(patience=opt.patience), False
-    compute_loss = ComputeLoss(model)  # init loss class
+    compute_loss = ComputeLoss(model, fused=opt.fused_loss)  # init loss class
     callbacks.run("on_train_start")
     LOGGER.info(
         f'Image sizes {imgsz} train, {imgsz} val\n'
@@ -387,7 +396,10 @@ def train(hyp, opt, device, callbacks):
         for i, (imgs, targets, paths, _) in pbar:  # batch -------------------------------------------------------------
             callbacks.run("on_train_batch_start")
             ni = i + nb * epoch  # number integrated batches (since train start)
-            imgs = imgs.to(device, non_blocking=True).float() / 255  # uint8 to float32, 0-255 to 0.0-1.0
+            if gpu_augment:  # mosaic, perspective, mixup, HSV and flips on device, returns float32 0.0-1.0
+                imgs, targets = gpu_augment(imgs.to(device, non_blocking=True), targets.to(device))
+            elif not opt.prefetch:
+                imgs = imgs.to(device, non_blocking=True).float() / 255  # uint8 to float32, 0-255 to 0.0-1.0
 
             # Warmup
             if ni <= nw:
@@ -466,6 +478,7 @@ def train(hyp, opt, device, callbacks):
                     plots=False,
                     callbacks=callbacks,
                     compute_loss=compute_loss,
+                    prefetch=opt.prefetch,
                 )
 
             # Update best mAP
@@ -531,6 +544,7 @@ def train(hyp, opt, device, callbacks):
                         plots=plots,
                         callbacks=callbacks,
                         compute_loss=compute_loss,
+                        prefetch=opt.prefetch,
                     )  # val best model with plots
                     if is_coco:
                         callbacks.run("on_fit_epoch_end", list(mloss) + list(results) + lr, epoch, best_fitness, fi)
@@ -583,7 +597,7 @@ def parse_opt(known=False):
     )
     parser.add_argument("--resume_evolve", type=str, default=None, help="resume evolve from last generation")
     parser.add_argument("--bucket", type=str, default="", help="gsutil bucket")
-    parser.add_argument("--cache", type=str, nargs="?", const="ram", help="image --cache ram/disk")
+    parser.add_argument("--cache", type=str, nargs="?", const="ram", help="image --cache ram/disk/mmap")
     parser.add_argument("--image-weights", action="store_true", help="use weighted image selection for training")
     parser.add_argument("--device", default="", help="cuda device, i.e. 0 or 0,1,2,3 or cpu")
     parser.add_argument("--multi-scale", action="store_true", help="vary img-size +/- 50%%")
@@ -595,6 +609,9 @@ def parse_opt(known=False):
     parser.add_argument("--name", default="exp", help="save to project/name")
     parser.add_argument("--exist-ok", action="store_true", help="existing project/name ok, do not increment")
     parser.add_argument("--quad", action="store_true", help="quad dataloader")
+    parser.add_argument("--prefetch", action="store_true", help="copy and normalize next batch on device ahead of use")
+    parser.add_argument("--fused-loss", action="store_true", help="sparse fused loss without dense targets")
+    parser.add_argument("--gpu-augment", action="store_true", help="mosaic/perspective/HSV/flip augment on GPU batches")
     parser.add_argument("--cos-lr", action="store_true", help="cosine LR scheduler")
     parser.add_argument("--label-smoothing", type=float, default=0.0, help="Label smoothing epsilon")
     parser.add_argument("--patience", type=int, default=100, help="EarlyStopping patience (epochs without improvement)")
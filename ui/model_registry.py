@@ -0,0 +1,147 @@
+"""
+本地模型注册表：从本地权重加载 DetectMultiBackend + AutoShape，在后台线程中加载并预热，
+同一进程内的所有窗口和工作线程共享同一个模型实例，空闲或超出内存上限的模型会被释放。
+
+用法:
+    from model_registry import REGISTRY
+
+    REGISTRY.load("yolov5s.pt")  # 立即返回 Future，后台加载并预热
+    with REGISTRY.use("yolov5s.pt") as model:  # 阻塞直到模型就绪，使用期间不会被释放
+        results = model(rgb_image)
+"""
+
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+import torch
+
+FILE = Path(__file__).resolve()
+ROOT = FILE.parents[1]  # YOLOv5 根目录
+if str(ROOT) not in sys.path:
+    sys.path.append(str(ROOT))
+
+from models.common import AutoShape, DetectMultiBackend  # noqa: E402
+from utils.general import LOGGER  # noqa: E402
+from utils.torch_utils import select_device  # noqa: E402
+
+WEIGHTS = ROOT / "yolov5s.pt"  # 默认本地权重
+
+
+class ModelEntry:
+    """注册表中的一个模型：加载任务、引用计数、最近使用时间和估计内存占用"""
+
+    def __init__(self, future):
+        self.future = future
+        self.refs = 0  # 正在使用的线程数
+        self.last_used = time.time()
+        self.nbytes = 0
+
+
+class ModelRegistry:
+    """按 (权重, 设备) 缓存模型的注册表，线程安全"""
+
+    def __init__(self, max_models=2, max_bytes=None, idle_timeout=600, imgsz=640):
+        self.max_models = max_models  # 最多同时保留的模型数
+        self.max_bytes = max_bytes  # 模型总内存上限（字节），None 表示不限制
+        self.idle_timeout = idle_timeout  # 空闲多少秒后释放
+        self.imgsz = imgsz  # 预热尺寸
+        self.entries = {}
+        self.lock = threading.RLock()  # 加载完成回调可能在持有锁的线程中同步执行
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="model-loader")
+        threading.Thread(target=self._janitor, daemon=True).start()
+
+    def load(self, weights=WEIGHTS, device=""):
+        """返回模型加载的 Future，已加载或正在加载时直接复用"""
+        with self.lock:
+            return self._entry(weights, device).future
+
+    def get(self, weights=WEIGHTS, device="", timeout=None):
+        """阻塞直到模型就绪并返回模型"""
+        return self.load(weights, device).result(timeout)
+
+    @contextmanager
+    def use(self, weights=WEIGHTS, device=""):
+        """在 with 块内持有模型，期间不会被释放"""
+        with self.lock:
+            entry = self._entry(weights, device)
+            entry.refs += 1
+        try:
+            yield entry.future.result()
+        finally:
+            with self.lock:
+                entry.refs -= 1
+                entry.last_used = time.time()
+
+    def release(self, weights=WEIGHTS, device=""):
+        """手动释放模型"""
+        with self.lock:
+            self.entries.pop((str(weights), str(device)), None)
+        self._empty_cache()
+
+    def _entry(self, weights, device):
+        # 需在持有 self.lock 时调用
+        key = (str(weights), str(device))
+        entry = self.entries.get(key)
+        if entry is None:
+            entry = self.entries[key] = ModelEntry(self.executor.submit(self._load, weights, device))
+            entry.future.add_done_callback(lambda f: self._loaded(key, f))
+        entry.last_used = time.time()
+        return entry
+
+    def _load(self, weights, device):
+        t = time.time()
+        device = select_device(device)
+        model = AutoShape(DetectMultiBackend(weights, device=device, fuse=True)).to(device)
+        model(np.zeros((self.imgsz, self.imgsz, 3), dtype=np.uint8), size=self.imgsz)  # 预热
+        LOGGER.info(f"模型 {weights} 已加载并预热 ({time.time() - t:.1f}s)")
+        return model
+
+    def _loaded(self, key, future):
+        if future.exception() is not None:
+            LOGGER.warning(f"WARNING ⚠️ 模型 {key[0]} 加载失败: {future.exception()}")
+            with self.lock:
+                if self.entries.get(key) is not None and self.entries[key].future is future:
+                    del self.entries[key]  # 允许下次重新加载
+            return
+        model = future.result()
+        nbytes = sum(x.numel() * x.element_size() for x in [*model.parameters(), *model.buffers()])
+        with self.lock:
+            if key in self.entries:
+                self.entries[key].nbytes = nbytes or Path(key[0]).stat().st_size  # 非 PyTorch 后端按文件大小估计
+        self.evict()
+
+    def evict(self):
+        """释放超时空闲的模型，并按最近最少使用顺序释放超出数量或内存上限的模型（使用中的模型除外）"""
+        now = time.time()
+        with self.lock:
+            ready = [(k, e) for k, e in self.entries.items() if e.future.done() and e.refs == 0]
+            ready.sort(key=lambda x: x[1].last_used)
+            evicted = [k for k, e in ready if now - e.last_used > self.idle_timeout]
+            for k, e in ready:
+                n = len(self.entries) - len(evicted)
+                nbytes = sum(x.nbytes for key, x in self.entries.items() if key not in evicted)
+                if k not in evicted and (n > self.max_models or (self.max_bytes and nbytes > self.max_bytes)):
+                    evicted.append(k)
+            for k in evicted:
+                del self.entries[k]
+        if evicted:
+            LOGGER.info(f"释放模型: {', '.join(k[0] for k in evicted)}")
+            self._empty_cache()
+
+    def _janitor(self):
+        while True:
+            time.sleep(30)
+            self.evict()
+
+    @staticmethod
+    def _empty_cache():
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+
+REGISTRY = ModelRegistry()  # 进程内共享的默认注册表
@@ -1,16 +1,203 @@
 
-import torch
 import cv2
 from PyQt5 import QtWidgets, QtMultimedia, QtMultimediaWidgets
 from PyQt5.QtGui import QPixmap, QImage
 from PyQt5.QtWidgets import QFileDialog, QDialog, QLabel, QVBoxLayout, QMainWindow, QAction, QToolBar, QPushButton, \
     QComboBox, QSplitter, QWidget, QHBoxLayout, QSlider, QTableWidget, QTableWidgetItem, QTextEdit, QInputDialog, \
-    QGraphicsView, QGraphicsScene, QGraphicsPixmapItem, QMessageBox
-from PyQt5.QtCore import Qt, QSize, QUrl, QTimer, QDateTime
+    QGraphicsScene, QGraphicsPixmapItem, QMessageBox
+from PyQt5.QtCore import Qt, QSize, QUrl, QDateTime, QThread, pyqtSignal
 import sys
 import os
+import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from datetime import datetime
 
+from model_registry import REGISTRY, WEIGHTS
+from tiled_viewer import TiledImageView
+
+
+def to_qimage(rgb_image):
+    """将RGB numpy图像转换为QImage（深拷贝，可跨线程传递）"""
+    h, w, ch = rgb_image.shape
+    return QImage(rgb_image.data, w, h, ch * w, QImage.Format_RGB888).copy()
+
+
+class InferenceWorker(QThread):
+    """后台推理线程：只保留最新提交的任务，未处理的旧帧直接丢弃，结果通过信号发回界面线程"""
+    image_ready = pyqtSignal(object, str)  # 检测结果 (n, 6) xyxy/conf/cls, 图像路径
+    result_ready = pyqtSignal(object, int, float)  # 检测结果 (n, 6) xyxy/conf/cls, 帧序号, 推理耗时(秒)
+    model_ready = pyqtSignal()
+    error = pyqtSignal(str)
+
+    def __init__(self, registry=REGISTRY, weights=WEIGHTS, parent=None):
+        super(InferenceWorker, self).__init__(parent)
+        self.registry = registry  # 共享模型注册表，模型在后台加载预热
+        self.weights = weights
+        self.names = {}
+        self.condition = threading.Condition()
+        self.pending = None  # 最新待处理任务 (类型, 数据, 帧序号)
+        self.running = True
+        self.dropped = 0  # 被丢弃的过期帧数
+
+    def submit_image(self, file_path):
+        self._submit(("image", file_path, -1))
+
+    def submit_frame(self, rgb_frame, index):
+        self._submit(("frame", rgb_frame, index))
+
+    def _submit(self, job):
+        with self.condition:
+            if self.pending is not None:
+                self.dropped += 1
+            self.pending = job  # 覆盖尚未处理的旧任务
+            self.condition.notify()
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        self.wait()
+
+    def run(self):
+        # 等待模型加载和预热完成，期间提交的任务只保留最新一个；每 0.1 秒检查一次是否已停止，关闭窗口时不会卡住
+        future = self.registry.load(self.weights)
+        while True:
+            if not self.running:
+                return
+            try:
+                names = future.result(timeout=0.1).names
+                break
+            except FutureTimeoutError:
+                continue
+            except Exception as e:
+                self.error.emit(f"模型加载失败: {e}")
+                return
+        self.names = dict(enumerate(names)) if isinstance(names, (list, tuple)) else dict(names)
+        self.model_ready.emit()
+
+        while True:
+            with self.condition:
+                while self.running and self.pending is None:
+                    self.condition.wait()
+                if not self.running:
+                    return
+                kind, data, index = self.pending
+                self.pending = None
+            try:
+                with self.registry.use(self.weights) as model:  # 使用期间不会被注册表释放
+                    t = time.perf_counter()
+                    results = model(data)
+                    dt = time.perf_counter() - t
+                if kind == "image":
+                    self.image_ready.emit(results.xyxy[0].cpu().numpy(), data)
+                else:
+                    self.result_ready.emit(results.xyxy[0].cpu().numpy(), index, dt)
+            except Exception as e:
+                self.error.emit(f"推理失败: {e}")
+
+
+class VideoReader(QThread):
+    """后台视频解码线程：按视频帧率解码并叠加最新检测框，显示帧率与推理速度解耦"""
+    frame_ready = pyqtSignal(QImage, int, int)  # 帧图像, 当前帧, 总帧数
+    finished_playing = pyqtSignal()
+
+    def __init__(self, file_path, worker=None, parent=None):
+        super(VideoReader, self).__init__(parent)
+        self.cap = cv2.VideoCapture(file_path)
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 30
+        self.total_frames = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.worker = worker
+        self.detect = False  # 是否对视频帧进行检测
+        self.detections = None  # 最新检测结果
+        self.condition = threading.Condition()
+        self.playing = True
+        self.running = True
+        self.seek_to = None
+        self.index = 0  # 最近解码的帧序号
+        self.valid_from = 0  # 早于该帧（跳转或切换检测之前）提交的检测结果作废
+
+    def is_opened(self):
+        return self.cap.isOpened()
+
+    def play(self):
+        with self.condition:
+            self.playing = True
+            self.condition.notify()
+
+    def pause(self):
+        with self.condition:
+            self.playing = False
+
+    def set_position(self, position):
+        with self.condition:
+            self.seek_to = int((position / 100) * self.total_frames)
+            self.condition.notify()
+
+    def set_detect(self, detect):
+        self.detect = detect
+        self.detections = None
+        self.valid_from = self.index + 1
+
+    def set_detections(self, detections, index, dt):
+        # 丢弃跳转或切换检测前提交、推理较慢才返回的结果；向后跳转时旧结果的帧序号大于当前帧
+        if self.detect and self.valid_from <= index <= self.index:
+            self.detections = detections
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        self.wait()
+
+    def annotate(self, rgb_frame):
+        detections = self.detections
+        if detections is None:
+            return rgb_frame
+        rgb_frame = rgb_frame.copy()
+        for *xyxy, conf, cls in detections.tolist():
+            x1, y1, x2, y2 = map(int, xyxy)
+            label = f"{self.worker.names.get(int(cls), int(cls))} {conf:.2f}"
+            cv2.rectangle(rgb_frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
+            cv2.putText(rgb_frame, label, (x1, max(y1 - 5, 10)), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
+        return rgb_frame
+
+    def run(self):
+        next_time = time.perf_counter()
+        while True:
+            with self.condition:
+                while self.running and not self.playing and self.seek_to is None:
+                    self.condition.wait()
+                if not self.running:
+                    break
+                seek, self.seek_to = self.seek_to, None
+            if seek is not None:
+                self.cap.set(cv2.CAP_PROP_POS_FRAMES, seek)
+                self.detections = None  # 跳转后旧检测框失效
+                self.index, self.valid_from = seek, seek + 1
+                next_time = time.perf_counter()
+
+            ret, frame = self.cap.read()
+            if not ret:
+                # 视频播放完毕，等待跳转或停止
+                self.playing = False
+                self.finished_playing.emit()
+                continue
+            index = self.index = int(self.cap.get(cv2.CAP_PROP_POS_FRAMES))
+            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            if self.detect and self.worker:
+                self.worker.submit_frame(rgb_frame, index)  # 推理线程只处理最新帧
+            self.frame_ready.emit(to_qimage(self.annotate(rgb_frame)), index, self.total_frames)
+
+            # 按视频帧率节流，解码落后时不追帧
+            next_time += 1 / self.fps
+            delay = next_time - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_time = time.perf_counter()
+        self.cap.release()
+
 class AlgorithmInterface(QtWidgets.QWidget):
     def __init__(self, parent=None):
         super(AlgorithmInterface, self).__init__(parent)
@@ -150,6 +337,7 @@ class MainWindow(QMainWindow):
 
         # 初始化视频播放器相关组件
         self.video_slider = None
+        self.video_reader = None
 
         # 创建菜单栏、工具栏和布局
         self.create_menu_bar()
@@ -173,35 +361,56 @@ class MainWindow(QMainWindow):
     #     except Exception as e:
     #         error_message = f"Error running Yolo algorithm: {e}"
     #         return error_message  # 返回错误信息
-        # 加载YOLOv5模型
-        # 确保您的设备支持CUDA
-        device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-
-        # 加载模型
-        self.model = torch.hub.load('ultralytics/yolov5', 'yolov5s', pretrained=True).to(device)
-
+        # 从本地权重在后台加载并预热YOLOv5模型，界面立即显示；设备自动选择（优先CUDA）
+        REGISTRY.load(WEIGHTS)
+        self.statusBar().showMessage("模型加载中...")
+
+        # 后台推理线程，避免阻塞界面
+        self.worker = InferenceWorker(REGISTRY, WEIGHTS)
+        self.worker.model_ready.connect(lambda: self.statusBar().showMessage("模型已就绪"))
+        self.worker.image_ready.connect(self.show_annotated_image)
+        self.worker.result_ready.connect(self.on_video_detections)
+        self.worker.error.connect(self.statusBar().showMessage)
+        self.worker.start()
 
     def run_yolo_and_display(self):
+        # 视频模式下开启逐帧检测
+        if self.video_reader is not None:
+            self.detect_button.setChecked(True)
+            return
 
         current_image_path = self.get_current_image_path()
         if not current_image_path:
             QtWidgets.QMessageBox.information(self, "提示", "请先选择一个图像文件。")
             return
 
-
-        # 使用YOLOv5进行图像推理
-
-        results = self.model(current_image_path)
-
-        # 将检测结果绘制到图片上
-        annotated_image = results.render()[0]
-        annotated_pixmap = self.convert_cv_qt(annotated_image)
-
-        # 显示标注后的图片
-        scene = QGraphicsScene()  # 创建一个新的场景
-        pixmap_item = QGraphicsPixmapItem(annotated_pixmap)  # 创建一个QGraphicsPixmapItem对象
-        scene.addItem(pixmap_item)  # 将图像项添加到场景中
-        self.image_view.setScene(scene)  # 将场景设置到QGraphicsView
+        # 提交到后台线程进行YOLOv5推理，结果通过 image_ready 信号返回
+        self.worker.submit_image(current_image_path)
+        self.statusBar().showMessage("推理中...")
+
+    def show_annotated_image(self, detections, file_path):
+        # 检测框以场景项叠加在分块图像上；切换图像后返回的旧结果直接丢弃
+        if self.video_reader is None and file_path == self.get_current_image_path():
+            self.image_view.set_detections(detections, self.worker.names)
+            self.statusBar().showMessage(f"推理完成，检测到 {len(detections)} 个目标")
+
+    def on_video_detections(self, detections, index, dt):
+        if self.video_reader is not None:
+            self.video_reader.set_detections(detections, index, dt)
+            self.statusBar().showMessage(f"推理 {dt * 1000:.0f} ms/帧，丢弃 {self.worker.dropped} 帧")
+
+    def show_pixmap(self, pixmap):
+        # 复用同一个场景和图像项，避免每帧创建新的 QGraphicsScene
+        if self.image_view.scene() is not self.scene:
+            self.image_view.setScene(self.scene)
+            self.image_view.resetTransform()  # 清除分块浏览器的缩放
+        self.pixmap_item.setPixmap(pixmap)
+        self.scene.setSceneRect(self.pixmap_item.boundingRect())
+
+    def closeEvent(self, event):
+        self.stop_video()
+        self.worker.stop()
+        super(MainWindow, self).closeEvent(event)
 
     def convert_cv_qt(self, cv_img):
         """将OpenCV图像转换为QPixmap"""
@@ -219,34 +428,6 @@ class MainWindow(QMainWindow):
 
 
 
-    def display_image_and_info(self, file_path):
-        # 显示图片
-        pixmap = QPixmap(file_path)
-        scene = QGraphicsScene()
-        scene.addPixmap(pixmap)  # 将 QPixmap 添加到场景中
-        self.image_view.setScene(scene)  # 设置 QGraphicsView 的场景
-
-        # 更新图像信息展示
-        file_info = os.path.basename(file_path)
-        file_size = pixmap.size()
-        file_type = os.path.splitext(file_info)[-1].upper()
-        load_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-        info_text = (
-            f"加载路径：{file_path}\n"
-            f"文件名：{file_info}\n"
-            f"图像大小：{file_size.width()} x {file_size.height()} pixels\n"
-            f"图像类型：{file_type}\n"
-            f"加载日期：{load_date}"
-        )
-        self.image_info_display.setText(info_text)
-
-        # 调整 QGraphicsView 以适应场景大小
-        self.image_view.setFixedSize(pixmap.size())
-        self.image_view.setDragMode(QGraphicsView.ScrollHandDrag)  # 允许拖动查看大图
-
-
-
     def save_file(self):
         # 打开保存文件对话框
         options = QFileDialog.Options()
@@ -326,9 +507,12 @@ class MainWindow(QMainWindow):
 
 
         # 图像显示区域使用 QGraphicsView
-        self.image_view = QGraphicsView()
-        self.image_view.setDragMode(QGraphicsView.ScrollHandDrag)  # 允许拖动查看大图
+        self.image_view = TiledImageView()  # 分块金字塔浏览器，只解码可见图块，滚轮缩放、拖动平移
         self.layout.addWidget(self.image_view)
+        self.scene = QGraphicsScene()
+        self.pixmap_item = QGraphicsPixmapItem()
+        self.scene.addItem(self.pixmap_item)
+        self.image_view.setScene(self.scene)
 
         # 图像信息展示区域
         self.image_info_display = QLabel("图像信息区域")
@@ -390,14 +574,11 @@ class MainWindow(QMainWindow):
         # 清空旧按钮
         self.clear_buttons()
 
-        # 如果有之前的视频播放任务，先释放资源
-        if hasattr(self, "video_cap") and self.video_cap is not None:
-            self.video_cap.release()
-
-        # 初始化 OpenCV VideoCapture
-        self.video_cap = cv2.VideoCapture(file_path)
-        if not self.video_cap.isOpened():
+        # 在后台线程中解码视频
+        self.video_reader = VideoReader(file_path, self.worker)
+        if not self.video_reader.is_opened():
             print("无法打开视频文件")
+            self.video_reader = None
             return
 
         # 创建视频控制按钮
@@ -409,16 +590,21 @@ class MainWindow(QMainWindow):
         self.pause_button.clicked.connect(self.pause_video)
         self.button_layout.addWidget(self.pause_button)
 
+        self.detect_button = QPushButton("检测")
+        self.detect_button.setCheckable(True)
+        self.detect_button.toggled.connect(self.toggle_video_detection)
+        self.button_layout.addWidget(self.detect_button)
+
         # 创建进度条
         self.video_slider = QSlider(Qt.Horizontal)
         self.video_slider.setRange(0, 100)
         self.video_slider.sliderMoved.connect(self.set_video_position)
         self.layout.addWidget(self.video_slider)
 
-        # 创建 QTimer 用于定时更新帧
-        self.timer = QTimer(self)
-        self.timer.start(30)
-        self.timer.timeout.connect(self.update_video_frame)
+        # 解码线程通过信号发送帧，界面线程只负责显示
+        self.video_reader.frame_ready.connect(self.update_video_frame)
+        self.video_reader.finished_playing.connect(self.on_video_finished)
+        self.video_reader.start()
 
         # 启用滑动条
         self.video_slider.setEnabled(True)
@@ -430,8 +616,15 @@ class MainWindow(QMainWindow):
         # 隐藏按钮
         self.clear_buttons()
 
+    def stop_video(self):
+        # 停止视频解码线程并释放资源
+        if self.video_reader is not None:
+            self.video_reader.stop()
+            self.video_reader = None
+
     def clear_buttons(self):
         # 清空按钮布局中的所有组件
+        self.stop_video()
         for i in reversed(range(self.button_layout.count())):
             self.button_layout.itemAt(i).widget().deleteLater()
         if hasattr(self, "video_slider") and self.video_slider:
@@ -467,45 +660,36 @@ class MainWindow(QMainWindow):
         )
 
     def play_video(self):
-        if self.video_cap:
-            self.timer.start(30)  # 每 30 毫秒更新一帧
+        if self.video_reader:
+            self.video_reader.play()
 
     def pause_video(self):
-        if self.video_cap:
-            self.timer.stop()
-
-
-    def update_video_frame(self):
-        if self.video_cap:
-            ret, frame = self.video_cap.read()
-            if ret:
-                # 转换为 RGB 格式
-                rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                height, width, channel = rgb_frame.shape
-                qimage = QImage(rgb_frame.data, width, height, QImage.Format_RGB888)
-
-                # 创建 QGraphicsScene 和 QGraphicsPixmapItem
-                scene = QGraphicsScene()
-                pixmap_item = QGraphicsPixmapItem(QPixmap.fromImage(qimage))
-                scene.addItem(pixmap_item)  # 将 QGraphicsPixmapItem 添加到场景中
-
-                # 将场景设置到 QGraphicsView
-                self.image_view.setScene(scene)
-
-                # 更新滑动条位置
-                current_frame = self.video_cap.get(cv2.CAP_PROP_POS_FRAMES)
-                total_frames = self.video_cap.get(cv2.CAP_PROP_FRAME_COUNT)
-                if total_frames > 0:
-                    self.video_slider.setValue(int((current_frame / total_frames) * 100))
-            else:
-                # 视频播放完毕，停止定时器
-                self.timer.stop()
+        if self.video_reader:
+            self.video_reader.pause()
+
+    def toggle_video_detection(self, checked):
+        if self.video_reader:
+            self.video_reader.set_detect(checked)
+
+    def update_video_frame(self, qimage, current_frame, total_frames):
+        # 忽略已停止的解码线程残留在事件队列中的帧
+        if self.sender() is not self.video_reader:
+            return
+
+        # 复用场景中的图像项显示解码线程发来的帧
+        self.show_pixmap(QPixmap.fromImage(qimage))
+
+        # 更新滑动条位置
+        if self.video_slider and total_frames > 0 and not self.video_slider.isSliderDown():
+            self.video_slider.setValue(int((current_frame / total_frames) * 100))
+
+    def on_video_finished(self):
+        if self.sender() is self.video_reader:
+            self.statusBar().showMessage("视频播放完毕")
 
     def set_video_position(self, position):
-        if self.video_cap:
-            total_frames = self.video_cap.get(cv2.CAP_PROP_FRAME_COUNT)
-            target_frame = (position / 100) * total_frames
-            self.video_cap.set(cv2.CAP_PROP_POS_FRAMES, target_frame)
+        if self.video_reader:
+            self.video_reader.set_position(position)
 
     def display_video_info(self, file_path):
         # 获取视频文件的基础信息
@@ -546,13 +730,15 @@ class MainWindow(QMainWindow):
             self.display_image_and_info(self.image_list[self.current_index])  # 显示第一个图像
 
     def display_image_and_info(self, file_path):
-        pixmap = QPixmap(file_path)
-        scene = QGraphicsScene()
-        scene.addPixmap(pixmap)
-        self.image_view.setScene(scene)
+        # 分块显示图像，只读取文件头获取尺寸，可见图块在后台解码
+        file_size = self.image_view.open_image(file_path)
+
+        # 后台预取相邻图像
+        i = self.current_index
+        neighbours = [self.image_list[j] for j in (i - 1, i + 1) if 0 <= j < len(self.image_list)]
+        self.image_view.prefetch(*neighbours)
 
         file_info = os.path.basename(file_path)
-        file_size = pixmap.size()
         file_type = os.path.splitext(file_info)[-1].upper()
         load_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
@@ -565,8 +751,6 @@ class MainWindow(QMainWindow):
         )
         self.image_info_display.setText(info_text)
 
-        self.image_view.setFixedSize(pixmap.size())
-        self.image_view.setDragMode(QGraphicsView.ScrollHandDrag)
     def show_previous_image(self):
         if self.current_index > 0:
             self.current_index -= 1
@@ -1,10 +1,8 @@
 from PySide6 import QtWidgets, QtCore, QtGui
-import cv2, os, time
+import cv2, time
 from threading import Thread
 
-# 不然每次YOLO处理都会输出调试信息
-os.environ['YOLO_VERBOSE'] = 'False'
-from ultralytics import YOLO
+from model_registry import REGISTRY
 
 class MWindow(QtWidgets.QMainWindow):
 
@@ -23,8 +21,8 @@ class MWindow(QtWidgets.QMainWindow):
         # 定时到了，回调 self.show_camera
         self.timer_camera.timeout.connect(self.show_camera)
 
-        # 加载 YOLO nano 模型，第一次比较耗时，要20秒左右
-        self.model = YOLO('yolov8n.pt')
+        # 在后台从本地权重加载并预热模型，界面立即显示
+        REGISTRY.load()
 
         # 要处理的视频帧图片队列，目前就放1帧图片
         self.frameToAnalyze = []
@@ -121,9 +119,10 @@ class MWindow(QtWidgets.QMainWindow):
 
             frame = self.frameToAnalyze.pop(0)
 
-            results = self.model(frame)[0]
+            with REGISTRY.use() as model:  # 模型就绪前阻塞在此后台线程
+                results = model(frame)
 
-            img = results.plot(line_width=1)
+            img = results.render()[0]
 
             qImage = QtGui.QImage(img.data, img.shape[1], img.shape[0],
                                     QtGui.QImage.Format_RGB888)  # 变成QImage形式
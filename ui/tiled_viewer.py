@@ -0,0 +1,345 @@
+"""
+分块金字塔图像浏览器：只在后台解码当前缩放级别下可见的图块，图块按字节数做 LRU 缓存，
+检测框作为轻量场景项绘制，并可在后台预取相邻图像，适合数千万像素的航拍 / xView 大图。
+
+金字塔第 level 级为原图缩小 2**level 倍，每级切成 TILE x TILE 的图块；最粗一级始终显示在底层，
+放大后精细图块加载完成前用它占位。
+
+解码时的峰值内存取决于格式：
+- 支持 ClipRect 的格式（如 JPEG）按块直接解码，约为一个图块；
+- PIL 可逐块读取的分块 / 分条 TIFF 只解码与图块相交的块或条，粗级别由下一级 2x2 子图块缩小拼成，
+  约为一个图块加与其相交的存储块；
+- 其他格式（PNG、压缩 TIFF 等）无法按区域解码，每级整体解码一次，峰值为该级整图（第 0 级即原图）。
+  整级不超过缓存一半时全部图块放入缓存，否则只放入仍需显示的图块，且这些图块最后放入，不会被同批挤出。
+"""
+
+import math
+import threading
+from collections import OrderedDict
+
+from PyQt5.QtCore import QObject, QPoint, QRect, QRectF, QRunnable, QSize, Qt, QThreadPool, pyqtSignal
+from PyQt5.QtGui import QColor, QImage, QImageIOHandler, QImageReader, QPainter, QPen, QPixmap
+from PyQt5.QtWidgets import (
+    QGraphicsItem,
+    QGraphicsPixmapItem,
+    QGraphicsRectItem,
+    QGraphicsScene,
+    QGraphicsSimpleTextItem,
+    QGraphicsView,
+)
+
+TILE = 512  # 图块边长（像素）
+
+
+class TileSource:
+    """单张图像的图块解码器，只读取文件头获取尺寸"""
+
+    def __init__(self, path, tile=TILE):
+        self.path = path
+        self.tile = tile
+        reader = QImageReader(path)
+        self.size = reader.size()
+        self.clip = reader.supportsOption(QImageIOHandler.ClipRect)  # 是否支持按区域解码
+        self.region = not self.clip and self.pil_tiled()  # 是否可由 PIL 只解码相交的 TIFF 块 / 条
+        self.levels = max(math.ceil(math.log2(max(self.size.width(), self.size.height(), 1) / tile)), 0) + 1
+        self.lock = threading.Lock()  # 整级解码时串行，避免同一级重复解码
+
+    def pil_tiled(self):
+        """判断是否为 PIL 能逐块解码的分块 / 分条 TIFF（压缩 TIFF 由 libtiff 整图解码，不满足）"""
+        try:
+            from PIL import Image
+
+            with Image.open(self.path) as im:
+                return im.format == "TIFF" and len(im.tile) > 1 and im.mode in ("L", "RGB", "RGBA")
+        except Exception:  # 未安装 PIL 或无法识别时退回整级解码
+            return False
+
+    def level_size(self, level):
+        s = 2**level
+        return math.ceil(self.size.width() / s), math.ceil(self.size.height() / s)
+
+    def grid(self, level):
+        w, h = self.level_size(level)
+        return math.ceil(w / self.tile), math.ceil(h / self.tile)
+
+    def read_region(self, rect):
+        """用 PIL 只解码与原图区域 rect 相交的 TIFF 块 / 条，并只为这些块分配画布"""
+        from PIL import Image
+
+        x0, y0, x1, y1 = rect.left(), rect.top(), rect.right() + 1, rect.bottom() + 1
+        with Image.open(self.path) as im:
+            tiles = [t for t in im.tile if t[1][0] < x1 and t[1][2] > x0 and t[1][1] < y1 and t[1][3] > y0]
+            bx, by = min(t[1][0] for t in tiles), min(t[1][1] for t in tiles)
+            im.tile = [(t[0], (t[1][0] - bx, t[1][1] - by, t[1][2] - bx, t[1][3] - by), *t[2:]) for t in tiles]
+            im._size = (max(t[1][2] for t in tiles) - bx, max(t[1][3] for t in tiles) - by)
+            im = im.crop((x0 - bx, y0 - by, x1 - bx, y1 - by)).convert("RGBA")
+        return QImage(im.tobytes(), im.width, im.height, 4 * im.width, QImage.Format_RGBA8888).copy()
+
+    def compose(self, level, tx, ty, size, cache=None):
+        """由下一级的 2x2 子图块缩小拼成本级图块，子图块优先取自缓存"""
+        image = QImage(size, QImage.Format_ARGB32)
+        image.fill(Qt.black)
+        painter = QPainter(image)
+        painter.setRenderHint(QPainter.SmoothPixmapTransform)
+        nx, ny = self.grid(level - 1)
+        half = self.tile / 2
+        for cx in range(2 * tx, min(2 * tx + 2, nx)):
+            for cy in range(2 * ty, min(2 * ty + 2, ny)):
+                key = (self.path, level - 1, cx, cy)
+                child = cache.get(key) if cache is not None else None
+                if child is None:
+                    child = self.read_tile(level - 1, cx, cy, cache)
+                    if cache is not None:
+                        cache.put(key, child)
+                target = QRectF((cx - 2 * tx) * half, (cy - 2 * ty) * half, child.width() / 2, child.height() / 2)
+                painter.drawImage(target, child)
+        painter.end()
+        return image
+
+    def read_tile(self, level, tx, ty, cache=None, wanted=None):
+        s = 2**level
+        w, h = self.level_size(level)
+        x, y = tx * self.tile, ty * self.tile
+        rect = QRect(x, y, min(self.tile, w - x), min(self.tile, h - y))  # 该级别中的图块区域
+        src = QRect(rect.x() * s, rect.y() * s, rect.width() * s, rect.height() * s).intersected(
+            QRect(QPoint(0, 0), self.size))  # 对应的原图区域
+        if self.clip:
+            reader = QImageReader(self.path)
+            reader.setClipRect(src)
+            reader.setScaledSize(rect.size())
+            return reader.read()
+        if self.region:
+            return self.compose(level, tx, ty, rect.size(), cache) if level else self.read_region(src)
+        with self.lock:
+            key = (self.path, level, tx, ty)
+            image = cache.get(key) if cache is not None else None
+            if image is not None:  # 等锁期间已由同一级的整级解码放入缓存
+                return image
+            reader = QImageReader(self.path)
+            if level:
+                reader.setScaledSize(QSize(w, h))
+            full = reader.read()
+            if cache is not None:  # 整级超过缓存一半时只放入仍需显示的图块；需显示的最后放入，请求的图块由调用方放入
+                nx, ny = self.grid(level)
+                keys = [(self.path, level, i, j) for i in range(nx) for j in range(ny) if (i, j) != (tx, ty)]
+                keep = {k for k in keys if wanted is not None and wanted(k)}
+                rest = [k for k in keys if k not in keep] if full.sizeInBytes() <= cache.max_bytes // 2 else []
+                for k in rest + list(keep):
+                    r = QRect(k[2] * self.tile, k[3] * self.tile, self.tile, self.tile).intersected(full.rect())
+                    cache.put(k, full.copy(r))
+            return full.copy(rect)
+
+
+class TileCache:
+    """按字节数限制的线程安全 LRU 图块缓存"""
+
+    def __init__(self, max_bytes=256 * 1024**2):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.tiles = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            image = self.tiles.get(key)
+            if image is not None:
+                self.tiles.move_to_end(key)
+            return image
+
+    def put(self, key, image):
+        with self.lock:
+            if key in self.tiles:
+                return
+            self.tiles[key] = image
+            self.nbytes += image.sizeInBytes()
+            while self.nbytes > self.max_bytes and len(self.tiles) > 1:
+                self.nbytes -= self.tiles.popitem(last=False)[1].sizeInBytes()
+
+
+class TileSignals(QObject):
+    loaded = pyqtSignal(object, QImage, bool)  # 图块键 (路径, 级别, tx, ty), 图像, 是否因过期跳过
+
+
+class TileJob(QRunnable):
+    """线程池中解码一个图块；wanted 返回 False 时跳过已过期的请求"""
+
+    def __init__(self, source, key, cache, signals=None, wanted=None):
+        super(TileJob, self).__init__()
+        self.source = source
+        self.key = key
+        self.cache = cache
+        self.signals = signals
+        self.wanted = wanted
+
+    def run(self):
+        image = self.cache.get(self.key)
+        skipped = image is None and self.wanted is not None and not self.wanted(self.key)
+        if image is None and not skipped:
+            _, level, tx, ty = self.key
+            image = self.source.read_tile(level, tx, ty, self.cache, self.wanted)
+            if not image.isNull():
+                self.cache.put(self.key, image)
+        if self.signals is not None:
+            self.signals.loaded.emit(self.key, image if image is not None else QImage(), skipped)
+
+
+class TiledImageView(QGraphicsView):
+    """分块金字塔图像浏览器，滚轮缩放、拖动平移"""
+
+    def __init__(self, parent=None, tile=TILE, cache_bytes=256 * 1024**2, threads=4, max_sources=8):
+        super(TiledImageView, self).__init__(parent)
+        self.tile = tile
+        self.cache = TileCache(cache_bytes)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(threads)
+        self.signals = TileSignals()
+        self.signals.loaded.connect(self.tile_loaded)
+        self.tile_scene = QGraphicsScene(self)
+        self.sources = OrderedDict()  # 最近使用的图像 路径 -> TileSource
+        self.max_sources = max_sources
+        self.source = None
+        self.items = {}  # 已显示的图块 键 -> QGraphicsPixmapItem
+        self.wanted = set()  # 当前需要但尚未加载的图块
+        self.inflight = set()  # 已提交到线程池的图块
+        self.box_items = []
+        self.setTransformationAnchor(QGraphicsView.AnchorUnderMouse)
+        self.setDragMode(QGraphicsView.ScrollHandDrag)  # 允许拖动查看大图
+
+    def get_source(self, path):
+        source = self.sources.pop(path, None) or TileSource(path, self.tile)
+        self.sources[path] = source
+        while len(self.sources) > self.max_sources:
+            self.sources.popitem(last=False)
+        return source
+
+    def fit_scale(self, source):
+        # 适应窗口的缩放比例，小图不放大
+        w, h = max(source.size.width(), 1), max(source.size.height(), 1)
+        return min(self.viewport().width() / w, self.viewport().height() / h, 1.0)
+
+    def level_for(self, source, scale):
+        return min(max(int(math.floor(math.log2(1 / scale))), 0) if scale > 0 else 0, source.levels - 1)
+
+    def open_image(self, path):
+        """显示图像（只读取文件头），返回原图尺寸 QSize"""
+        self.source = self.get_source(path)
+        self.tile_scene.clear()
+        self.items.clear()
+        self.box_items = []
+        self.wanted = set()
+        self.tile_scene.setSceneRect(0, 0, self.source.size.width(), self.source.size.height())
+        if self.scene() is not self.tile_scene:
+            self.setScene(self.tile_scene)
+        self.resetTransform()
+        scale = self.fit_scale(self.source)
+        self.scale(scale, scale)
+        self.update_tiles()
+        return self.source.size
+
+    def tile_keys(self, source, level, rect=None):
+        nx, ny = source.grid(level)
+        x0, y0, x1, y1 = 0, 0, nx - 1, ny - 1
+        if rect is not None:
+            t = self.tile * 2**level  # 图块在原图中的边长
+            x0, y0 = max(int(rect.left() // t), 0), max(int(rect.top() // t), 0)
+            x1, y1 = min(int(rect.right() // t), nx - 1), min(int(rect.bottom() // t), ny - 1)
+        return {(source.path, level, tx, ty) for tx in range(x0, x1 + 1) for ty in range(y0, y1 + 1)}
+
+    def update_tiles(self):
+        """按当前缩放级别和可见区域增删图块，缺失的图块提交到后台线程解码"""
+        if self.source is None or self.scene() is not self.tile_scene:
+            return
+        level = self.level_for(self.source, self.transform().m11())
+        rect = self.mapToScene(self.viewport().rect()).boundingRect().intersected(self.tile_scene.sceneRect())
+        keys = self.tile_keys(self.source, level, rect) | self.tile_keys(self.source, self.source.levels - 1)
+
+        # 移除不可见或其他级别的图块（最粗一级始终保留作为占位）
+        for key in list(self.items):
+            if key not in keys:
+                self.tile_scene.removeItem(self.items.pop(key))
+
+        self.wanted = set()
+        for key in sorted(keys, key=lambda k: -k[1]):  # 先加载粗级别
+            if key in self.items:
+                continue
+            image = self.cache.get(key)
+            if image is not None:
+                self.add_tile(key, image)
+                continue
+            self.wanted.add(key)
+            if key not in self.inflight:
+                self.submit(key)
+
+    def submit(self, key):
+        self.inflight.add(key)
+        wanted = lambda k: k in self.wanted  # noqa: E731 滚动/缩放后过期的请求不再解码
+        self.pool.start(TileJob(self.source, key, self.cache, self.signals, wanted), 1)
+
+    def tile_loaded(self, key, image, skipped):
+        self.inflight.discard(key)
+        if key not in self.wanted or key in self.items:
+            return
+        if skipped:  # 任务执行时已过期，但之后又重新需要该图块
+            self.submit(key)
+        elif not image.isNull():
+            self.wanted.discard(key)
+            self.add_tile(key, image)
+
+    def add_tile(self, key, image):
+        _, level, tx, ty = key
+        s = 2**level
+        item = QGraphicsPixmapItem(QPixmap.fromImage(image))
+        item.setTransformationMode(Qt.SmoothTransformation)
+        item.setPos(tx * self.tile * s, ty * self.tile * s)
+        item.setScale(s)
+        item.setZValue(-level)  # 精细级别显示在上层
+        self.tile_scene.addItem(item)
+        self.items[key] = item
+
+    def set_detections(self, detections, names=None):
+        """以场景项绘制 (n, 6) xyxy/conf/cls 检测框，线宽和文字大小不随缩放变化"""
+        for item in self.box_items:
+            self.tile_scene.removeItem(item)
+        self.box_items = []
+        names = names or {}
+        pen = QPen(QColor(0, 255, 0), 2)
+        pen.setCosmetic(True)
+        for *xyxy, conf, cls in detections.tolist():
+            x1, y1, x2, y2 = xyxy
+            box = QGraphicsRectItem(QRectF(x1, y1, x2 - x1, y2 - y1))
+            box.setPen(pen)
+            box.setZValue(1)
+            label = QGraphicsSimpleTextItem(f"{names.get(int(cls), int(cls))} {conf:.2f}", box)
+            label.setBrush(QColor(0, 255, 0))
+            label.setPos(x1, y1)
+            label.setFlag(QGraphicsItem.ItemIgnoresTransformations)
+            self.tile_scene.addItem(box)
+            self.box_items.append(box)
+
+    def prefetch(self, *paths):
+        """在后台以低优先级预取相邻图像在适应窗口级别及最粗级别的图块"""
+        for path in paths:
+            if not path:
+                continue
+            source = self.get_source(path)
+            level = self.level_for(source, self.fit_scale(source))
+            for key in self.tile_keys(source, level) | self.tile_keys(source, source.levels - 1):
+                if self.cache.get(key) is None:
+                    self.pool.start(TileJob(source, key, self.cache), 0)
+        if self.source is not None:
+            self.sources.move_to_end(self.source.path)  # 当前图像保持最近使用
+
+    def scrollContentsBy(self, dx, dy):
+        super(TiledImageView, self).scrollContentsBy(dx, dy)
+        self.update_tiles()
+
+    def resizeEvent(self, event):
+        super(TiledImageView, self).resizeEvent(event)
+        self.update_tiles()
+
+    def wheelEvent(self, event):
+        if self.scene() is not self.tile_scene:
+            return super(TiledImageView, self).wheelEvent(event)
+        factor = 1.25 if event.angleDelta().y() > 0 else 0.8
+        self.scale(factor, factor)
+        self.update_tiles()
@@ -7,10 +7,11 @@ import random
 import cv2
 import numpy as np
 import torch
+import torch.nn.functional as F
 import torchvision.transforms as T
 import torchvision.transforms.functional as TF
 
-from utils.general import LOGGER, check_version, colorstr, resample_segments, segment2box, xywhn2xyxy
+from utils.general import LOGGER, Profile, check_version, colorstr, resample_segments, segment2box, xywhn2xyxy
 from utils.metrics import bbox_ioa
 
 IMAGENET_MEAN = 0.485, 0.456, 0.406  # RGB mean
@@ -152,6 +153,111 @@ def letterbox(im, new_shape=(640, 640), color=(114, 114, 114), auto=True, scaleF
     return im, ratio, (dw, dh)
 
 
+def letterbox_params(shape, new_shape=(640, 640), auto=True, scaleup=True, stride=32):
+    """Returns letterbox() ratio, resized (w, h), (top, bottom, left, right) borders and (dw, dh) for an image shape."""
+    if isinstance(new_shape, int):
+        new_shape = (new_shape, new_shape)
+    r = min(new_shape[0] / shape[0], new_shape[1] / shape[1])  # scale ratio (new / old)
+    if not scaleup:  # only scale down, do not scale up (for better val mAP)
+        r = min(r, 1.0)
+    w, h = int(round(shape[1] * r)), int(round(shape[0] * r))
+    dw, dh = new_shape[1] - w, new_shape[0] - h  # wh padding
+    if auto:  # minimum rectangle
+        dw, dh = np.mod(dw, stride), np.mod(dh, stride)  # wh padding
+    dw /= 2  # divide padding into 2 sides
+    dh /= 2
+    top, bottom = int(round(dh - 0.1)), int(round(dh + 0.1))
+    left, right = int(round(dw - 0.1)), int(round(dw + 0.1))
+    return r, (w, h), (top, bottom, left, right), (dw, dh)
+
+
+def preprocess(
+    im,
+    new_shape=(640, 640),
+    color=(114, 114, 114),
+    auto=True,
+    scaleup=True,
+    stride=32,
+    out=None,  # CHW output buffer, i.e. batch[i]
+    normalize=False,  # 0 - 255 to 0.0 - 1.0
+    swap_rb=True,  # BGR to RGB
+):
+    """
+    Letterboxes an HWC image straight into a CHW buffer, fusing resize, padding, BGR to RGB, HWC to CHW and /255.
+
+    Equivalent to `letterbox()` followed by `.transpose((2, 0, 1))[::-1]`, `np.ascontiguousarray()` and optional
+    normalization, but with a single resize allocation. The result is written into `out` when given, i.e. a slice of
+    a preallocated batch buffer. A torch `im` (HWC, on any device) is resized on its device with F.interpolate().
+
+    Returns (out, ratio, (dw, dh)) like letterbox().
+    """
+    shape = im.shape[:2]  # current shape [height, width]
+    r, (w, h), (top, bottom, left, right), (dw, dh) = letterbox_params(shape, new_shape, auto, scaleup, stride)
+    hs, ws = h + top + bottom, w + left + right  # output shape
+
+    tensor = isinstance(im, torch.Tensor)
+    if out is None:
+        if tensor:
+            out = torch.empty((3, hs, ws), dtype=torch.float32 if normalize else im.dtype, device=im.device)
+        else:
+            out = np.empty((3, hs, ws), dtype=np.float32 if normalize else im.dtype)
+    assert tuple(out.shape) == (3, hs, ws), f"preprocess() out shape {tuple(out.shape)} != {(3, hs, ws)}"
+
+    # Padding strips
+    c = (color[::-1] if swap_rb else color)[:3]
+    for i in range(3):
+        v = c[i] / 255 if normalize else c[i]
+        out[i, :top], out[i, top + h :], out[i, top : top + h, :left], out[i, top : top + h, left + w :] = v, v, v, v
+
+    # Resized image
+    dst = out[:, top : top + h, left : left + w]
+    if tensor:
+        x = im.permute(2, 0, 1)[None].float()  # HWC to BCHW
+        if (h, w) != tuple(shape):  # resize
+            x = F.interpolate(x, size=(h, w), mode="bilinear", align_corners=False)
+            x = x if normalize or dst.is_floating_point() else x.round().clamp(0, 255)
+        x = x[0].flip(0) if swap_rb else x[0]  # BGR to RGB
+        dst.copy_(x / 255 if normalize else x)
+    else:
+        if (h, w) != shape:  # resize
+            im = cv2.resize(im, (w, h), interpolation=cv2.INTER_LINEAR)
+        x = im.transpose((2, 0, 1))[:3]  # HWC to CHW view
+        x = x[::-1] if swap_rb else x  # BGR to RGB view
+        if normalize:
+            np.divide(x, 255, out=dst, dtype=dst.dtype, casting="unsafe")  # 0 - 255 to 0.0 - 1.0
+        else:
+            dst[...] = x
+    return out, (r, r), (dw, dh)
+
+
+def profile_preprocess(sizes=(640, 1280), shape=(1080, 1920), n=100):
+    """
+    Profiles preprocess() against letterbox() + transpose + ascontiguousarray + from_numpy().float() / 255 per frame.
+
+    Usage:
+        from utils.augmentations import profile_preprocess
+        profile_preprocess()
+    """
+    im0 = np.random.randint(0, 255, (*shape, 3), dtype=np.uint8)  # BGR frame
+    LOGGER.info(f"{'size':>6s}{'letterbox (ms)':>16s}{'preprocess (ms)':>17s}{'saved (ms)':>12s}{'max diff':>10s}")
+    results = []
+    for size in sizes:
+        buf = np.empty((1, 3, *preprocess(im0, size)[0].shape[1:]), dtype=np.float32)  # preallocated batch
+        dt = Profile(), Profile()
+        for _ in range(n):
+            with dt[0]:
+                im = letterbox(im0, size)[0].transpose((2, 0, 1))[::-1]
+                y0 = torch.from_numpy(np.ascontiguousarray(im)).float() / 255
+            with dt[1]:
+                preprocess(im0, size, out=buf[0], normalize=True)
+                y1 = torch.from_numpy(buf[0])
+        t = [x.t / n * 1e3 for x in dt]
+        diff = (y0 - y1).abs().max().item()
+        LOGGER.info(f"{size:>6d}{t[0]:>16.2f}{t[1]:>17.2f}{t[0] - t[1]:>12.2f}{diff:>10.2g}")
+        results.append([size, *t, diff])
+    return results
+
+
 def random_perspective(
     im, targets=(), segments=(), degrees=10, translate=0.1, scale=0.1, shear=10, perspective=0.0, border=(0, 0)
 ):
@@ -402,7 +508,10 @@ class LetterBox:
         hs, ws = (math.ceil(x / self.stride) * self.stride for x in (h, w)) if self.auto else self.h, self.w
         top, left = round((hs - h) / 2 - 0.1), round((ws - w) / 2 - 0.1)
         im_out = np.full((self.h, self.w, 3), 114, dtype=im.dtype)
-        im_out[top : top + h, left : left + w] = cv2.resize(im, (w, h), interpolation=cv2.INTER_LINEAR)
+        dst = im_out[top : top + h, left : left + w]
+        x = cv2.resize(im, (w, h), dst=dst, interpolation=cv2.INTER_LINEAR)  # resize into padded output
+        if not np.shares_memory(x, im_out):  # OpenCV allocated a new array
+            dst[...] = x
         return im_out
 
 
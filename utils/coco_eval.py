@@ -0,0 +1,247 @@
+# Ultralytics YOLOv5 🚀, AGPL-3.0 license
+"""
+Native COCO bbox evaluator, a vectorized in-memory replacement for the pycocotools COCOeval round trip.
+
+Reproduces COCOeval(anno, anno.loadRes(pred_json), "bbox") evaluate(), accumulate() and summarize(): greedy matching
+with crowd and area-range ignores, maxDets 1/10/100, 101-point interpolated precision and the same 12 summary stats.
+Predictions are consumed directly as the list of dicts built by val.py save_one_json(). Matching runs per category,
+vectorized over images and IoU thresholds, and categories are spread over a process pool.
+
+Usage:
+    from utils.coco_eval import COCOEvaluator
+
+    stats = COCOEvaluator("instances_val2017.json").evaluate(jdict)  # stats[0] = mAP@0.5:0.95, stats[1] = mAP@0.5
+"""
+
+import json
+import time
+from multiprocessing.pool import Pool
+
+import numpy as np
+
+from utils.general import LOGGER, NUM_THREADS
+
+IOU_THRS = np.linspace(0.5, 0.95, 10)  # IoU thresholds
+REC_THRS = np.linspace(0.0, 1.0, 101)  # recall thresholds
+MAX_DETS = (1, 10, 100)  # max detections per image
+AREA_RNGS = ((0, 1e10), (0, 32**2), (32**2, 96**2), (96**2, 1e10))  # all, small, medium, large
+AREA_NAMES = ("all", "small", "medium", "large")
+
+
+def bbox_iou_xywh(dt, gt, crowd):
+    """Returns (..., D, G) IoU of xywh boxes `dt` (..., D, 4) and `gt` (..., G, 4) as pycocotools maskUtils.iou(), with
+    intersection over detection area for crowd `gt`.
+    """
+    d, g = dt[..., :, None, :], gt[..., None, :, :]
+    w = (np.minimum(d[..., 0] + d[..., 2], g[..., 0] + g[..., 2]) - np.maximum(d[..., 0], g[..., 0])).clip(0)
+    h = (np.minimum(d[..., 1] + d[..., 3], g[..., 1] + g[..., 3]) - np.maximum(d[..., 1], g[..., 1])).clip(0)
+    inter, da, ga = w * h, d[..., 2] * d[..., 3], g[..., 2] * g[..., 3]
+    union = np.where(crowd[..., None, :], da, da + ga - inter)
+    return np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+
+
+def pad(index, values, n, fill):
+    """Scatters rows of `values` into a (n, max count, ...) array by (row, column) `index`, padding with `fill`."""
+    out = np.full((n, index[1].max() + 1 if len(values) else 0, *values.shape[1:]), fill, dtype=values.dtype)
+    out[index] = values
+    return out
+
+
+def evaluate_category(args):
+    """
+    Evaluates one category, returning (T, R, A, M) precision and (T, A, M) recall as COCOeval.accumulate() would.
+
+    `args` are ground truth image positions, xywh boxes, iscrowd and areas in annotation order, and detection image
+    positions, xywh boxes and scores in results order.
+    """
+    gi, gbox, gcrowd, garea, di, dbox, dscore = args
+    nt, nr, na, nm = len(IOU_THRS), len(REC_THRS), len(AREA_RNGS), len(MAX_DETS)
+    precision, recall = -np.ones((nt, nr, na, nm)), -np.ones((nt, na, nm))
+    imgs = np.union1d(gi, di)  # images with ground truth or detections of this category
+    n = len(imgs)
+
+    # Detections by image and decreasing score, max MAX_DETS[-1] per image
+    dp = np.searchsorted(imgs, di)
+    o = np.lexsort((-dscore, dp))  # stable, as the mergesort in COCOeval
+    dp, dbox, dscore = dp[o], dbox[o], dscore[o]
+    rank = np.arange(len(dp)) - np.searchsorted(dp, dp)
+    k = rank < MAX_DETS[-1]
+    dp, dbox, dscore, rank = dp[k], dbox[k], dscore[k], rank[k]
+    ds = pad((dp, rank), dscore, n, -np.inf)  # (n, D)
+    dv = pad((dp, rank), np.ones_like(dscore, dtype=bool), n, False)
+    db = pad((dp, rank), dbox, n, 0.0)
+    darea = db[..., 2] * db[..., 3]
+    nd = ds.shape[1]
+
+    # Ground truth by image, in annotation order
+    gp = np.searchsorted(imgs, gi)
+    o = np.argsort(gp, kind="stable")
+    gp, gbox, gcrowd, garea = gp[o], gbox[o], gcrowd[o], garea[o]
+    rank = np.arange(len(gp)) - np.searchsorted(gp, gp)
+    gv = pad((gp, rank), np.ones_like(gcrowd, dtype=bool), n, False)  # (n, G)
+    gc = pad((gp, rank), gcrowd, n, False)
+    ga = pad((gp, rank), garea, n, 0.0)
+    gb = pad((gp, rank), gbox, n, 0.0)
+    ng = gv.shape[1]
+    ious = np.where(gv[:, None] & dv[..., None], bbox_iou_xywh(db, gb, gc), -1.0)  # (n, D, G)
+
+    thr = np.minimum(IOU_THRS, 1 - 1e-10)[None, :, None]  # (1, T, 1)
+    for a, (lo, hi) in enumerate(AREA_RNGS):
+        # Ignored ground truth last, as evaluateImg() sorts them
+        gign = gc | (ga < lo) | (ga > hi)
+        o = np.argsort(gign + 2 * ~gv, axis=1, kind="stable")
+        iou = np.take_along_axis(ious, o[:, None], 2)
+        ign, crowd = np.take_along_axis(gign, o, 1), np.take_along_axis(gc, o, 1)
+        npig = (~gign & gv).sum()
+        if npig == 0:
+            continue
+
+        # Greedy matching in score order, all images and IoU thresholds at once
+        gtm = np.zeros((n, nt, ng), dtype=bool)
+        dtm = np.zeros((n, nt, nd), dtype=bool)
+        dtig = np.zeros((n, nt, nd), dtype=bool)
+        for d in range(nd):
+            x = iou[:, d, None]  # (n, 1, G)
+            c = (x >= thr) & (~gtm | crowd[:, None])  # candidates
+            c1 = c & ~ign[:, None]  # non-ignored ground truth is preferred
+            c = np.where(c1.any(2, keepdims=True), c1, c & ign[:, None])
+            m = ng - 1 - np.argmax(np.where(c, x, -2.0)[..., ::-1], 2)  # best IoU, last on ties
+            pi, ti = (c.any(2) & dv[:, d, None]).nonzero()
+            mi = m[pi, ti]
+            gtm[pi, ti, mi] = True
+            dtm[pi, ti, d] = True
+            dtig[pi, ti, d] = ign[pi, mi]
+        dtig |= ~dtm & ((darea < lo) | (darea > hi))[:, None]  # unmatched detections outside the area range
+
+        # Accumulate precision and recall
+        for mi, md in enumerate(MAX_DETS):
+            sel = dv[:, :md]
+            o = np.argsort(-ds[:, :md][sel], kind="mergesort")
+            tm = dtm[:, :, :md].transpose(1, 0, 2)[:, sel][:, o]  # (T, N)
+            ig = dtig[:, :, :md].transpose(1, 0, 2)[:, sel][:, o]
+            tp = np.cumsum(tm & ~ig, 1, dtype=float)
+            fp = np.cumsum(~tm & ~ig, 1, dtype=float)
+            npr = tp.shape[1]
+            for t in range(nt):
+                rc = tp[t] / npig
+                pr = tp[t] / (fp[t] + tp[t] + np.spacing(1))
+                recall[t, a, mi] = rc[-1] if npr else 0
+                pr = np.maximum.accumulate(pr[::-1])[::-1]  # precision envelope
+                q = np.zeros(nr)
+                inds = np.searchsorted(rc, REC_THRS, side="left")
+                k = inds < npr
+                q[k] = pr[inds[k]]
+                precision[t, :, a, mi] = q
+    return precision, recall
+
+
+class COCOEvaluator:
+    """Evaluates in-memory COCO-format bbox results against a COCO annotations file or dict, see module docstring."""
+
+    def __init__(self, anno):
+        """Loads ground truth from a COCO annotations JSON path or an already loaded dict."""
+        if not isinstance(anno, dict):
+            with open(anno) as f:
+                anno = json.load(f)
+        a = anno["annotations"]
+        self.img_ids = np.array(sorted(x["id"] for x in anno["images"]))
+        self.cat_ids = np.array(sorted(x["id"] for x in anno["categories"]))
+        self.gt_img = np.array([x["image_id"] for x in a])
+        self.gt_cat = np.array([x["category_id"] for x in a])
+        self.gt_box = np.array([x["bbox"] for x in a], dtype=float).reshape(-1, 4)
+        self.gt_crowd = np.array([bool(x.get("iscrowd", 0)) for x in a], dtype=bool)
+        self.gt_area = np.array([x["area"] for x in a], dtype=float)
+        self.precision = self.recall = self.stats = None
+
+    def evaluate(self, jdict, img_ids=None, workers=NUM_THREADS):
+        """
+        Evaluates results `jdict` (list of dicts with image_id, category_id, bbox xywh and score) on `img_ids` (default
+        all images), logs the COCOeval summary and returns the 12 summary stats.
+        """
+        t = time.time()
+        img_ids = self.img_ids if img_ids is None else np.unique(img_ids)
+        dt_img = np.array([x["image_id"] for x in jdict])
+        dt_cat = np.array([x["category_id"] for x in jdict])
+        dt_box = np.array([x["bbox"] for x in jdict], dtype=float).reshape(-1, 4)
+        dt_score = np.array([x["score"] for x in jdict], dtype=float)
+
+        # Per-category inputs, images as positions in sorted img_ids
+        gk = np.isin(self.gt_img, img_ids)
+        dk = np.isin(dt_img, img_ids)
+        gpos, dpos = np.searchsorted(img_ids, self.gt_img), np.searchsorted(img_ids, dt_img)
+        args = []
+        for c in self.cat_ids:
+            g, d = gk & (self.gt_cat == c), dk & (dt_cat == c)
+            args.append((gpos[g], self.gt_box[g], self.gt_crowd[g], self.gt_area[g], dpos[d], dt_box[d], dt_score[d]))
+        order = np.argsort([-(len(x[0]) + len(x[4])) for x in args])  # largest categories first
+        if workers > 1 and len(args) > 1:
+            with Pool(min(workers, len(args))) as pool:
+                results = pool.map(evaluate_category, [args[i] for i in order], chunksize=1)
+        else:
+            results = [evaluate_category(args[i]) for i in order]
+        results = [results[i] for i in np.argsort(order)]
+        self.precision = np.stack([x[0] for x in results], 2)  # (T, R, K, A, M)
+        self.recall = np.stack([x[1] for x in results], 1)  # (T, K, A, M)
+        LOGGER.info(f"COCO evaluation done in {time.time() - t:.2f}s")
+        return self.summarize()
+
+    def summarize(self):
+        """Logs and returns the 12 COCOeval.summarize() stats from the accumulated precision and recall."""
+
+        def _summarize(ap=True, iou=None, area="all", max_dets=100):
+            a, m = AREA_NAMES.index(area), MAX_DETS.index(max_dets)
+            s = self.precision[..., a, m] if ap else self.recall[..., a, m]
+            if iou is not None:
+                s = s[np.isclose(IOU_THRS, iou)]
+            s = s[s > -1]
+            mean = s.mean() if len(s) else -1.0
+            iou_str = f"{IOU_THRS[0]:0.2f}:{IOU_THRS[-1]:0.2f}" if iou is None else f"{iou:0.2f}"
+            title, kind = ("Average Precision", "(AP)") if ap else ("Average Recall", "(AR)")
+            s = f"@[ IoU={iou_str:<9} | area={area:>6s} | maxDets={max_dets:>3d} ]"
+            LOGGER.info(f" {title:<18} {kind} {s} = {mean:0.3f}")
+            return mean
+
+        self.stats = np.array(
+            [
+                _summarize(True),
+                _summarize(True, iou=0.5),
+                _summarize(True, iou=0.75),
+                _summarize(True, area="small"),
+                _summarize(True, area="medium"),
+                _summarize(True, area="large"),
+                _summarize(False, max_dets=1),
+                _summarize(False, max_dets=10),
+                _summarize(False),
+                _summarize(False, area="small"),
+                _summarize(False, area="medium"),
+                _summarize(False, area="large"),
+            ]
+        )
+        return self.stats
+
+
+def profile_coco_eval(anno_json, pred_json, workers=NUM_THREADS):
+    """
+    Compares COCOEvaluator with pycocotools COCOeval on a saved predictions JSON, returning both stats and times.
+
+    Usage:
+        from utils.coco_eval import profile_coco_eval
+        anno_json = "../datasets/coco/annotations/instances_val2017.json"
+        profile_coco_eval(anno_json, "runs/val/exp/yolov5s_predictions.json")
+    """
+    from pycocotools.coco import COCO
+    from pycocotools.cocoeval import COCOeval
+
+    with open(pred_json) as f:
+        jdict = json.load(f)
+    t = time.time()
+    anno = COCO(anno_json)
+    eval = COCOeval(anno, anno.loadRes(pred_json), "bbox")
+    eval.evaluate()
+    eval.accumulate()
+    eval.summarize()
+    t1 = time.time()
+    stats = COCOEvaluator(anno_json).evaluate(jdict, workers=workers)
+    t2 = time.time()
+    LOGGER.info(f"pycocotools {t1 - t:.2f}s, native {t2 - t1:.2f}s, max difference {abs(eval.stats - stats).max():.2e}")
+    return eval.stats, stats, (t1 - t, t2 - t1)
@@ -10,10 +10,10 @@ import os
 import random
 import shutil
 import time
-from itertools import repeat
 from multiprocessing.pool import Pool, ThreadPool
 from pathlib import Path
-from threading import Thread
+from queue import Full, Queue
+from threading import Event, Lock, Thread
 from urllib.parse import urlparse
 
 import numpy as np
@@ -33,7 +33,9 @@ from utils.augmentations import (
     classify_transforms,
     copy_paste,
     letterbox,
+    letterbox_params,
     mixup,
+    preprocess,
     random_perspective,
 )
 from utils.general import (
@@ -261,6 +263,138 @@ class _RepeatSampler:
             yield from iter(self.sampler)
 
 
+def shard_dataloader(loader, i, n):
+    """
+    Returns a DataLoader over the contiguous batches of shard `i` of `n` of a sequential `loader`.
+
+    Batches are those of the unsharded loader, so rectangular batch shapes and the concatenated results of all shards in
+    shard order are identical to a single-process run.
+    """
+    bs, ni = loader.batch_size, len(loader.dataset)
+    batches = [list(range(j, min(j + bs, ni))) for j in range(0, ni, bs)]
+    nb = len(batches)
+    return DataLoader(
+        loader.dataset,
+        batch_sampler=batches[nb * i // n : nb * (i + 1) // n],
+        num_workers=loader.num_workers,
+        pin_memory=loader.pin_memory,
+        collate_fn=loader.collate_fn,
+    )
+
+
+class DevicePrefetcher:
+    """
+    Wraps a (Infinite)DataLoader to stage the next batch on `device` while the current one is being used.
+
+    Images are copied and converted from uint8 0-255 to `dtype` 0.0-1.0 on the device. On CUDA this runs on a side
+    stream; on other devices a background thread keeps up to `depth` batches ready. Other attributes are forwarded to
+    the wrapped loader, and batches are (im, targets, paths, shapes) with `im` and `targets` already resident.
+
+    Usage:
+        train_loader = DevicePrefetcher(train_loader, device)
+        for imgs, targets, paths, _ in train_loader:
+            pred = model(imgs)
+    """
+
+    def __init__(self, loader, device, dtype=torch.float32, depth=2):
+        """Initializes the prefetcher for `loader` with target `device`, image `dtype` and CPU queue `depth`."""
+        self.loader = loader
+        self.device = torch.device(device)
+        self.dtype = dtype
+        self.depth = depth
+        self._stop = self._thread = None  # CPU background thread of the current iteration
+
+    def __getattr__(self, name):
+        """Forwards attribute access, e.g. `sampler` or `dataset`, to the wrapped loader."""
+        if name == "loader":
+            raise AttributeError(name)
+        return getattr(self.loader, name)
+
+    def __len__(self):
+        """Returns the number of batches of the wrapped loader."""
+        return len(self.loader)
+
+    def to_device(self, batch):
+        """Copies a collated batch to the device, converting images from uint8 0-255 to `dtype` 0.0-1.0."""
+        im, targets, *other = batch
+        im = im.to(self.device, non_blocking=True)
+        im = torch.div(im, 255) if self.dtype == torch.float32 else im.to(self.dtype).div_(255)  # single kernel if fp32
+        return (im, targets.to(self.device, non_blocking=True), *other)
+
+    def __iter__(self):
+        """Yields device-resident batches, staging the next one while the current one is consumed."""
+        yield from self._iter_cuda() if self.device.type == "cuda" else self._iter_thread()
+
+    def _iter_cuda(self):
+        """Stages batches on a side CUDA stream, synchronizing the current stream only on hand-over."""
+        stream, current = torch.cuda.Stream(self.device), torch.cuda.current_stream(self.device)
+        it = iter(self.loader)
+
+        def preload():
+            """Returns the next batch copied to the device on the side stream, or None once `loader` is exhausted."""
+            batch = next(it, None)
+            if batch is not None:
+                with torch.cuda.stream(stream):
+                    return self.to_device(batch)
+
+        batch = preload()
+        while batch is not None:
+            current.wait_stream(stream)
+            for x in batch[:2]:
+                x.record_stream(current)  # memory allocated on the side stream is now used on the current stream
+            nxt = preload()  # overlaps with the consumer's work on `batch`
+            yield batch
+            batch = nxt
+
+    def _iter_thread(self):
+        """Stages batches in a background thread through a bounded queue, stopped by close() on early exit."""
+        self.close()
+        q, stop = Queue(maxsize=self.depth), Event()
+
+        def put(x):
+            """Queues `x`, waiting for space until the iteration is closed; returns False if it was."""
+            while not stop.is_set():
+                try:
+                    q.put(x, timeout=0.1)
+                    return True
+                except Full:
+                    pass
+            return False
+
+        def worker():
+            try:
+                for batch in self.loader:
+                    if not put(self.to_device(batch)):
+                        return
+                put(None)
+            except Exception as e:
+                put(e)
+
+        self._stop, self._thread = stop, Thread(target=worker, daemon=True)
+        self._thread.start()
+        try:
+            while True:
+                batch = q.get()
+                if batch is None:
+                    return
+                if isinstance(batch, Exception):
+                    raise batch
+                yield batch
+        finally:
+            self.close()
+
+    def close(self):
+        """Stops and joins the background thread of an unfinished CPU iteration."""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._stop = self._thread = None
+
+    def __del__(self):
+        """Stops the background thread when the prefetcher is garbage collected."""
+        self.close()
+
+
 class LoadScreenshots:
     """Loads and processes screenshots for YOLOv5 detection from specified screen regions using mss."""
 
@@ -312,9 +446,7 @@ class LoadScreenshots:
         if self.transforms:
             im = self.transforms(im0)  # transforms
         else:
-            im = letterbox(im0, self.img_size, stride=self.stride, auto=self.auto)[0]  # padded resize
-            im = im.transpose((2, 0, 1))[::-1]  # HWC to CHW, BGR to RGB
-            im = np.ascontiguousarray(im)  # contiguous
+            im = preprocess(im0, self.img_size, stride=self.stride, auto=self.auto)[0]  # padded resize, HWC to CHW, RGB
         self.frame += 1
         return str(self.screen), im, im0, None, s  # screen, img, original img, im0s, s
 
@@ -400,9 +532,7 @@ class LoadImages:
         if self.transforms:
             im = self.transforms(im0)  # transforms
         else:
-            im = letterbox(im0, self.img_size, stride=self.stride, auto=self.auto)[0]  # padded resize
-            im = im.transpose((2, 0, 1))[::-1]  # HWC to CHW, BGR to RGB
-            im = np.ascontiguousarray(im)  # contiguous
+            im = preprocess(im0, self.img_size, stride=self.stride, auto=self.auto)[0]  # padded resize, HWC to CHW, RGB
 
         return path, im, im0, self.cap, s
 
@@ -431,8 +561,66 @@ class LoadImages:
         return self.nf  # number of files
 
 
+class LoadImageBatches(LoadImages):
+    """
+    YOLOv5 batched image/video dataloader, i.e. `python detect.py --source path/ --batch-size 8`.
+
+    Images are letterboxed exactly as in LoadImages and only images with the same padded shape share a batch, so each
+    image sees the same input tensor as with batch size 1. With `auto=False` every image pads to `img_size` and all
+    images fall into one bucket. Videos are yielded one frame per batch.
+    """
+
+    def __init__(self, path, img_size=640, stride=32, auto=True, transforms=None, vid_stride=1, batch_size=8):
+        """Initializes a batched loader; holds at most 4 * `batch_size` decoded images across all shape buckets."""
+        super().__init__(path, img_size, stride, auto, transforms, vid_stride)
+        self.batch_size = batch_size
+        self.max_pending = 4 * batch_size  # decoded images held across shape buckets
+
+    def __iter__(self):
+        """Returns a generator of batches (paths, ims, im0s, cap, strings) with list-valued per-image fields."""
+        return self._batches()
+
+    def _batches(self):
+        """Yields a bucket once it holds `batch_size` images, or the fullest bucket if too many images are pending."""
+        buckets = {}  # letterboxed shape: [(path, im, im0, s), ...]
+        LoadImages.__iter__(self)
+        while self.count < self.nf:
+            if self.video_flag[self.count]:  # flush images before videos
+                yield from (self._collate(b) for b in buckets.values())
+                buckets = {}
+            try:
+                path, im, im0, cap, s = LoadImages.__next__(self)
+            except StopIteration:
+                break
+            if self.mode == "video":
+                yield [path], im[None], [im0], cap, [s]
+                continue
+            bucket = buckets.setdefault(im.shape, [])
+            bucket.append((path, im, im0, s))
+            if len(bucket) == self.batch_size:
+                yield self._collate(buckets.pop(im.shape))
+            elif sum(len(b) for b in buckets.values()) >= self.max_pending:
+                yield self._collate(buckets.pop(max(buckets, key=lambda k: len(buckets[k]))))
+        yield from (self._collate(b) for b in buckets.values())
+
+    @staticmethod
+    def _collate(bucket):
+        """Stacks a bucket of same-shape images into a (B, 3, H, W) uint8 batch with per-image lists."""
+        paths, ims, im0s, s = zip(*bucket)
+        return list(paths), np.stack(ims, 0), list(im0s), None, list(s)
+
+
 class LoadStreams:
-    """Loads and processes video streams for YOLOv5, supporting various sources including YouTube and IP cameras."""
+    """
+    Loads and processes video streams for YOLOv5, supporting various sources including YouTube and IP cameras.
+
+    Each stream decodes into a preallocated ring of `nslots` frame buffers. The capture thread writes into a slot
+    that is neither the latest frame nor the one handed to the consumer, so `__next__` returns views without copying.
+    These views are valid until the next `__next__` call. Frames overwritten before being read are counted in
+    `dropped`.
+    """
+
+    nslots = 3  # ring buffer slots per stream: consumer, latest, capture
 
     def __init__(self, sources="file.streams", img_size=640, stride=32, auto=True, transforms=None, vid_stride=1):
         """Initializes a stream loader for processing video streams with YOLOv5, supporting various sources including
@@ -446,7 +634,11 @@ class LoadStreams:
         sources = Path(sources).read_text().rsplit() if os.path.isfile(sources) else [sources]
         n = len(sources)
         self.sources = [clean_str(x) for x in sources]  # clean source names for later
-        self.imgs, self.fps, self.frames, self.threads = [None] * n, [0] * n, [0] * n, [None] * n
+        self.fps, self.frames, self.threads = [0] * n, [0] * n, [None] * n
+        self.ring = [None] * n  # (nslots, h, w, 3) uint8 frame buffers
+        self.latest, self.reading = [0] * n, [-1] * n  # slot of latest frame, slot held by the consumer
+        self.seq, self.read_seq, self.dropped = [0] * n, [0] * n, [0] * n  # frames written, last read, overwritten
+        self.lock = Lock()
         for i, s in enumerate(sources):  # index, source
             # Start thread to read frames from video stream
             st = f"{i + 1}/{n}: {s}... "
@@ -468,7 +660,9 @@ class LoadStreams:
             self.frames[i] = max(int(cap.get(cv2.CAP_PROP_FRAME_COUNT)), 0) or float("inf")  # infinite stream fallback
             self.fps[i] = max((fps if math.isfinite(fps) else 0) % 100, 0) or 30  # 30 FPS fallback
 
-            _, self.imgs[i] = cap.read()  # guarantee first frame
+            _, im = cap.read()  # guarantee first frame
+            self.ring[i] = np.empty((self.nslots, *im.shape), dtype=im.dtype)
+            self.ring[i][0], self.seq[i] = im, 1
             self.threads[i] = Thread(target=self.update, args=([i, cap, s]), daemon=True)
             LOGGER.info(f"{st} Success ({self.frames[i]} frames {w}x{h} at {self.fps[i]:.2f} FPS)")
             self.threads[i].start()
@@ -479,23 +673,38 @@ class LoadStreams:
         self.rect = np.unique(s, axis=0).shape[0] == 1  # rect inference if all shapes equal
         self.auto = auto and self.rect
         self.transforms = transforms  # optional
+        self.batch = None  # (n, 3, h, w) uint8 letterboxed batch buffer, reused across __next__ calls
         if not self.rect:
             LOGGER.warning("WARNING ⚠️ Stream shapes differ. For optimal performance supply similarly-shaped streams.")
 
+    @property
+    def imgs(self):
+        """Returns views of the latest frame of each stream."""
+        return [r[j] for r, j in zip(self.ring, self.latest)]
+
     def update(self, i, cap, stream):
-        """Reads frames from stream `i`, updating imgs array; handles stream reopening on signal loss."""
+        """Reads frames from stream `i` into its ring buffer; handles stream reopening on signal loss."""
         n, f = 0, self.frames[i]  # frame number, frame array
         while cap.isOpened() and n < f:
             n += 1
             cap.grab()  # .read() = .grab() followed by .retrieve()
             if n % self.vid_stride == 0:
-                success, im = cap.retrieve()
+                with self.lock:
+                    ring = self.ring[i]
+                    j = next(k for k in range(self.nslots) if k not in (self.latest[i], self.reading[i]))  # free slot
+                success, im = cap.retrieve(ring[j])  # decode into slot
                 if success:
-                    self.imgs[i] = im
+                    if im.shape != ring.shape[1:]:  # stream resolution changed, new ring
+                        ring = np.empty((self.nslots, *im.shape), dtype=im.dtype)
+                    if not np.shares_memory(im, ring):
+                        ring[j] = im
                 else:
                     LOGGER.warning("WARNING ⚠️ Video stream unresponsive, please check your IP camera connection.")
-                    self.imgs[i] = np.zeros_like(self.imgs[i])
+                    ring[j] = 0
                     cap.open(stream)  # re-open stream if signal was lost
+                with self.lock:  # publish
+                    self.ring[i], self.latest[i] = ring, j
+                    self.seq[i] += 1
             time.sleep(0.0)  # wait time
 
     def __iter__(self):
@@ -512,13 +721,22 @@ class LoadStreams:
             cv2.destroyAllWindows()
             raise StopIteration
 
-        im0 = self.imgs.copy()
+        with self.lock:  # hold the latest slot of each stream until the next call
+            for i, seq in enumerate(self.seq):
+                self.dropped[i] += max(seq - self.read_seq[i] - 1, 0)  # frames overwritten before being read
+                self.reading[i], self.read_seq[i] = self.latest[i], seq
+            im0 = [r[j] for r, j in zip(self.ring, self.reading)]  # views, valid until the next call
+
         if self.transforms:
             im = np.stack([self.transforms(x) for x in im0])  # transforms
         else:
-            im = np.stack([letterbox(x, self.img_size, stride=self.stride, auto=self.auto)[0] for x in im0])  # resize
-            im = im[..., ::-1].transpose((0, 3, 1, 2))  # BGR to RGB, BHWC to BCHW
-            im = np.ascontiguousarray(im)  # contiguous
+            _, (w, h), pad, _ = letterbox_params(im0[0].shape[:2], self.img_size, self.auto, True, self.stride)
+            shape = h + pad[0] + pad[1], w + pad[2] + pad[3]  # letterboxed shape, pad is top, bottom, left, right
+            if self.batch is None or self.batch.shape[2:] != shape:
+                self.batch = np.empty((len(im0), 3, *shape), dtype=np.uint8)
+            for i, x in enumerate(im0):  # padded resize, BGR HWC to RGB CHW, straight into the batch buffer
+                preprocess(x, self.img_size, stride=self.stride, auto=self.auto, out=self.batch[i])
+            im = self.batch
 
         return self.sources, im, im0, None, ""
 
@@ -535,10 +753,125 @@ def img2label_paths(img_paths):
     return [sb.join(x.rsplit(sa, 1)).rsplit(".", 1)[0] + ".txt" for x in img_paths]
 
 
+class RaggedArray:
+    """
+    Read-only list-like view of variable-length rows stored flat, i.e. per-image labels of the on-disk label index.
+
+    Item `i` is the view `data[offsets[i]:offsets[i + 1]]`. Indexing with an integer or boolean array returns a
+    reindexed RaggedArray that shares `data`, so filtering and sorting never copy rows. `data` may itself be a
+    RaggedArray, in which case items are lists of views (i.e. the segments of an image).
+    """
+
+    def __init__(self, data, offsets, index=None):
+        """Initializes a view of `data` rows split at `offsets` (len n + 1), optionally reordered by `index`."""
+        self.data = data
+        self.offsets = offsets
+        self.index = np.arange(len(offsets) - 1) if index is None else index
+
+    @classmethod
+    def from_list(cls, rows, shape=(), dtype=np.float32):
+        """Packs a list of arrays (or, with `shape=None`, a list of lists of arrays) into a new RaggedArray."""
+        if shape is None:  # nested
+            inner = [x for r in rows for x in r]
+            return cls(cls.from_list(inner, (2,), dtype), cls._offsets([len(r) for r in rows]))
+        data = np.concatenate(rows, 0).astype(dtype) if sum(len(x) for x in rows) else np.zeros((0, *shape), dtype)
+        return cls(data.reshape(-1, *shape), cls._offsets([len(x) for x in rows]))
+
+    @staticmethod
+    def _offsets(lengths):
+        """Returns int64 offsets (n + 1) from a sequence of row lengths."""
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        return offsets
+
+    def lengths(self):
+        """Returns the number of rows of each item as an array."""
+        return np.diff(self.offsets)[self.index]
+
+    def __len__(self):
+        """Returns the number of items."""
+        return len(self.index)
+
+    def __getitem__(self, i):
+        """Returns item `i` as a view, a list of items for a slice, or a reindexed RaggedArray for an index array."""
+        if isinstance(i, slice):
+            return [self[k] for k in range(*i.indices(len(self)))]
+        if isinstance(i, (list, tuple, np.ndarray)):
+            return RaggedArray(self.data, self.offsets, self.index[np.asarray(i)])
+        j = self.index[i]
+        return self.data[self.offsets[j] : self.offsets[j + 1]]
+
+    def __iter__(self):
+        """Iterates over items."""
+        return (self[i] for i in range(len(self)))
+
+
+def file_stats(paths):
+    """Returns an (n, 2) float64 array of mtime and size per file, -1 for missing files."""
+
+    def stat(p):
+        """Returns (mtime, size) of file `p`."""
+        try:
+            s = os.stat(p)
+            return s.st_mtime, s.st_size
+        except OSError:
+            return -1.0, -1.0
+
+    with ThreadPool(NUM_THREADS) as pool:
+        return np.array(pool.map(stat, paths, chunksize=1024), dtype=np.float64).reshape(-1, 2)
+
+
+def save_label_index(path, files, labels, shapes, segments, meta, **arrays):
+    """
+    Saves a columnar label index directory at `path`: flat float32 labels, points and int64 offset tables as .npy files
+    plus a meta.json with version, hash, results and msgs. Extra `arrays` are saved as `<name>.npy`. Replaces any
+    previous pickled cache file or index, whose memory maps must be released first as Windows can't delete mapped files.
+    """
+    tmp = path.with_suffix(".cache_tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    np.save(tmp / "files.npy", np.array(files, dtype=str))
+    np.save(tmp / "shapes.npy", np.asarray(shapes, dtype=np.int64).reshape(-1, 2))
+    np.save(tmp / "labels.npy", labels.data)
+    np.save(tmp / "label_offsets.npy", labels.offsets)
+    np.save(tmp / "points.npy", segments.data.data)
+    np.save(tmp / "point_offsets.npy", segments.data.offsets)
+    np.save(tmp / "segment_offsets.npy", segments.offsets)
+    for k, v in arrays.items():
+        np.save(tmp / f"{k}.npy", v)
+    (tmp / "meta.json").write_text(json.dumps(meta))
+    if path.is_dir():
+        shutil.rmtree(path)
+    elif path.exists():
+        path.unlink()  # previous pickled *.cache
+    tmp.rename(path)
+
+
+def load_label_index(path, mmap_mode="c"):
+    """
+    Opens a label index saved by save_label_index() with np.memmap-backed arrays that DataLoader workers share through
+    the page cache. Mode 'c' (copy-on-write) lets in-place edits such as single_cls stay private to the process.
+    """
+    assert path.is_dir(), f"{path} is not a label index"
+    x = json.loads((path / "meta.json").read_text())
+
+    def load(k):
+        """Memory-maps array `k` of the index."""
+        return np.load(path / f"{k}.npy", mmap_mode=mmap_mode)
+
+    x["files"] = load("files").tolist()
+    x["shapes"] = load("shapes")
+    x["labels"] = RaggedArray(load("labels"), load("label_offsets"))
+    x["segments"] = RaggedArray(RaggedArray(load("points"), load("point_offsets")), load("segment_offsets"))
+    for f in path.glob("scan_*.npy"):  # per-file scan state for incremental rebuilds
+        x[f.stem] = load(f.stem)
+    return x
+
+
 class LoadImagesAndLabels(Dataset):
     """Loads images and their corresponding labels for training and validation in YOLOv5."""
 
-    cache_version = 0.6  # dataset labels *.cache version
+    cache_version = 0.8  # dataset labels *.cache version
     rand_interp_methods = [cv2.INTER_NEAREST, cv2.INTER_LINEAR, cv2.INTER_CUBIC, cv2.INTER_AREA, cv2.INTER_LANCZOS4]
 
     def __init__(
@@ -595,15 +928,19 @@ class LoadImagesAndLabels(Dataset):
         # Check cache
         self.label_files = img2label_paths(self.im_files)  # labels
         cache_path = (p if p.is_file() else Path(self.label_files[0]).parent).with_suffix(".cache")
+        cache, exists = None, False
         try:
-            cache, exists = np.load(cache_path, allow_pickle=True).item(), True  # load dict
+            cache = load_label_index(cache_path)  # memory-mapped columnar index
             assert cache["version"] == self.cache_version  # matches current version
             assert cache["hash"] == get_hash(self.label_files + self.im_files)  # identical hash
+            exists = True
         except Exception:
-            cache, exists = self.cache_labels(cache_path, prefix), False  # run cache ops
+            previous = cache if cache and cache.get("version") == self.cache_version else None  # reusable entries
+            cache = None  # release the memory maps of an outdated index before it is replaced
+            cache = self.cache_labels(cache_path, prefix, previous)  # run cache ops
 
         # Display cache
-        nf, nm, ne, nc, n = cache.pop("results")  # found, missing, empty, corrupt, total
+        nf, nm, ne, nc, n = cache["results"]  # found, missing, empty, corrupt, total
         if exists and LOCAL_RANK in {-1, 0}:
             d = f"Scanning {cache_path}... {nf} images, {nm + ne} backgrounds, {nc} corrupt"
             tqdm(None, desc=prefix + d, total=n, initial=n, bar_format=TQDM_BAR_FORMAT)  # display cache results
@@ -612,23 +949,20 @@ class LoadImagesAndLabels(Dataset):
         assert nf > 0 or not augment, f"{prefix}No labels found in {cache_path}, can not start training. {HELP_URL}"
 
         # Read cache
-        [cache.pop(k) for k in ("hash", "version", "msgs")]  # remove items
-        labels, shapes, self.segments = zip(*cache.values())
-        nl = len(np.concatenate(labels, 0))  # number of labels
+        self.labels, self.shapes, self.segments = cache["labels"], cache["shapes"], cache["segments"]  # RaggedArray
+        nl = len(self.labels.data)  # number of labels
         assert nl > 0 or not augment, f"{prefix}All labels empty in {cache_path}, can not start training. {HELP_URL}"
-        self.labels = list(labels)
-        self.shapes = np.array(shapes)
-        self.im_files = list(cache.keys())  # update
-        self.label_files = img2label_paths(cache.keys())  # update
+        self.im_files = cache["files"]  # update
+        self.label_files = img2label_paths(self.im_files)  # update
 
         # Filter images
         if min_items:
-            include = np.array([len(x) >= min_items for x in self.labels]).nonzero()[0].astype(int)
+            include = (self.labels.lengths() >= min_items).nonzero()[0]
             LOGGER.info(f"{prefix}{n - len(include)}/{n} images filtered from dataset")
             self.im_files = [self.im_files[i] for i in include]
             self.label_files = [self.label_files[i] for i in include]
-            self.labels = [self.labels[i] for i in include]
-            self.segments = [self.segments[i] for i in include]
+            self.labels = self.labels[include]
+            self.segments = self.segments[include]
             self.shapes = self.shapes[include]  # wh
 
         # Create indices
@@ -644,16 +978,16 @@ class LoadImagesAndLabels(Dataset):
 
         # Update labels
         include_class = []  # filter labels to include only these classes (optional)
-        self.segments = list(self.segments)
-        include_class_array = np.array(include_class).reshape(1, -1)
-        for i, (label, segment) in enumerate(zip(self.labels, self.segments)):
-            if include_class:
+        if include_class:
+            include_class_array = np.array(include_class).reshape(1, -1)
+            labels, segments = [], []
+            for label, segment in zip(self.labels, self.segments):
                 j = (label[:, 0:1] == include_class_array).any(1)
-                self.labels[i] = label[j]
-                if segment:
-                    self.segments[i] = [segment[idx] for idx, elem in enumerate(j) if elem]
-            if single_cls:  # single-class training, merge all classes into 0
-                self.labels[i][:, 0] = 0
+                labels.append(label[j])
+                segments.append([x for x, keep in zip(segment, j) if keep] if segment else segment)
+            self.labels, self.segments = RaggedArray.from_list(labels, (5,)), RaggedArray.from_list(segments, None)
+        if single_cls:  # single-class training, merge all classes into 0
+            self.labels.data[:, 0] = 0
 
         # Rectangular Training
         if self.rect:
@@ -663,8 +997,8 @@ class LoadImagesAndLabels(Dataset):
             irect = ar.argsort()
             self.im_files = [self.im_files[i] for i in irect]
             self.label_files = [self.label_files[i] for i in irect]
-            self.labels = [self.labels[i] for i in irect]
-            self.segments = [self.segments[i] for i in irect]
+            self.labels = self.labels[irect]
+            self.segments = self.segments[irect]
             self.shapes = s[irect]  # wh
             ar = ar[irect]
 
@@ -685,7 +1019,10 @@ class LoadImagesAndLabels(Dataset):
             cache_images = False
         self.ims = [None] * n
         self.npy_files = [Path(f).with_suffix(".npy") for f in self.im_files]
-        if cache_images:
+        self.ims_blob, self.ims_index = None, None  # memory-mapped image cache
+        if cache_images == "mmap":
+            self.cache_images_to_mmap(cache_path, prefix=prefix)
+        elif cache_images:
             b, gb = 0, 1 << 30  # bytes of cached images, bytes per gigabytes
             self.im_hw0, self.im_hw = [None] * n, [None] * n
             fcn = self.cache_images_to_disk if cache_images == "disk" else self.load_image
@@ -719,44 +1056,77 @@ class LoadImagesAndLabels(Dataset):
             )
         return cache
 
-    def cache_labels(self, path=Path("./labels.cache"), prefix=""):
-        """Caches dataset labels, verifies images, reads shapes, and tracks dataset integrity."""
-        x = {}  # dict
-        nm, nf, ne, nc, msgs = 0, 0, 0, 0, []  # number missing, found, empty, corrupt, messages
-        desc = f"{prefix}Scanning {path.parent / path.stem}..."
-        with Pool(NUM_THREADS) as pool:
-            pbar = tqdm(
-                pool.imap(verify_image_label, zip(self.im_files, self.label_files, repeat(prefix))),
-                desc=desc,
-                total=len(self.im_files),
-                bar_format=TQDM_BAR_FORMAT,
-            )
-            for im_file, lb, shape, segments, nm_f, nf_f, ne_f, nc_f, msg in pbar:
-                nm += nm_f
-                nf += nf_f
-                ne += ne_f
-                nc += nc_f
-                if im_file:
-                    x[im_file] = [lb, shape, segments]
-                if msg:
-                    msgs.append(msg)
-                pbar.desc = f"{desc} {nf} images, {nm + ne} backgrounds, {nc} corrupt"
+    def cache_labels(self, path=Path("./labels.cache"), prefix="", previous=None):
+        """
+        Caches dataset labels, verifies images, reads shapes, and tracks dataset integrity.
 
+        Images whose image and label file mtime and size match an entry of the `previous` label index are reused, so
+        only added or changed files are re-verified and removed files are dropped.
+        """
+        n = len(self.im_files)
+        stats = np.concatenate((file_stats(self.im_files), file_stats(self.label_files)), 1)  # (n, 4) mtime, size
+        results = [None] * n  # verify_image_label() output per image
+        if previous is not None and "scan_stats" in previous:
+            row = {f: k for k, f in enumerate(previous["scan_files"].tolist())}
+            k = np.array([row.get(f, -1) for f in self.im_files], dtype=np.int64)  # previous row, -1 if added
+            same, old = np.zeros(n, dtype=bool), k >= 0
+            same[old] = (previous["scan_stats"][k[old]] == stats[old]).all(1)
+            pmsgs, plb, psh, pseg = previous["scan_msgs"], previous["labels"], previous["shapes"], previous["segments"]
+            for i in same.nonzero()[0]:
+                f, j = self.im_files[i], previous["scan_valid"][k[i]]  # index into previous labels, -1 if corrupt
+                r = (f, plb[j].copy(), psh[j].copy(), [x.copy() for x in pseg[j]]) if j >= 0 else (None,) * 4
+                results[i] = (*r, *previous["scan_counts"][k[i]].tolist(), pmsgs.get(f, ""))
+            del plb, psh, pseg
+        if previous is not None:
+            previous.clear()  # rows are copied, close the memory maps so the previous index can be replaced (Windows)
+        todo = [i for i, r in enumerate(results) if r is None]  # added or changed images
+
+        desc = f"{prefix}Scanning {path.parent / path.stem}... {n - len(todo)} unchanged,"
+        with Pool(NUM_THREADS) as pool:
+            args = ((self.im_files[i], self.label_files[i], prefix) for i in todo)
+            pbar = tqdm(pool.imap(verify_image_label, args), desc=desc, total=len(todo), bar_format=TQDM_BAR_FORMAT)
+            for i, r in zip(todo, pbar):
+                results[i] = r
         pbar.close()
+
+        files, labels, shapes, segments, msgs = [], [], [], [], []  # valid images
+        nm, nf, ne, nc = 0, 0, 0, 0  # number missing, found, empty, corrupt
+        valid, counts, scan_msgs = np.full(n, -1, dtype=np.int64), np.zeros((n, 4), dtype=np.int64), {}
+        for i, (im_file, lb, shape, segments_f, nm_f, nf_f, ne_f, nc_f, msg) in enumerate(results):
+            nm += nm_f
+            nf += nf_f
+            ne += ne_f
+            nc += nc_f
+            counts[i] = nm_f, nf_f, ne_f, nc_f
+            if im_file:
+                valid[i] = len(files)
+                files.append(im_file)
+                labels.append(lb)
+                shapes.append(shape)
+                segments.append(segments_f)
+            if msg:
+                msgs.append(msg)
+                scan_msgs[self.im_files[i]] = msg
         if msgs:
             LOGGER.info("\n".join(msgs))
         if nf == 0:
             LOGGER.warning(f"{prefix}WARNING ⚠️ No labels found in {path}. {HELP_URL}")
-        x["hash"] = get_hash(self.label_files + self.im_files)
-        x["results"] = nf, nm, ne, nc, len(self.im_files)
-        x["msgs"] = msgs  # warnings
-        x["version"] = self.cache_version  # cache version
+        x = {
+            "hash": get_hash(self.label_files + self.im_files),
+            "results": (nf, nm, ne, nc, n),
+            "msgs": msgs,  # warnings
+            "scan_msgs": scan_msgs,  # warnings per image file
+            "version": self.cache_version,  # cache version
+        }
+        labels, segments = RaggedArray.from_list(labels, (5,)), RaggedArray.from_list(segments, None)
+        shapes = np.array(shapes, dtype=np.int64).reshape(-1, 2)
         try:
-            np.save(path, x)  # save cache for next time
-            path.with_suffix(".cache.npy").rename(path)  # remove .npy suffix
+            scan = dict(scan_files=np.array(self.im_files, dtype=str), scan_stats=stats, scan_counts=counts)
+            save_label_index(path, files, labels, shapes, segments, x, scan_valid=valid, **scan)  # save for next time
             LOGGER.info(f"{prefix}New cache created: {path}")
         except Exception as e:
             LOGGER.warning(f"{prefix}WARNING ⚠️ Cache directory {path.parent} is not writeable: {e}")  # not writeable
+        x.update(files=files, labels=labels, shapes=shapes, segments=segments)
         return x
 
     def __len__(self):
@@ -852,6 +1222,9 @@ class LoadImagesAndLabels(Dataset):
 
         Returns (im, original hw, resized hw)
         """
+        if self.ims_blob is not None:  # read-only view into the memory-mapped image cache
+            o, h, w, h0, w0 = self.ims_index[i]
+            return self.ims_blob[o : o + h * w * 3].reshape(h, w, 3), (h0, w0), (h, w)
         im, f, fn = (
             self.ims[i],
             self.im_files[i],
@@ -877,6 +1250,53 @@ class LoadImagesAndLabels(Dataset):
         if not f.exists():
             np.save(f.as_posix(), cv2.imread(self.im_files[i]))
 
+    def cache_images_to_mmap(self, path, prefix=""):
+        """
+        Packs all resized images into one uint8 blob next to the label index `path` and memory-maps it read-only.
+
+        Offsets come from the label index shapes, so the blob is written in parallel with the existing ThreadPool. It
+        is built once and then shared through the page cache by all DataLoader workers and all DDP ranks on a node.
+        """
+        f = path.with_name(f"{path.stem}_{self.img_size}{'_augment' if self.augment else ''}.images")  # blob
+        fi, fm = f.with_suffix(".index.npy"), f.with_suffix(".json")  # offset index, meta
+        h0w0 = self.shapes[:, ::-1].astype(np.int64)  # original hw
+        r = self.img_size / h0w0.max(1, keepdims=True)  # ratio
+        hw = np.where(r != 1, np.ceil(h0w0 * r), h0w0).astype(np.int64)  # resized hw, as in load_image()
+        nbytes = hw[:, 0] * hw[:, 1] * 3
+        index = np.concatenate(((np.cumsum(nbytes) - nbytes)[:, None], hw, h0w0), 1)  # (n, 5) offset, hw, hw0
+        meta = {"hash": get_hash(self.im_files), "bytes": int(nbytes.sum())}
+        try:
+            assert json.loads(fm.read_text()) == meta and np.array_equal(np.load(fi), index)
+        except Exception:
+            try:
+                fm.unlink(missing_ok=True)  # invalidate first, meta is written last
+                tmp = f.with_suffix(".images_tmp")
+                blob = np.memmap(tmp, dtype=np.uint8, mode="w+", shape=(max(meta["bytes"], 1),))
+
+                def write(i):
+                    """Loads image `i` and writes it at its offset, returning bytes written."""
+                    im = self.load_image(i)[0]
+                    assert im.shape == (*hw[i], 3), f"{self.im_files[i]} shape {im.shape} != label index shape"
+                    blob[index[i, 0] : index[i, 0] + nbytes[i]] = im.reshape(-1)
+                    return nbytes[i]
+
+                b, gb = 0, 1 << 30  # bytes of cached images, bytes per gigabytes
+                results = ThreadPool(NUM_THREADS).imap(write, range(len(hw)))
+                pbar = tqdm(results, total=len(hw), bar_format=TQDM_BAR_FORMAT, disable=LOCAL_RANK > 0)
+                for x in pbar:
+                    b += x
+                    pbar.desc = f"{prefix}Caching images ({b / gb:.1f}GB mmap)"
+                pbar.close()
+                blob.flush()
+                del blob
+                np.save(fi, index)
+                os.replace(tmp, f)
+                fm.write_text(json.dumps(meta))
+            except Exception as e:
+                LOGGER.warning(f"{prefix}WARNING ⚠️ Image cache {f} not created, not caching images: {e}")
+                return
+        self.ims_blob, self.ims_index = np.memmap(f, dtype=np.uint8, mode="r"), index
+
     def load_mosaic(self, index):
         """Loads a 4-image mosaic for YOLOv5, combining 1 selected and 3 random images, with labels and segments."""
         labels4, segments4 = [], []
@@ -1379,3 +1799,37 @@ def create_classification_dataloader(
         worker_init_fn=seed_worker,
         generator=generator,
     )  # or DataLoader(persistent_workers=True)
+
+
+def profile_prefetch(path, cfg="yolov5s.yaml", imgsz=640, batch_size=16, workers=8, n=50, device=None):
+    """
+    Profiles training throughput in images/s with inline device transfer versus DevicePrefetcher.
+
+    Usage:
+        from utils.dataloaders import profile_prefetch
+        profile_prefetch("../datasets/coco128/images/train2017", device="cuda:0")
+    """
+    from models.yolo import Model
+    from utils.general import ROOT
+    from utils.torch_utils import select_device
+
+    device = select_device("" if device is None else device)
+    model = Model(ROOT / "models" / cfg).to(device).train()
+    loader = create_dataloader(path, imgsz, batch_size, 32, workers=workers, shuffle=True)[0]
+    LOGGER.info(f"{'mode':>12s}{'img/s':>10s}")
+    results = {}
+    for mode, x in ("inline", loader), ("prefetch", DevicePrefetcher(loader, device)):
+        it, seen = iter(x), 0
+        next(it)  # warmup
+        t = time.time()
+        for _ in range(n):
+            imgs = next(it)[0]
+            if mode == "inline":
+                imgs = imgs.to(device, non_blocking=True).float() / 255
+            model(imgs)[0].sum().backward()
+            seen += len(imgs)
+        if device.type == "cuda":
+            torch.cuda.synchronize(device)
+        results[mode] = seen / (time.time() - t)
+        LOGGER.info(f"{mode:>12s}{results[mode]:>10.1f}")
+    return results
@@ -0,0 +1,102 @@
+# Ultralytics YOLOv5 🚀, AGPL-3.0 license
+"""
+Detection response encodings for the REST API, selected through the request Accept header.
+
+    application/json              records list as returned by results.pandas().xyxy[0].to_json(orient="records")
+    application/x-yolov5-boxes    packed little-endian binary: 12-byte header <4sHHI (magic b"YV5B", version, floats
+                                  per box, number of boxes n), then float32[n, 5] xyxy+confidence, then int16[n] class
+    application/msgpack           map {"xyxy": float32[n, 4] bytes, "confidence": float32[n] bytes,
+                                  "class": int16[n] bytes, "names": {class: name}}, requires `pip install msgpack`
+
+Usage - benchmark serialization cost:
+    $ python encoding.py
+"""
+
+import json
+import struct
+import time
+
+import numpy as np
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON = "application/json"
+PACKED = "application/x-yolov5-boxes"
+MSGPACK = "application/msgpack"
+ENCODINGS = (JSON, PACKED, MSGPACK)
+
+MAGIC = b"YV5B"
+VERSION = 1
+HEADER = struct.Struct("<4sHHI")  # magic, version, floats per box, number of boxes
+
+
+def negotiate(accept=None):
+    """Returns the supported response MIME type with the highest quality in an Accept header, JSON by default."""
+    best, best_q = JSON, 0.0
+    for part in (accept or "").split(","):
+        mime, *params = (x.strip() for x in part.split(";"))
+        q = next((float(p[2:]) for p in params if p.startswith("q=")), 1.0)
+        if mime == "application/x-msgpack":
+            mime = MSGPACK
+        if mime in ENCODINGS and q > best_q and (mime != MSGPACK or msgpack is not None):
+            best, best_q = mime, q
+    return best
+
+
+def encode(pred, names, mime=JSON):
+    """Encodes an (n, 6) xyxy, confidence, class detection array or tensor as `mime`, returns bytes."""
+    if hasattr(pred, "cpu"):
+        pred = pred.cpu().numpy()
+    pred = np.asarray(pred, dtype=np.float32).reshape(-1, 6)
+    if mime == PACKED:
+        cls = pred[:, 5].astype("<i2")
+        return HEADER.pack(MAGIC, VERSION, 5, len(pred)) + pred[:, :5].astype("<f4").tobytes() + cls.tobytes()
+    if mime == MSGPACK:
+        if msgpack is None:
+            raise ImportError("msgpack response encoding requires 'pip install msgpack'")
+        cls = pred[:, 5].astype("<i2")
+        return msgpack.packb(
+            {
+                "xyxy": pred[:, :4].astype("<f4").tobytes(),
+                "confidence": pred[:, 4].astype("<f4").tobytes(),
+                "class": cls.tobytes(),
+                "names": {int(c): names[int(c)] for c in set(cls.tolist())},
+            }
+        )
+    keys = ("xmin", "ymin", "xmax", "ymax", "confidence")
+    records = [{**dict(zip(keys, x[:5])), "class": int(x[5]), "name": names[int(x[5])]} for x in pred.tolist()]
+    return json.dumps(records).encode()
+
+
+def profile_serialization(n=(10, 100, 300, 1000), nc=80, iters=1000):
+    """Benchmarks encoding cost per response for each encoding against the pandas DataFrame JSON path."""
+    import pandas as pd
+
+    names = {i: f"class{i}" for i in range(nc)}
+    encodings = [e for e in ENCODINGS if e != MSGPACK or msgpack is not None]
+    print(f"{'boxes':>8}{'encoding':>28}{'bytes':>10}{'us/response':>14}")
+    for nb in n:
+        pred = np.random.rand(nb, 6).astype(np.float32) * 640
+        pred[:, 4] /= 640
+        pred[:, 5] = np.random.randint(0, nc, nb)
+
+        def pandas_json():
+            df = pd.DataFrame(pred, columns=["xmin", "ymin", "xmax", "ymax", "confidence", "class"])
+            df["class"] = df["class"].astype(int)
+            df["name"] = [names[c] for c in df["class"]]
+            return df.to_json(orient="records").encode()
+
+        fns = [("pandas to_json", pandas_json)] + [(e, lambda e=e: encode(pred, names, e)) for e in encodings]
+        for name, fn in fns:
+            t = time.perf_counter()
+            for _ in range(iters):
+                body = fn()
+            dt = (time.perf_counter() - t) / iters
+            print(f"{nb:>8}{name:>28}{len(body):>10}{dt * 1e6:>14.1f}")
+
+
+if __name__ == "__main__":
+    profile_serialization()
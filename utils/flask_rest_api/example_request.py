@@ -1,17 +1,57 @@
 # Ultralytics YOLOv5 🚀, AGPL-3.0 license
-"""Perform test request."""
+"""
+Perform test request.
 
+Usage:
+    $ python example_request.py --format json  # or packed, msgpack
+"""
+
+import argparse
 import pprint
+import struct
 
+import numpy as np
 import requests
 
 DETECTION_URL = "http://localhost:5000/v1/object-detection/yolov5s"
 IMAGE = "zidane.jpg"
+FORMATS = {"json": "application/json", "packed": "application/x-yolov5-boxes", "msgpack": "application/msgpack"}
+
+
+def decode_packed(data):
+    """Decodes an application/x-yolov5-boxes response into (n, 4) xyxy, (n,) confidence and (n,) class arrays."""
+    magic, version, nf, n = struct.unpack_from("<4sHHI", data)
+    assert magic == b"YV5B" and version == 1, f"unsupported packed response {magic} v{version}"
+    boxes = np.frombuffer(data, "<f4", n * nf, 12).reshape(n, nf)
+    cls = np.frombuffer(data, "<i2", n, 12 + boxes.nbytes)
+    return boxes[:, :4], boxes[:, 4], cls
+
+
+def decode_msgpack(data):
+    """Decodes an application/msgpack response into xyxy, confidence and class arrays and a {class: name} dict."""
+    import msgpack
+
+    r = msgpack.unpackb(data, strict_map_key=False)
+    xyxy = np.frombuffer(r["xyxy"], "<f4").reshape(-1, 4)
+    return xyxy, np.frombuffer(r["confidence"], "<f4"), np.frombuffer(r["class"], "<i2"), r["names"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--format", default="json", choices=FORMATS, help="response encoding")
+    opt = parser.parse_args()
 
-# Read image
-with open(IMAGE, "rb") as f:
-    image_data = f.read()
+    # Read image
+    with open(IMAGE, "rb") as f:
+        image_data = f.read()
 
-response = requests.post(DETECTION_URL, files={"image": image_data}).json()
+    response = requests.post(DETECTION_URL, files={"image": image_data}, headers={"Accept": FORMATS[opt.format]})
+    mime = response.headers.get("Content-Type", "").split(";")[0]  # server falls back to JSON if unsupported
+    if mime == FORMATS["packed"]:
+        response = decode_packed(response.content)
+    elif mime == FORMATS["msgpack"]:
+        response = decode_msgpack(response.content)
+    else:
+        response = response.json()
 
-pprint.pprint(response)
+    pprint.pprint(response)
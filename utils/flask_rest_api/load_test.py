@@ -0,0 +1,55 @@
+# Ultralytics YOLOv5 🚀, AGPL-3.0 license
+"""
+Load test a detection endpoint with concurrent requests and report throughput and latency percentiles.
+
+Usage:
+    $ python server.py --model yolov5s
+    $ python load_test.py --url http://localhost:5000/v1/object-detection/yolov5s --concurrency 32 --requests 1000
+"""
+
+import argparse
+import asyncio
+import time
+
+import aiohttp
+import numpy as np
+
+
+async def load_test(url, image, concurrency=32, requests=1000):
+    """POSTs `image` bytes `requests` times from `concurrency` clients, returns latencies, errors and wall time."""
+    latencies, errors, sent = [], 0, 0
+
+    async def client(session):
+        nonlocal errors, sent
+        while sent < requests:
+            sent += 1
+            t = time.perf_counter()
+            data = aiohttp.FormData()
+            data.add_field("image", image, filename="image.jpg")
+            async with session.post(url, data=data) as r:
+                await r.read()
+                if r.status == 200:
+                    latencies.append(time.perf_counter() - t)
+                else:
+                    errors += 1
+
+    t = time.perf_counter()
+    async with aiohttp.ClientSession() as session:
+        await asyncio.gather(*(client(session) for _ in range(concurrency)))
+    return np.array(latencies), errors, time.perf_counter() - t
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test a YOLOv5 detection endpoint")
+    parser.add_argument("--url", default="http://localhost:5000/v1/object-detection/yolov5s", help="endpoint URL")
+    parser.add_argument("--image", default="zidane.jpg", help="image file to POST")
+    parser.add_argument("--concurrency", default=32, type=int, help="concurrent clients")
+    parser.add_argument("--requests", default=1000, type=int, help="total requests")
+    opt = parser.parse_args()
+
+    with open(opt.image, "rb") as f:
+        image = f.read()
+    lat, errors, dt = asyncio.run(load_test(opt.url, image, opt.concurrency, opt.requests))
+    p50, p90, p99 = np.percentile(lat * 1e3, (50, 90, 99)) if len(lat) else (0, 0, 0)
+    print(f"{len(lat)} ok, {errors} errors in {dt:.2f}s: {len(lat) / dt:.1f} req/s")
+    print(f"latency p50 {p50:.1f}ms, p90 {p90:.1f}ms, p99 {p99:.1f}ms")
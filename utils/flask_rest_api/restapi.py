@@ -5,7 +5,8 @@ import argparse
 import io
 
 import torch
-from flask import Flask, request
+from encoding import encode, negotiate
+from flask import Flask, Response, request
 from PIL import Image
 
 app = Flask(__name__)
@@ -16,8 +17,8 @@ DETECTION_URL = "/v1/object-detection/<model>"
 
 @app.route(DETECTION_URL, methods=["POST"])
 def predict(model):
-    """Predict and return object detections in JSON format given an image and model name via a Flask REST API POST
-    request.
+    """Predict and return object detections given an image and model name via a Flask REST API POST request, encoded
+    as JSON, packed binary or msgpack according to the Accept header.
     """
     if request.method != "POST":
         return
@@ -34,7 +35,8 @@ def predict(model):
 
         if model in models:
             results = models[model](im, size=640)  # reduce size=320 for faster inference
-            return results.pandas().xyxy[0].to_json(orient="records")
+            mime = negotiate(request.headers.get("Accept"))
+            return Response(encode(results.xyxy[0], results.names, mime), mimetype=mime, headers={"Vary": "Accept"})
 
 
 if __name__ == "__main__":
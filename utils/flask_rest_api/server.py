@@ -0,0 +1,201 @@
+# Ultralytics YOLOv5 🚀, AGPL-3.0 license
+"""
+Run an asynchronous YOLOv5 inference server with dynamic request batching.
+
+Requests for each model are queued and a BatchScheduler gathers them into batches of up to --max-batch images, waiting
+at most --max-wait ms after the first request, runs one AutoShape forward pass per batch in a worker thread and fans
+the results back out. Responses use the same encodings as restapi.py, chosen through the Accept header.
+
+Usage:
+    $ python server.py --model yolov5n yolov5s --port 5000 --max-batch 16 --max-wait 5
+    $ curl -X POST -F image=@zidane.jpg 'http://localhost:5000/v1/object-detection/yolov5s'
+    $ curl http://localhost:5000/health
+    $ curl http://localhost:5000/metrics
+    $ python load_test.py --url http://localhost:5000/v1/object-detection/yolov5s --concurrency 32 --requests 1000
+"""
+
+import argparse
+import asyncio
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+from aiohttp import web
+from encoding import encode, negotiate
+from PIL import Image
+
+DETECTION_URL = "/v1/object-detection/{model}"
+
+
+class BatchScheduler:
+    """Gathers queued images for one model into dynamic batches and runs one forward pass per batch."""
+
+    def __init__(self, model, max_batch=16, max_wait=0.005, size=640):
+        """Initializes the scheduler for an AutoShape `model`; `max_wait` is in seconds."""
+        self.model = model
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.size = size
+        self.queue = asyncio.Queue()
+        self.queued = asyncio.Event()  # set on every submit, wakes the batching loop
+        self.executor = ThreadPoolExecutor(max_workers=1)  # one forward pass at a time per model
+        self.task = None
+        self.requests = self.request_errors = 0  # served and failed or cancelled requests
+        self.batches = self.batch_errors = self.images = 0  # successful and failed batches, images served in batches
+        self.infer_time = self.latency = 0.0  # seconds, totals over successful batches and served requests
+
+    def start(self):
+        """Starts the scheduling loop on the running event loop."""
+        self.task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self):
+        """Cancels the scheduling loop and shuts down the worker thread."""
+        self.task.cancel()
+        self.executor.shutdown(wait=False)
+
+    async def submit(self, im):
+        """Queues image `im` and returns its detections and class names once its batch has run."""
+        t = time.perf_counter()
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((im, future))
+        self.queued.set()
+        try:
+            result = await future
+        except BaseException:  # failed batch or cancelled request (client disconnected)
+            self.request_errors += 1
+            raise
+        self.requests += 1
+        self.latency += time.perf_counter() - t
+        return result
+
+    async def run(self):
+        """Forms batches of up to `max_batch` images within `max_wait` of the first, then runs them."""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self.queue.get_nowait())
+                    continue
+                except asyncio.QueueEmpty:
+                    pass
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                self.queued.clear()  # wait on an event, not on queue.get(), so a timeout never drops a dequeued item
+                try:
+                    await asyncio.wait_for(self.queued.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+            t = time.perf_counter()
+            try:
+                results = await loop.run_in_executor(self.executor, self.infer, [x[0] for x in batch])
+            except Exception as e:
+                self.batch_errors += 1
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self.batches += 1
+            self.images += len(batch)
+            self.infer_time += time.perf_counter() - t
+            for (_, future), r in zip(batch, results):
+                if not future.done():  # client may have disconnected
+                    future.set_result(r)
+
+    def infer(self, ims):
+        """Runs one batched forward pass on a list of images and returns per-image (n, 6) detections and class names."""
+        results = self.model(ims, size=self.size)
+        return [(pred.cpu().numpy(), results.names) for pred in results.xyxy]
+
+    def metrics(self):
+        """Returns scheduler counters and averages as a dict."""
+        return {
+            "requests_total": self.requests,
+            "request_errors_total": self.request_errors,
+            "batches_total": self.batches,
+            "batch_errors_total": self.batch_errors,
+            "queue_size": self.queue.qsize(),
+            "batch_size_mean": self.images / max(self.batches, 1),
+            "inference_seconds_total": self.infer_time,
+            "request_latency_seconds_mean": self.latency / max(self.requests, 1),
+        }
+
+
+def decode(im_bytes):
+    """Decodes encoded image bytes to an RGB PIL image."""
+    return Image.open(io.BytesIO(im_bytes)).convert("RGB")
+
+
+async def predict(request):
+    """Returns encoded detections for an image POSTed as multipart field 'image' or as the raw request body."""
+    scheduler = request.app["schedulers"].get(request.match_info["model"])
+    if scheduler is None:
+        raise web.HTTPNotFound(text=f"model {request.match_info['model']} not found")
+    if request.content_type.startswith("multipart/"):
+        field = (await request.post()).get("image")
+        if not hasattr(field, "file"):
+            raise web.HTTPBadRequest(text="missing 'image' file field")
+        im_bytes = field.file.read()
+    else:
+        im_bytes = await request.read()
+    try:
+        im = await asyncio.get_running_loop().run_in_executor(request.app["decoder"], decode, im_bytes)
+    except Exception as e:
+        raise web.HTTPBadRequest(text=f"invalid image: {e}") from e
+    pred, names = await scheduler.submit(im)
+    mime = negotiate(request.headers.get("Accept"))
+    return web.Response(body=encode(pred, names, mime), content_type=mime, headers={"Vary": "Accept"})
+
+
+async def health(request):
+    """Returns server status and loaded models."""
+    return web.json_response({"status": "ok", "models": list(request.app["schedulers"])})
+
+
+async def metrics(request):
+    """Returns per-model scheduler metrics in Prometheus text format."""
+    lines = []
+    for name, scheduler in request.app["schedulers"].items():
+        lines += [f'yolov5_{k}{{model="{name}"}} {v}' for k, v in scheduler.metrics().items()]
+    return web.Response(text="\n".join(lines) + "\n", content_type="text/plain")
+
+
+def create_app(models, max_batch=16, max_wait=0.005, size=640, decode_workers=4):
+    """Creates the aiohttp application for a dict of named AutoShape models."""
+    app = web.Application(client_max_size=64 * 1024**2)
+    app["schedulers"] = {k: BatchScheduler(m, max_batch, max_wait, size) for k, m in models.items()}
+    app["decoder"] = ThreadPoolExecutor(max_workers=decode_workers)  # image decoding off the event loop
+
+    async def on_startup(app):
+        for scheduler in app["schedulers"].values():
+            scheduler.start()
+
+    async def on_cleanup(app):
+        for scheduler in app["schedulers"].values():
+            await scheduler.stop()
+        app["decoder"].shutdown(wait=False)
+
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    app.router.add_post(DETECTION_URL, predict)
+    app.router.add_get("/health", health)
+    app.router.add_get("/metrics", metrics)
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Batched asynchronous inference server exposing YOLOv5 models")
+    parser.add_argument("--port", default=5000, type=int, help="port number")
+    parser.add_argument("--model", nargs="+", default=["yolov5s"], help="model(s) to run, i.e. --model yolov5n yolov5s")
+    parser.add_argument("--size", default=640, type=int, help="inference size (pixels)")
+    parser.add_argument("--max-batch", default=16, type=int, help="maximum images per forward pass")
+    parser.add_argument("--max-wait", default=5.0, type=float, help="maximum wait for a batch to fill (ms)")
+    parser.add_argument("--decode-workers", default=4, type=int, help="image decoding threads")
+    opt = parser.parse_args()
+
+    models = {m: torch.hub.load("ultralytics/yolov5", m, force_reload=True, skip_validation=True) for m in opt.model}
+    app = create_app(models, opt.max_batch, opt.max_wait / 1000, opt.size, opt.decode_workers)
+    web.run_app(app, host="0.0.0.0", port=opt.port)
@@ -1022,6 +1022,8 @@ def non_max_suppression(
     """
     Non-Maximum Suppression (NMS) on inference results to reject overlapping detections.
 
+    NumPy `prediction` arrays are handled torch-free by utils.numpy_nms.non_max_suppression().
+
     Returns:
          list of detections, on (n,6) tensor per image [xyxy, conf, cls]
     """
@@ -1030,6 +1032,10 @@ def non_max_suppression(
     assert 0 <= iou_thres <= 1, f"Invalid IoU {iou_thres}, valid values are between 0.0 and 1.0"
     if isinstance(prediction, (list, tuple)):  # YOLOv5 model in validation model, output = (inference_out, loss_out)
         prediction = prediction[0]  # select only inference output
+    if isinstance(prediction, np.ndarray):  # NumPy outputs, i.e. ONNX Runtime, OpenVINO, TFLite
+        from utils.numpy_nms import non_max_suppression as numpy_nms
+
+        return numpy_nms(prediction, conf_thres, iou_thres, classes, agnostic, multi_label, labels, max_det, nm)
 
     device = prediction.device
     mps = "mps" in device.type  # Apple MPS
@@ -1121,6 +1127,127 @@ def non_max_suppression(
     return output
 
 
+def batched_non_max_suppression(
+    prediction,
+    conf_thres=0.25,
+    iou_thres=0.45,
+    classes=None,
+    agnostic=False,
+    multi_label=False,
+    labels=(),
+    max_det=300,
+    nm=0,  # number of masks
+):
+    """
+    Non-Maximum Suppression (NMS) over a whole batch with a single torchvision.ops.nms() call and no per-image loop.
+
+    Drop-in replacement for non_max_suppression() without the wall-clock time limit. Candidates of all images are
+    filtered and expanded together, and boxes are offset by image and class so one NMS call never suppresses across
+    images (or across classes unless `agnostic`). Offsets are applied in float64 to keep IoU exact for large batches.
+
+    Returns:
+         list of detections, on (n,6) tensor per image [xyxy, conf, cls]
+    """
+    # Checks
+    assert 0 <= conf_thres <= 1, f"Invalid Confidence threshold {conf_thres}, valid values are between 0.0 and 1.0"
+    assert 0 <= iou_thres <= 1, f"Invalid IoU {iou_thres}, valid values are between 0.0 and 1.0"
+    if isinstance(prediction, (list, tuple)):  # YOLOv5 model in validation model, output = (inference_out, loss_out)
+        prediction = prediction[0]  # select only inference output
+
+    device = prediction.device
+    if "mps" in device.type:  # MPS not fully supported yet, convert tensors to CPU before NMS
+        prediction = prediction.cpu()
+    bs = prediction.shape[0]  # batch size
+    nc = prediction.shape[2] - nm - 5  # number of classes
+    max_wh = 7680  # (pixels) maximum box width and height
+    max_nms = 30000  # maximum number of boxes per image into NMS
+    multi_label &= nc > 1  # multiple labels per box
+    mi = 5 + nc  # mask start index
+
+    # Candidates of all images, b is the image index of each row
+    b, a = (prediction[..., 4] > conf_thres).nonzero(as_tuple=True)
+    x = prediction[b, a]  # (n, 5 + nc + nm) copy
+
+    # Cat apriori labels if autolabelling
+    if labels and sum(len(lb) for lb in labels):
+        lb = torch.cat([lb for lb in labels if len(lb)], 0).to(x.device)
+        v = torch.zeros((len(lb), nc + nm + 5), device=x.device)
+        v[:, :4] = lb[:, 1:5]  # box
+        v[:, 4] = 1.0  # conf
+        v[range(len(lb)), lb[:, 0].long() + 5] = 1.0  # cls
+        x = torch.cat((x, v), 0)
+        bl = [torch.full((len(lb),), i, dtype=torch.long, device=x.device) for i, lb in enumerate(labels)]
+        b = torch.cat((b, *bl), 0)
+
+    # Compute conf, box and detections matrix nx6 (xyxy, conf, cls)
+    x[:, 5:] *= x[:, 4:5]  # conf = obj_conf * cls_conf
+    box = xywh2xyxy(x[:, :4])  # center_x, center_y, width, height) to (x1, y1, x2, y2)
+    mask = x[:, mi:]  # zero columns if no masks
+    if multi_label:
+        i, j = (x[:, 5:mi] > conf_thres).nonzero(as_tuple=False).T
+        x, b = torch.cat((box[i], x[i, 5 + j, None], j[:, None].float(), mask[i]), 1), b[i]
+    else:  # best class only
+        conf, j = x[:, 5:mi].max(1, keepdim=True)
+        i = conf.view(-1) > conf_thres
+        x, b = torch.cat((box, conf, j.float(), mask), 1)[i], b[i]
+
+    # Filter by class
+    if classes is not None:
+        i = (x[:, 5:6] == torch.tensor(classes, device=x.device)).any(1)
+        x, b = x[i], b[i]
+    if not x.shape[0]:  # no boxes
+        return [torch.zeros((0, 6 + nm), device=device) for _ in range(bs)]
+
+    def rank(x, b, k):
+        """Sorts rows by image then descending conf and keeps the top `k` rows of each image."""
+        i = torch.argsort(b.double() * 2 - x[:, 4].double())  # conf in [0, 1] so images never interleave
+        x, b = x[i], b[i]
+        n = torch.bincount(b, minlength=bs)
+        r = torch.arange(len(b), device=b.device) - (n.cumsum(0) - n)[b]  # rank within image
+        return x[r < k], b[r < k]
+
+    # Batched NMS keyed by image and class
+    x, b = rank(x, b, max_nms)
+    c = b.double() * (1 if agnostic else nc + 1) + (0 if agnostic else x[:, 5].double())  # group index
+    boxes = x[:, :4].double() + c[:, None] * (max_wh + 1)  # boxes offset by group
+    i = torchvision.ops.nms(boxes, x[:, 4].double(), iou_thres)  # NMS
+    x, b = rank(x[i], b[i], max_det)  # limit detections per image
+    x = x.to(device)
+    return list(x.split(torch.bincount(b, minlength=bs).tolist()))
+
+
+def profile_nms(batch_sizes=(1, 4, 16, 64), ncs=(80, 1000), na=25200, n=10, device=None):
+    """
+    Profiles batched_non_max_suppression() against non_max_suppression() on random predictions, checking parity.
+
+    Usage:
+        from utils.general import profile_nms
+        profile_nms(device="cuda:0")
+    """
+    device = torch.device(device or ("cuda:0" if torch.cuda.is_available() else "cpu"))
+    LOGGER.info(f"{'bs':>6s}{'nc':>8s}{'boxes':>10s}{'loop (ms)':>12s}{'batched (ms)':>14s}{'speedup':>10s}{'ok':>5s}")
+    results = []
+    for nc in ncs:
+        p = torch.rand(1, na, 5 + nc, device=device)
+        p[..., :2] *= 640  # xy
+        p[..., 2:4] = p[..., 2:4] * 120 + 4  # wh
+        p[..., 4] **= 4  # objectness, ~30% above conf_thres=0.25
+        for bs in batch_sizes:
+            x = p.expand(bs, -1, -1)  # same image repeated, no memory cost
+            dt = Profile(device=device), Profile(device=device)
+            for _ in range(n):
+                with dt[0]:
+                    y0 = non_max_suppression(x, max_det=1000)
+                with dt[1]:
+                    y1 = batched_non_max_suppression(x, max_det=1000)
+            ok = all(len(a) == len(b) and torch.allclose(a[:, 4].sort()[0], b[:, 4].sort()[0]) for a, b in zip(y0, y1))
+            t = [d.t / n * 1e3 for d in dt]
+            s = f"{bs:>6d}{nc:>8d}{sum(len(y) for y in y1):>10d}{t[0]:>12.2f}{t[1]:>14.2f}{t[0] / t[1]:>9.1f}x"
+            LOGGER.info(f"{s}{ok!s:>5s}")
+            results.append([bs, nc, *t, ok])
+    return results
+
+
 def strip_optimizer(f="best.pt", s=""):
     """
     Strips optimizer and optionally saves checkpoint to finalize training; arguments are file path 'f' and save path
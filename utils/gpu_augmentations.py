@@ -0,0 +1,231 @@
+# Ultralytics YOLOv5 🚀, AGPL-3.0 license
+"""GPU augmentation utils: batched mosaic, perspective, MixUp, HSV and flips on the training device."""
+
+import math
+import time
+
+import torch
+import torch.nn.functional as F
+import yaml
+
+from utils.dataloaders import create_dataloader
+from utils.general import LOGGER, ROOT, check_dataset, xyxy2xywhn
+
+CPU_AUGMENT_HYPS = (  # hyps applied by GPUAugment instead of the dataloader workers
+    "mosaic",
+    "mixup",
+    "degrees",
+    "translate",
+    "scale",
+    "shear",
+    "perspective",
+    "hsv_h",
+    "hsv_s",
+    "hsv_v",
+    "flipud",
+    "fliplr",
+)
+
+
+def rgb_to_hsv(x, eps=1e-8):
+    """Converts (b, 3, h, w) RGB images in 0-1 to HSV in 0-1."""
+    r, g, b = x.unbind(1)
+    maxc, argmax = x.max(1)
+    delta = maxc - x.min(1)[0]
+    d = delta.clamp(min=eps)
+    h = torch.where(argmax == 0, ((g - b) / d) % 6, torch.where(argmax == 1, (b - r) / d + 2, (r - g) / d + 4)) / 6
+    h = torch.where(delta > 0, h, torch.zeros_like(h))
+    s = torch.where(maxc > 0, delta / maxc.clamp(min=eps), torch.zeros_like(maxc))
+    return torch.stack((h, s, maxc), 1)
+
+
+def hsv_to_rgb(x):
+    """Converts (b, 3, h, w) HSV images in 0-1 to RGB in 0-1."""
+    h, s, v = x.unbind(1)
+    i = torch.floor(h * 6)
+    f = h * 6 - i
+    p, q, t = v * (1 - s), v * (1 - s * f), v * (1 - s * (1 - f))
+    i = (i.long() % 6)[:, None]
+    r = torch.stack((v, q, p, p, t, v), 1).gather(1, i)
+    g = torch.stack((t, v, v, q, p, p), 1).gather(1, i)
+    b = torch.stack((p, p, t, v, v, q), 1).gather(1, i)
+    return torch.cat((r, g, b), 1)
+
+
+class GPUAugment:
+    """
+    Applies the YOLOv5 train augmentations to a whole collated batch on its device.
+
+    Mosaic, perspective, MixUp, HSV and flips follow load_mosaic(), random_perspective(), mixup(), augment_hsv() and
+    the flips in LoadImagesAndLabels.__getitem__(), with all randomness drawn per image. Mosaic and the affine warp are
+    fused into one inverse mapping sampled with F.grid_sample(), and labels are transformed as tensors. Dataloader
+    workers only decode, resize and letterbox to a square `img_size`, see `cpu_hyp()`.
+
+    Usage:
+        gpu_augment = GPUAugment(hyp, imgsz)
+        loader = create_dataloader(..., hyp=GPUAugment.cpu_hyp(hyp), augment=True, rect=False)
+        imgs, targets = gpu_augment(imgs.to(device), targets.to(device))  # float 0-1 images
+    """
+
+    def __init__(self, hyp, img_size=640, fill=114):
+        """Initializes with a hyperparameter dict, the square training image size and the padding gray level."""
+        self.hyp = hyp
+        self.s = img_size
+        self.fill = fill / 255
+
+    @staticmethod
+    def cpu_hyp(hyp):
+        """Returns a copy of `hyp` with the augmentations done by GPUAugment disabled for the dataloader workers."""
+        return {**hyp, **{k: 0.0 for k in CPU_AUGMENT_HYPS}}
+
+    def uniform(self, n, a, b, device):
+        """Returns `n` samples from U(a, b) on `device`."""
+        return torch.rand(n, device=device) * (b - a) + a
+
+    def affine(self, cs, device):
+        """Returns (b, 3, 3) canvas-to-output matrices and scales for canvas sizes `cs`, as in random_perspective()."""
+        hyp, n, s = self.hyp, len(cs), self.s
+        eye = torch.eye(3, device=device).repeat(n, 1, 1)
+        C, P, R, S, T = eye.clone(), eye.clone(), eye.clone(), eye.clone(), eye.clone()
+        C[:, 0, 2] = C[:, 1, 2] = -cs / 2  # center
+        P[:, 2, 0] = self.uniform(n, -hyp["perspective"], hyp["perspective"], device)  # x perspective (about y)
+        P[:, 2, 1] = self.uniform(n, -hyp["perspective"], hyp["perspective"], device)  # y perspective (about x)
+        a = self.uniform(n, -hyp["degrees"], hyp["degrees"], device) * math.pi / 180  # rotation
+        sc = self.uniform(n, 1 - hyp["scale"], 1 + hyp["scale"], device)  # scale
+        R[:, 0, 0] = R[:, 1, 1] = sc * torch.cos(a)  # cv2.getRotationMatrix2D(angle=a, center=(0, 0), scale=sc)
+        R[:, 0, 1], R[:, 1, 0] = sc * torch.sin(a), -sc * torch.sin(a)
+        S[:, 0, 1] = torch.tan(self.uniform(n, -hyp["shear"], hyp["shear"], device) * math.pi / 180)  # x shear
+        S[:, 1, 0] = torch.tan(self.uniform(n, -hyp["shear"], hyp["shear"], device) * math.pi / 180)  # y shear
+        T[:, 0, 2] = self.uniform(n, 0.5 - hyp["translate"], 0.5 + hyp["translate"], device) * s  # x translation
+        T[:, 1, 2] = self.uniform(n, 0.5 - hyp["translate"], 0.5 + hyp["translate"], device) * s  # y translation
+        return T @ S @ R @ P @ C, sc
+
+    def __call__(self, imgs, targets):
+        """Augments uint8 or 0-1 (b, 3, s, s) `imgs` and (n, 6) [image, class, xywhn] `targets`, returns 0-1 images."""
+        hyp, s, device = self.hyp, self.s, imgs.device
+        b = imgs.shape[0]
+        assert tuple(imgs.shape[2:]) == (s, s), f"GPUAugment expects square {s}x{s} images, got {tuple(imgs.shape)}"
+        x = imgs.float() / 255 if imgs.dtype == torch.uint8 else imgs.float()  # DevicePrefetcher batches are 0.0-1.0
+        t = targets.to(device).float()
+        ar = torch.arange(b, device=device)
+
+        # Mosaic tiles: source image and top-left corner in the canvas of each of 4 tiles per output image
+        mosaic = torch.rand(b, device=device) < hyp["mosaic"]
+        src = torch.cat((ar[:, None], torch.randint(0, b, (b, 3), device=device)), 1)  # (b, 4)
+        valid = torch.ones((b, 4), dtype=torch.bool, device=device)
+        valid[~mosaic, 1:] = False
+        cs = torch.where(mosaic, 2.0 * s, float(s))  # canvas size
+        xc = torch.where(mosaic, self.uniform(b, s / 2, 3 * s / 2, device), float(s))  # mosaic center x
+        yc = torch.where(mosaic, self.uniform(b, s / 2, 3 * s / 2, device), float(s))  # mosaic center y
+        ox = torch.stack((xc - s, xc, xc - s, xc), 1)  # (b, 4) tile x offsets: top-left, top-right, bottom-left, ...
+        oy = torch.stack((yc - s, yc - s, yc, yc), 1)
+        M, sc = self.affine(cs, device)
+
+        # Images: inverse-map output pixels to the canvas, then sample each tile
+        v, u = torch.meshgrid(torch.arange(s, device=device), torch.arange(s, device=device), indexing="ij")
+        q = torch.linalg.inv(M) @ torch.stack((u, v, torch.ones_like(u)), 0).view(3, -1).float()  # (b, 3, s * s)
+        X, Y = q[:, 0] / q[:, 2], q[:, 1] / q[:, 2]  # canvas coordinates
+        inside = (X >= -0.5) & (X < cs[:, None] - 0.5) & (Y >= -0.5) & (Y < cs[:, None] - 0.5)
+        out = torch.full_like(x, self.fill)
+        for k in range(4):
+            lx, ly = X - ox[:, k, None], Y - oy[:, k, None]  # tile pixel coordinates
+            m = valid[:, k, None] & inside & (lx >= -0.5) & (lx < s - 0.5) & (ly >= -0.5) & (ly < s - 0.5)
+            grid = torch.stack(((2 * lx + 1) / s - 1, (2 * ly + 1) / s - 1), -1).view(b, s, s, 2)
+            y = F.grid_sample(x[src[:, k]], grid, mode="bilinear", padding_mode="border", align_corners=False)
+            out = torch.where(m.view(b, 1, s, s), y, out)
+
+        # Labels: gather the labels of every valid tile into its output image
+        t = t[t[:, 0].argsort(stable=True)]
+        n = torch.bincount(t[:, 0].long(), minlength=b)
+        i, k = valid.nonzero(as_tuple=True)  # output image, tile
+        nk = n[src[i, k]]
+        pair = torch.repeat_interleave(torch.arange(len(i), device=device), nk)
+        rows = (n.cumsum(0) - n)[src[i, k]][pair] + torch.arange(len(pair), device=device) - (nk.cumsum(0) - nk)[pair]
+        i, k, lb = i[pair], k[pair], t[rows]
+        xy = lb[:, 2:4] * s + torch.stack((ox[i, k], oy[i, k]), 1)  # tile to canvas, center
+        box = torch.cat((xy - lb[:, 4:6] * s / 2, xy + lb[:, 4:6] * s / 2), 1)  # canvas xyxy
+        box = torch.minimum(box.clamp(min=0), cs[i, None])  # clip to canvas, as in load_mosaic()
+        xy = torch.cat((box[:, [0, 1]], box[:, [2, 3]], box[:, [0, 3]], box[:, [2, 1]]), 1).view(-1, 4, 2)  # corners
+        xy = torch.cat((xy, torch.ones_like(xy[..., :1])), 2) @ M[i].transpose(1, 2)  # transform
+        xy = xy[..., :2] / xy[..., 2:3]  # perspective rescale or affine
+        new = torch.cat((xy.min(1)[0], xy.max(1)[0]), 1).clamp(0, s)  # output xyxy, clipped
+        w1, h1 = (box[:, 2] - box[:, 0]) * sc[i], (box[:, 3] - box[:, 1]) * sc[i]
+        w2, h2 = new[:, 2] - new[:, 0], new[:, 3] - new[:, 1]
+        ar2 = torch.maximum(w2 / (h2 + 1e-16), h2 / (w2 + 1e-16))  # aspect ratio
+        j = (w2 > 2) & (h2 > 2) & (w2 * h2 / (w1 * h1 + 1e-16) > 0.1) & (ar2 < 100)  # box_candidates()
+        i, lb, new = i[j], lb[j], new[j]
+
+        # MixUp with the previous image of the batch
+        mix = mosaic & (torch.rand(b, device=device) < hyp["mixup"])
+        if mix.any():
+            r = torch.distributions.Beta(32.0, 32.0).sample((b,)).to(device)[:, None, None, None]  # mixup ratio
+            other = (ar - 1) % b
+            out = torch.where(mix[:, None, None, None], out * r + out[other] * (1 - r), out)
+            j = mix[(i + 1) % b]  # labels of images mixed into the next image
+            i, lb, new = torch.cat((i, (i[j] + 1) % b)), torch.cat((lb, lb[j])), torch.cat((new, new[j]))
+
+        # HSV color-space
+        if hyp["hsv_h"] or hyp["hsv_s"] or hyp["hsv_v"]:
+            gain = torch.tensor([hyp["hsv_h"], hyp["hsv_s"], hyp["hsv_v"]], device=device)
+            g = (torch.rand(b, 3, device=device) * 2 - 1) * gain + 1  # random gains
+            hsv = rgb_to_hsv(out)
+            h, sat, val = hsv.unbind(1)
+            h = (h * g[:, 0, None, None]) % 1
+            sat = (sat * g[:, 1, None, None]).clamp(0, 1)
+            val = (val * g[:, 2, None, None]).clamp(0, 1)
+            out = hsv_to_rgb(torch.stack((h, sat, val), 1))
+
+        # Flips
+        ud, lr = torch.rand(b, device=device) < hyp["flipud"], torch.rand(b, device=device) < hyp["fliplr"]
+        out = torch.where(ud[:, None, None, None], out.flip(2), out)
+        out = torch.where(lr[:, None, None, None], out.flip(3), out)
+        new = torch.where(ud[i, None], torch.stack((new[:, 0], s - new[:, 3], new[:, 2], s - new[:, 1]), 1), new)
+        new = torch.where(lr[i, None], torch.stack((s - new[:, 2], new[:, 1], s - new[:, 0], new[:, 3]), 1), new)
+
+        labels = torch.cat((i[:, None].float(), lb[:, 1:2], xyxy2xywhn(new, w=s, h=s, clip=True, eps=1e-3)), 1)
+        return out, labels[labels[:, 0].argsort(stable=True)]
+
+
+def profile_dataloader(
+    data=ROOT / "data/coco128.yaml",
+    hyp=ROOT / "data/hyps/hyp.scratch-low.yaml",
+    imgsz=640,
+    batch_size=16,
+    workers=(2, 4, 8),
+    n=50,
+    device=None,
+):
+    """
+    Profiles training throughput in images/s of CPU augmentation versus GPUAugment for several dataloader workers.
+
+    Usage:
+        from utils.gpu_augmentations import profile_dataloader
+        profile_dataloader(data="data/coco.yaml", workers=(2, 4, 8), device="cuda:0")
+    """
+    device = torch.device(device or ("cuda:0" if torch.cuda.is_available() else "cpu"))
+    path = check_dataset(data)["train"]
+    with open(hyp, errors="ignore") as f:
+        hyp = yaml.safe_load(f)
+    gpu_augment = GPUAugment(hyp, imgsz)
+    LOGGER.info(f"{'workers':>8s}{'CPU aug (img/s)':>18s}{'GPU aug (img/s)':>18s}")
+    results = []
+    for w in workers:
+        r = []
+        for aug in None, gpu_augment:
+            loader = create_dataloader(
+                path, imgsz, batch_size, 32, hyp=aug.cpu_hyp(hyp) if aug else hyp, augment=True, workers=w, shuffle=True
+            )[0]
+            it, seen = iter(loader), 0
+            next(it)  # start workers
+            t = time.time()
+            for _ in range(n):
+                imgs, targets = next(it)[:2]
+                imgs = imgs.to(device, non_blocking=True)
+                imgs = aug(imgs, targets.to(device))[0] if aug else imgs.float() / 255
+                seen += len(imgs)
+            if device.type == "cuda":
+                torch.cuda.synchronize(device)
+            r.append(seen / (time.time() - t))
+        LOGGER.info(f"{w:>8d}{r[0]:>18.1f}{r[1]:>18.1f}")
+        results.append([w, *r])
+    return results
@@ -3,7 +3,9 @@
 
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
 
+from utils.general import LOGGER
 from utils.metrics import bbox_iou
 from utils.torch_utils import de_parallel
 
@@ -107,10 +109,13 @@ class ComputeLoss:
     """Computes the total loss for YOLOv5 model predictions, including classification, box, and objectness losses."""
 
     sort_obj_iou = False
+    batched_targets = False  # match targets for all layers in one pass with build_targets_batched()
 
     # Compute losses
-    def __init__(self, model, autobalance=False):
-        """Initializes ComputeLoss with model and autobalance option, autobalances losses if True."""
+    def __init__(self, model, autobalance=False, fused=False):
+        """Initializes ComputeLoss with model and autobalance option, autobalances losses if True; `fused` selects
+        fused_loss().
+        """
         device = next(model.parameters()).device  # get model device
         h = model.hyp  # hyperparameters
 
@@ -135,13 +140,23 @@ class ComputeLoss:
         self.nl = m.nl  # number of layers
         self.anchors = m.anchors
         self.device = device
+        self.off = torch.tensor([[0, 0], [1, 0], [0, 1], [-1, 0], [0, -1]], device=device).float()  # j,k,l,m offsets
+        self.grids = {}  # layer shapes: (nl, 2) grid xy gains
+        self.fused = fused and g == 0  # focal loss needs dense targets
+        if fused and g > 0:
+            LOGGER.warning("WARNING ⚠️ fused loss does not support focal loss (fl_gamma > 0), using default loss")
+        self.pw = h["cls_pw"], h["obj_pw"]  # BCE positive weights
+        self.balance_t = None  # autobalance weights on device, created on the first fused step
 
     def __call__(self, p, targets):  # predictions, targets
         """Performs forward pass, calculating class, box, and object loss for given predictions and targets."""
+        if self.fused:
+            return self.fused_loss(p, targets)
         lcls = torch.zeros(1, device=self.device)  # class loss
         lbox = torch.zeros(1, device=self.device)  # box loss
         lobj = torch.zeros(1, device=self.device)  # object loss
-        tcls, tbox, indices, anchors = self.build_targets(p, targets)  # targets
+        build_targets = self.build_targets_batched if self.batched_targets else self.build_targets
+        tcls, tbox, indices, anchors = build_targets(p, targets)  # targets
 
         # Losses
         for i, pi in enumerate(p):  # layer index, layer predictions
@@ -193,6 +208,69 @@ class ComputeLoss:
 
         return (lbox + lobj + lcls) * bs, torch.cat((lbox, lobj, lcls)).detach()
 
+    def fused_loss(self, p, targets):
+        """Computes the same loss as __call__() from sparse target indices, without dense targets.
+
+        BCE with logits x, target y and positive weight w is w * y * softplus(-x) + (1 - y) * softplus(x), so with
+        mostly-constant targets the dense loss is a softplus() sum plus a correction at target cells only. Duplicate
+        target cells keep the last write, as the tobj[b, a, gj, gi] assignment does. Autobalance weights stay on device.
+        Target matching in build_targets_batched() still syncs with the host on nonzero() and the per-layer split sizes;
+        the loss itself adds no further syncs.
+        """
+        if self.balance_t is None:
+            self.balance_t = torch.tensor(self.balance, device=self.device)
+        cpw, opw = self.pw
+        tcls, tbox, indices, anchors = self.build_targets_batched(p, targets)  # targets
+        lbox, lobj, lcls, objs = [], [], [], []
+        for i, pi in enumerate(p):  # layer index, layer predictions
+            b, a, gj, gi = indices[i]  # image, anchor, gridy, gridx
+            pobj = pi[..., 4]
+            obji = F.softplus(pobj).sum()  # BCE of all-zero targets
+            if b.shape[0]:
+                pxy, pwh, ps, pcls = pi[b, a, gj, gi].split((2, 2, 1, self.nc), 1)  # target-subset of predictions
+
+                # Regression
+                pxy = pxy.sigmoid() * 2 - 0.5
+                pwh = (pwh.sigmoid() * 2) ** 2 * anchors[i]
+                iou = bbox_iou(torch.cat((pxy, pwh), 1), tbox[i], CIoU=True).squeeze(1)  # iou(prediction, target)
+                lbox.append((1.0 - iou).mean())  # iou loss
+
+                # Objectness, correction at the last write of each target cell
+                iou = iou.detach().clamp(0).type(pi.dtype)
+                idx = ((b * self.na + a) * pi.shape[2] + gj) * pi.shape[3] + gi
+                if self.sort_obj_iou:
+                    j = iou.argsort()
+                    idx, iou, ps = idx[j], iou[j], ps[j]
+                if self.gr < 1:
+                    iou = (1.0 - self.gr) + self.gr * iou
+                idx, j = idx.sort(stable=True)
+                last = torch.ones_like(idx, dtype=torch.bool)
+                last[:-1] = idx[1:] != idx[:-1]
+                x, y = ps.squeeze(1)[j[last]], iou[j[last]]
+                obji = obji + (y * (opw * F.softplus(-x) - F.softplus(x))).sum()
+
+                # Classification, targets self.cn except self.cp at the target class
+                if self.nc > 1:  # cls loss (only if multiple classes)
+                    x = pcls.gather(1, tcls[i][:, None])
+                    d = self.cp - self.cn
+                    loss = (self.cn * cpw * F.softplus(-pcls) + (1 - self.cn) * F.softplus(pcls)).sum()
+                    loss = loss + (d * (cpw * F.softplus(-x) - F.softplus(x))).sum()
+                    lcls.append(loss / pcls.numel())  # BCE
+            obji = obji / pobj.numel()
+            lobj.append(obji * self.balance_t[i])  # obj loss
+            objs.append(obji.detach())
+
+        if self.autobalance:  # out of place, balance_t[i] is saved for backward
+            balance = self.balance_t * 0.9999 + 0.0001 / torch.stack(objs)
+            self.balance_t = balance / balance[self.ssi]
+        zero = pi.new_zeros(())
+        lbox = sum(lbox, zero)[None] * self.hyp["box"]
+        lobj = sum(lobj, zero)[None] * self.hyp["obj"]
+        lcls = sum(lcls, zero)[None] * self.hyp["cls"]
+        bs = p[0].shape[0]  # batch size
+
+        return (lbox + lobj + lcls) * bs, torch.cat((lbox, lobj, lcls)).detach()
+
     def build_targets(self, p, targets):
         """Prepares model targets from input targets (image,class,x,y,w,h) for loss computation, returning class, box,
         indices, and anchors.
@@ -257,3 +335,133 @@ class ComputeLoss:
             tcls.append(c)  # class
 
         return tcls, tbox, indices, anch
+
+    def build_targets_batched(self, p, targets):
+        """Prepares the same class, box, indices and anchors as build_targets() with a single pass over all layers.
+
+        Anchor matching and neighbour-cell offsets are evaluated on one (nl, 5, na, nt) mask built from cached constant
+        tensors, replacing the per-layer loop, target repeats and device allocations.
+        """
+        nl, g = self.nl, 0.5  # number of layers, offset bias
+        shapes = tuple(tuple(pi.shape[2:4]) for pi in p)
+        gain = self.grids.get(shapes)
+        if gain is None:  # (nl, 2) grid wh, cached per input size
+            gain = self.grids[shapes] = torch.tensor([(w, h) for h, w in shapes], device=self.device).float()
+
+        # Matches (nl, na, nt)
+        gxy = targets[:, 2:4] * gain[:, None]  # (nl, nt, 2) grid xy
+        gwh = targets[:, 4:6] * gain[:, None]  # (nl, nt, 2) grid wh
+        r = gwh[:, None] / self.anchors[:, :, None]  # (nl, na, nt, 2) wh ratio
+        match = torch.max(r, 1 / r).max(3)[0] < self.hyp["anchor_t"]
+
+        # Offsets (5, nl, nt): centre cell plus the two nearest neighbour cells
+        gxi = gain[:, None] - gxy  # inverse
+        left, top = ((gxy % 1 < g) & (gxy > 1)).unbind(2)
+        right, bottom = ((gxi % 1 < g) & (gxi > 1)).unbind(2)
+        cells = torch.stack((torch.ones_like(left), left, top, right, bottom))
+
+        # Select, in build_targets() order per layer: offset, anchor, target
+        li, o, a, n = (match[:, None] & cells.transpose(0, 1)[:, :, None]).nonzero().T
+        bc, xy, wh = targets[n, :2].long(), gxy[li, n], gwh[li, n]
+        gij = (xy - self.off[o] * g).long()
+        gij = torch.minimum(gij.clamp_(0), gain[li].long() - 1)  # clamp to grid
+        gi, gj = gij.T  # grid indices
+        tbox = torch.cat((xy - gij, wh), 1)
+        anch = self.anchors[li, a]
+
+        # Split per layer
+        counts = torch.bincount(li, minlength=nl).tolist()
+        b, c = bc.T
+        indices = list(zip(*(x.split(counts) for x in (b, a, gj, gi))))
+        return list(c.split(counts)), list(tbox.split(counts)), indices, list(anch.split(counts))
+
+
+def _profile_inputs(cfg, batch_size, imgsz, device):
+    """Returns model `cfg` with default hyps and zero predictions for profile_*() benchmarks."""
+    import yaml
+
+    from models.yolo import Model
+    from utils.general import ROOT
+    from utils.torch_utils import select_device
+
+    device = select_device("" if device is None else device)
+    with open(ROOT / "data/hyps/hyp.scratch-low.yaml", errors="ignore") as f:
+        hyp = yaml.safe_load(f)
+    model = Model(ROOT / "models" / cfg).to(device)
+    model.hyp = hyp
+    m = de_parallel(model).model[-1]  # Detect()
+    p = [torch.zeros((batch_size, m.na, imgsz // int(s), imgsz // int(s), m.no), device=device) for s in m.stride]
+    return model, p
+
+
+def _random_targets(nt, batch_size, nc, device):
+    """Returns `nt` random (image, class, x, y, w, h) targets for profile_*() benchmarks."""
+    targets = torch.rand((nt, 6), device=device)
+    targets[:, 0] = torch.randint(0, batch_size, (nt,), device=device)
+    targets[:, 1] = torch.randint(0, nc, (nt,), device=device)
+    targets[:, 4:] *= 0.3  # wh
+    return targets
+
+
+def profile_build_targets(cfg="yolov5s.yaml", nts=(0, 100, 1000, 10000), batch_size=16, imgsz=640, n=100, device=None):
+    """
+    Checks build_targets_batched() against build_targets() and times both for increasing target counts.
+
+    Usage:
+        from utils.loss import profile_build_targets
+        profile_build_targets(nts=(100, 1000, 10000), device="cuda:0")
+    """
+    from utils.general import Profile
+
+    model, p = _profile_inputs(cfg, batch_size, imgsz, device)
+    loss = ComputeLoss(model)
+    LOGGER.info(f"{'targets':>10s}{'loop (ms)':>12s}{'batched (ms)':>14s}{'speedup':>10s}")
+    results = []
+    for nt in nts:
+        targets = _random_targets(nt, batch_size, loss.nc, loss.device)
+        a, b = loss.build_targets(p, targets), loss.build_targets_batched(p, targets)
+        for x, y in zip(a, b):  # tcls, tbox, indices, anch
+            for xi, yi in zip(x, y):
+                assert all(map(torch.equal, xi, yi)) if isinstance(xi, tuple) else torch.allclose(xi, yi), "mismatch"
+        dt = Profile(device=loss.device), Profile(device=loss.device)
+        for _ in range(n):
+            with dt[0]:
+                loss.build_targets(p, targets)
+            with dt[1]:
+                loss.build_targets_batched(p, targets)
+        t = [x.t / n * 1e3 for x in dt]
+        LOGGER.info(f"{nt:>10d}{t[0]:>12.3f}{t[1]:>14.3f}{t[0] / t[1]:>9.2f}x")
+        results.append([nt, *t])
+    return results
+
+
+def profile_loss(cfg="yolov5s.yaml", nts=(0, 100, 1000, 10000), batch_size=16, imgsz=640, n=20, device=None):
+    """
+    Checks fused_loss() against the default loss and its gradients, and times forward and backward of both.
+
+    Usage:
+        from utils.loss import profile_loss
+        profile_loss(nts=(100, 1000, 10000), device="cuda:0")
+    """
+    from utils.general import Profile
+
+    model, p = _profile_inputs(cfg, batch_size, imgsz, device)
+    loss, fused = ComputeLoss(model, autobalance=True), ComputeLoss(model, autobalance=True, fused=True)
+    LOGGER.info(f"{'targets':>10s}{'default (ms)':>14s}{'fused (ms)':>12s}{'speedup':>10s}")
+    results = []
+    for nt in nts:
+        targets = _random_targets(nt, batch_size, loss.nc, loss.device)
+        p = [torch.randn_like(x).requires_grad_() for x in p]
+        (x0, i0), (x1, i1) = loss(p, targets), fused(p, targets)
+        g0, g1 = torch.autograd.grad(x0, p), torch.autograd.grad(x1, p)
+        assert torch.allclose(x0, x1, rtol=1e-4) and torch.allclose(i0, i1, rtol=1e-4), f"loss mismatch {i0} {i1}"
+        assert all(torch.allclose(a, b, rtol=1e-3, atol=1e-7) for a, b in zip(g0, g1)), "gradient mismatch"
+        dt = Profile(device=loss.device), Profile(device=loss.device)
+        for _ in range(n):
+            for f, d in zip((loss, fused), dt):
+                with d:
+                    f(p, targets)[0].backward()
+        t = [x.t / n * 1e3 for x in dt]
+        LOGGER.info(f"{nt:>10d}{t[0]:>14.3f}{t[1]:>12.3f}{t[0] / t[1]:>9.2f}x")
+        results.append([nt, *t])
+    return results
@@ -77,6 +77,13 @@ def ap_per_class(tp, conf, pred_cls, target_cls, plot=False, save_dir=".", names
             if plot and j == 0:
                 py.append(np.interp(px, mrec, mpre))  # precision at mAP@0.5
 
+    return pr_summary(px, py, p, r, ap, nt, unique_classes, plot, save_dir, names, eps, prefix)
+
+
+def pr_summary(px, py, p, r, ap, nt, unique_classes, plot=False, save_dir=".", names=(), eps=1e-16, prefix=""):
+    """Returns ap_per_class() outputs at the max mean F1 confidence from per-class P, R and AP curves, optionally
+    plotting them.
+    """
     # Compute F1 (harmonic mean of precision and recall)
     f1 = 2 * p * r / (p + r + eps)
     names = [v for k, v in names.items() if k in unique_classes]  # list: only classes that have data
@@ -121,6 +128,99 @@ def compute_ap(recall, precision):
     return ap, mpre, mrec
 
 
+class MetricAccumulator:
+    """
+    Streaming, mergeable alternative to collecting per-image stats for ap_per_class().
+
+    Predictions are counted per class in `bins` fixed confidence bins, with true positives per IoU threshold, so memory
+    is O(nc * bins * niou) on device however many images are evaluated. Accumulators from DDP ranks or sharded jobs are
+    combined with merge(), and compute() or summary() can be called at any point. Within a bin the ranking of
+    predictions is lost, which with the default 1000 bins changes AP only in the third or fourth decimal.
+
+    Usage:
+        metrics = MetricAccumulator(nc, niou=10, device=device)
+        metrics.update(correct, pred[:, 4], pred[:, 5], labels[:, 0])  # per image, same inputs as val.py stats
+        mp, mr, map50, map = metrics.summary()
+        tp, fp, p, r, f1, ap, ap_class = metrics.merge(other).compute()
+    """
+
+    def __init__(self, nc, niou=10, bins=1000, device=None):
+        """Initializes zero counts for `nc` classes, `niou` IoU thresholds and `bins` confidence bins on `device`."""
+        self.nc, self.niou, self.bins = nc, niou, bins
+        self.n = torch.zeros(nc * bins, dtype=torch.long, device=device)  # predictions per (class, bin)
+        self.tp = torch.zeros((nc * bins, niou), dtype=torch.long, device=device)  # true positives per (class, bin)
+        self.nt = torch.zeros(nc, dtype=torch.long, device=device)  # labels per class
+
+    def update(self, correct, conf, pred_cls, target_cls):
+        """
+        Adds the predictions and labels of one or more images, the (correct, conf, pcls, tcls) stats of val.py.
+
+        Predictions of classes outside 0..nc-1, i.e. from a model trained on more classes, are dropped: they have no
+        labels, so ap_per_class() would not report them either. Labels outside 0..nc-1 raise an AssertionError.
+        """
+        k = (pred_cls >= 0) & (pred_cls < self.nc)
+        correct, conf, pred_cls = correct[k], conf[k], pred_cls[k]
+        i = pred_cls.long() * self.bins + (conf * self.bins).long().clamp_(0, self.bins - 1)
+        self.n.index_add_(0, i, torch.ones_like(i))
+        self.tp.index_add_(0, i, correct.long())
+        nt = torch.bincount(target_cls.long(), minlength=self.nc)
+        assert len(nt) == self.nc, f"label class {len(nt) - 1} exceeds dataset nc={self.nc}, check --data"
+        self.nt += nt
+
+    def merge(self, other):
+        """Adds the counts of another MetricAccumulator, e.g. from another DDP rank or validation shard, and returns
+        self.
+        """
+        assert (self.nc, self.niou, self.bins) == (other.nc, other.niou, other.bins), "incompatible accumulators"
+        self.n += other.n.to(self.n.device)
+        self.tp += other.tp.to(self.tp.device)
+        self.nt += other.nt.to(self.nt.device)
+        return self
+
+    def compute(self, plot=False, save_dir=".", names=(), eps=1e-16, prefix=""):
+        """Returns tp, fp, p, r, f1, ap and ap_class as ap_per_class() does, from the binned counts."""
+        bins = self.bins
+        n = self.n.view(self.nc, bins).flip(1).cpu().numpy()  # decreasing confidence
+        tp = self.tp.view(self.nc, bins, self.niou).flip(1).cpu().numpy()
+        conf = np.arange(bins - 1, -1, -1) / bins  # lower bin edges
+        unique_classes = np.nonzero(self.nt.cpu().numpy())[0]
+        nt = self.nt.cpu().numpy()[unique_classes]
+
+        # Create Precision-Recall curve and compute AP for each class
+        px, py = np.linspace(0, 1, 1000), []  # for plotting
+        nc = len(unique_classes)  # number of classes with labels
+        ap, p, r = np.zeros((nc, self.niou)), np.zeros((nc, 1000)), np.zeros((nc, 1000))
+        for ci, c in enumerate(unique_classes):
+            k = n[c] > 0  # non-empty bins
+            if not k.any():
+                continue
+
+            # Accumulate FPs and TPs
+            tpc = tp[c, k].cumsum(0)
+            fpc = (n[c, k, None] - tp[c, k]).cumsum(0)
+
+            # Recall and precision
+            recall = tpc / (nt[ci] + eps)  # recall curve
+            precision = tpc / (tpc + fpc)  # precision curve
+            r[ci] = np.interp(-px, -conf[k], recall[:, 0], left=0)  # negative x, xp because xp decreases
+            p[ci] = np.interp(-px, -conf[k], precision[:, 0], left=1)  # p at pr_score
+
+            # AP from recall-precision curve
+            for j in range(self.niou):
+                ap[ci, j], mpre, mrec = compute_ap(recall[:, j], precision[:, j])
+                if plot and j == 0:
+                    py.append(np.interp(px, mrec, mpre))  # precision at mAP@0.5
+
+        return pr_summary(px, py, p, r, ap, nt, unique_classes, plot, save_dir, names, eps, prefix)
+
+    def summary(self):
+        """Returns the current mean precision, recall, mAP@0.5 and mAP@0.5:0.95, e.g. for intermediate reporting."""
+        if not self.tp.any():
+            return 0.0, 0.0, 0.0, 0.0
+        _, _, p, r, _, ap, _ = self.compute()
+        return p.mean(), r.mean(), ap[:, 0].mean(), ap.mean()
+
+
 class ConfusionMatrix:
     """Generates and visualizes a confusion matrix for evaluating object detection classification performance."""
 
@@ -150,34 +250,20 @@ class ConfusionMatrix:
             return
 
         detections = detections[detections[:, 4] > self.conf]
-        gt_classes = labels[:, 0].int()
-        detection_classes = detections[:, 5].int()
-        iou = box_iou(labels[:, 1:], detections[:, :4])
-
-        x = torch.where(iou > self.iou_thres)
-        if x[0].shape[0]:
-            matches = torch.cat((torch.stack(x, 1), iou[x[0], x[1]][:, None]), 1).cpu().numpy()
-            if x[0].shape[0] > 1:
-                matches = matches[matches[:, 2].argsort()[::-1]]
-                matches = matches[np.unique(matches[:, 1], return_index=True)[1]]
-                matches = matches[matches[:, 2].argsort()[::-1]]
-                matches = matches[np.unique(matches[:, 0], return_index=True)[1]]
-        else:
-            matches = np.zeros((0, 3))
-
-        n = matches.shape[0] > 0
-        m0, m1, _ = matches.transpose().astype(int)
-        for i, gc in enumerate(gt_classes):
-            j = m0 == i
-            if n and sum(j) == 1:
-                self.matrix[detection_classes[m1[j]], gc] += 1  # correct
-            else:
-                self.matrix[self.nc, gc] += 1  # true background
-
-        if n:
-            for i, dc in enumerate(detection_classes):
-                if not any(m1 == i):
-                    self.matrix[dc, self.nc] += 1  # predicted background
+        iouv = torch.tensor([self.iou_thres], device=detections.device)
+        correct, j = match_predictions([detections], [labels], iouv, classes=False, order="iou", strict=True)
+        matched = correct[0][:, 0].cpu().numpy()  # detection matched
+        m1 = matched.nonzero()[0]  # matched detections
+        m0 = j[0].cpu().numpy()[m1]  # their labels
+        gt_classes = labels[:, 0].int().cpu().numpy()
+        detection_classes = detections[:, 5].int().cpu().numpy()
+
+        hit = np.zeros(len(gt_classes), dtype=bool)
+        hit[m0] = True
+        np.add.at(self.matrix, (detection_classes[m1], gt_classes[m0]), 1)  # correct
+        np.add.at(self.matrix, (self.nc, gt_classes[~hit]), 1)  # true background
+        if len(m1):
+            np.add.at(self.matrix, (detection_classes[~matched], self.nc), 1)  # predicted background
 
     def tp_fp(self):
         """Calculates true positives (tp) and false positives (fp) excluding the background class from the confusion
@@ -295,6 +381,78 @@ def box_iou(box1, box2, eps=1e-7):
     return inter / ((a2 - a1).prod(2) + (b2 - b1).prod(2) - inter + eps)
 
 
+def match_iou(iou, iouv, order="index", strict=False):
+    """
+    Greedy one-to-one matching of predictions to labels for all IoU thresholds at once, batched on device.
+
+    Each prediction is assigned its highest-IoU label; a label then keeps one of the predictions assigned to it with IoU
+    above the threshold, the first one for `order="index"` (predictions sorted by confidence, as in val.py) or the
+    highest-IoU one for `order="iou"` (as in ConfusionMatrix).
+
+    Arguments:
+        iou (Tensor[B, M, N]): label-prediction IoU per image, ineligible pairs (padding, other class) set to -1
+        iouv (Tensor[T]): IoU thresholds
+        order (str): 'index' or 'iou', which prediction a label keeps
+        strict (bool): require IoU > threshold instead of IoU >= threshold
+
+    Returns:
+        correct (Tensor[B, N, T]): bool, prediction matched at each threshold
+        j (Tensor[B, N]): index of the label each prediction is assigned to
+    """
+    b, m, n = iou.shape
+    if m == 0 or n == 0:
+        return torch.zeros((b, n, len(iouv)), dtype=torch.bool, device=iou.device), iou.new_zeros((b, n)).long()
+    v, j = iou.max(1)  # (B, N) best label per prediction
+    ok = v[..., None] > iouv if strict else v[..., None] >= iouv  # (B, N, T)
+    v, g = v.view(-1).double(), (torch.arange(b, device=iou.device)[:, None] * m + j).view(-1)  # values, label groups
+    gs, o = g.sort(stable=True)  # predictions grouped by label, in prediction order within a group
+    if order == "iou":  # first prediction of each group by decreasing IoU
+        o = o[(-v[o]).sort(stable=True)[1]]
+        o = o[g[o].sort(stable=True)[1]]
+        first = torch.ones_like(o, dtype=torch.bool)
+        first[1:] = g[o][1:] != g[o][:-1]
+        keep = torch.zeros_like(first)
+        keep[o] = first
+        return ok & keep.view(b, n, 1), j
+    # Highest IoU of the earlier predictions in the same group: a label keeps its first prediction above each threshold
+    c = (v[o] + 4 * gs).cummax(0)[0] - 4 * gs  # inclusive running max per group, offset by more than the IoU range
+    prior = torch.full_like(c, -1)
+    prior[1:] = torch.where(gs[1:] == gs[:-1], c[:-1], prior[1:])
+    prior[o] = prior.clone()
+    prior = prior.view(b, n, 1)
+    return ok & ~(prior > iouv if strict else prior >= iouv), j
+
+
+def match_predictions(detections, labels, iouv, classes=True, order="index", strict=False):
+    """
+    Returns correct prediction matrices for a batch of images, see match_iou().
+
+    Arguments:
+        detections (list[Tensor[N, 6]]): per image x1, y1, x2, y2, conf, class, sorted by decreasing conf
+        labels (list[Tensor[M, 5]]): per image class, x1, y1, x2, y2
+        iouv (Tensor[T]): IoU thresholds
+        classes (bool): only match predictions and labels of the same class
+
+    Returns:
+        correct (list[Tensor[N, T]]): bool, per image
+        j (list[Tensor[N]]): per image index of the label each prediction is assigned to
+    """
+    nd = torch.tensor([len(x) for x in detections], device=iouv.device)
+    nl = torch.tensor([len(x) for x in labels], device=iouv.device)
+    d = torch.nn.utils.rnn.pad_sequence([x[:, :6] for x in detections], batch_first=True)  # (B, N, 6)
+    t = torch.nn.utils.rnn.pad_sequence([x[:, :5] for x in labels], batch_first=True).to(d.dtype)  # (B, M, 5)
+    (a1, a2), (b1, b2) = t[:, :, None, 1:].chunk(2, 3), d[:, None, :, :4].chunk(2, 3)
+    inter = (torch.min(a2, b2) - torch.max(a1, b1)).clamp(0).prod(3)
+    iou = inter / ((a2 - a1).prod(3) + (b2 - b1).prod(3) - inter + 1e-7)  # box_iou() per image, (B, M, N)
+    valid = (torch.arange(t.shape[1], device=d.device) < nl[:, None])[:, :, None]
+    valid = valid & (torch.arange(d.shape[1], device=d.device) < nd[:, None])[:, None]
+    if classes:
+        valid &= t[:, :, None, 0] == d[:, None, :, 5]
+    correct, j = match_iou(torch.where(valid, iou, -1), iouv, order, strict)
+    n = nd.tolist()
+    return [x[:k] for x, k in zip(correct, n)], [x[:k] for x, k in zip(j, n)]
+
+
 def bbox_ioa(box1, box2, eps=1e-7):
     """
     Returns the intersection over box2 area given box1, box2.
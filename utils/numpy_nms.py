@@ -0,0 +1,161 @@
+# Ultralytics YOLOv5 🚀, AGPL-3.0 license
+"""
+Torch-free NumPy post-processing for ONNX Runtime, OpenVINO and TFLite outputs.
+
+Mirrors xywh2xyxy(), clip_boxes(), scale_boxes() and non_max_suppression() from utils/general.py with the same
+signatures and outputs, but imports only NumPy so edge deployments can skip importing torch entirely.
+
+Usage:
+    from utils.numpy_nms import non_max_suppression, scale_boxes
+
+    pred = session.run(None, {"images": im})[0]  # (b, n, 5 + nc + nm) np.ndarray
+    for det in non_max_suppression(pred, 0.25, 0.45):
+        det[:, :4] = scale_boxes(im.shape[2:], det[:, :4], im0.shape).round()
+"""
+
+import logging
+import time
+
+import numpy as np
+
+LOGGER = logging.getLogger("yolov5")  # same logger as utils.general, without importing it
+
+
+def xywh2xyxy(x):
+    """Convert nx4 boxes from [x, y, w, h] to [x1, y1, x2, y2] where xy1=top-left, xy2=bottom-right."""
+    y = np.copy(x)
+    y[..., 0] = x[..., 0] - x[..., 2] / 2  # top left x
+    y[..., 1] = x[..., 1] - x[..., 3] / 2  # top left y
+    y[..., 2] = x[..., 0] + x[..., 2] / 2  # bottom right x
+    y[..., 3] = x[..., 1] + x[..., 3] / 2  # bottom right y
+    return y
+
+
+def clip_boxes(boxes, shape):
+    """Clips bounding box coordinates (xyxy) in place to fit within the specified image shape (height, width)."""
+    boxes[..., [0, 2]] = boxes[..., [0, 2]].clip(0, shape[1])  # x1, x2
+    boxes[..., [1, 3]] = boxes[..., [1, 3]].clip(0, shape[0])  # y1, y2
+
+
+def scale_boxes(img1_shape, boxes, img0_shape, ratio_pad=None):
+    """Rescales (xyxy) bounding boxes from img1_shape to img0_shape, optionally using provided `ratio_pad`."""
+    if ratio_pad is None:  # calculate from img0_shape
+        gain = min(img1_shape[0] / img0_shape[0], img1_shape[1] / img0_shape[1])  # gain  = old / new
+        pad = (img1_shape[1] - img0_shape[1] * gain) / 2, (img1_shape[0] - img0_shape[0] * gain) / 2  # wh padding
+    else:
+        gain = ratio_pad[0][0]
+        pad = ratio_pad[1]
+
+    boxes[..., [0, 2]] -= pad[0]  # x padding
+    boxes[..., [1, 3]] -= pad[1]  # y padding
+    boxes[..., :4] /= gain
+    clip_boxes(boxes, img0_shape)
+    return boxes
+
+
+def nms(boxes, scores, iou_thres):
+    """
+    Greedy NMS equivalent to torchvision.ops.nms(), returning indices of kept boxes sorted by decreasing score.
+
+    A box is suppressed by a higher-scoring kept box when their IoU is greater than `iou_thres`.
+    """
+    x1, y1, x2, y2 = boxes.T
+    area = (x2 - x1) * (y2 - y1)
+    order = np.argsort(-scores, kind="stable")
+    keep = []
+    while order.size:
+        i, order = order[0], order[1:]
+        keep.append(i)
+        w = (np.minimum(x2[i], x2[order]) - np.maximum(x1[i], x1[order])).clip(0)
+        h = (np.minimum(y2[i], y2[order]) - np.maximum(y1[i], y1[order])).clip(0)
+        inter = w * h
+        order = order[inter / (area[i] + area[order] - inter) <= iou_thres]
+    return np.array(keep, dtype=np.int64)
+
+
+def non_max_suppression(
+    prediction,
+    conf_thres=0.25,
+    iou_thres=0.45,
+    classes=None,
+    agnostic=False,
+    multi_label=False,
+    labels=(),
+    max_det=300,
+    nm=0,  # number of masks
+):
+    """
+    Non-Maximum Suppression (NMS) on NumPy inference results to reject overlapping detections.
+
+    Returns:
+         list of detections, on (n,6) np.ndarray per image [xyxy, conf, cls]
+    """
+    # Checks
+    assert 0 <= conf_thres <= 1, f"Invalid Confidence threshold {conf_thres}, valid values are between 0.0 and 1.0"
+    assert 0 <= iou_thres <= 1, f"Invalid IoU {iou_thres}, valid values are between 0.0 and 1.0"
+    if isinstance(prediction, (list, tuple)):  # YOLOv5 model in validation model, output = (inference_out, loss_out)
+        prediction = prediction[0]  # select only inference output
+
+    bs = prediction.shape[0]  # batch size
+    nc = prediction.shape[2] - nm - 5  # number of classes
+    xc = prediction[..., 4] > conf_thres  # candidates
+
+    # Settings
+    max_wh = 7680  # (pixels) maximum box width and height
+    max_nms = 30000  # maximum number of boxes into nms()
+    time_limit = 0.5 + 0.05 * bs  # seconds to quit after
+    multi_label &= nc > 1  # multiple labels per box (adds 0.5ms/img)
+
+    t = time.time()
+    mi = 5 + nc  # mask start index
+    output = [np.zeros((0, 6 + nm), dtype=np.float32)] * bs
+    for xi, x in enumerate(prediction):  # image index, image inference
+        x = x[xc[xi]]  # confidence, copy
+
+        # Cat apriori labels if autolabelling
+        if labels and len(labels[xi]):
+            lb = labels[xi]
+            v = np.zeros((len(lb), nc + nm + 5), dtype=x.dtype)
+            v[:, :4] = lb[:, 1:5]  # box
+            v[:, 4] = 1.0  # conf
+            v[range(len(lb)), lb[:, 0].astype(int) + 5] = 1.0  # cls
+            x = np.concatenate((x, v), 0)
+
+        # If none remain process next image
+        if not x.shape[0]:
+            continue
+
+        # Compute conf
+        x[:, 5:] *= x[:, 4:5]  # conf = obj_conf * cls_conf
+
+        # Box/Mask
+        box = xywh2xyxy(x[:, :4])  # center_x, center_y, width, height) to (x1, y1, x2, y2)
+        mask = x[:, mi:]  # zero columns if no masks
+
+        # Detections matrix nx6 (xyxy, conf, cls)
+        if multi_label:
+            i, j = (x[:, 5:mi] > conf_thres).nonzero()
+            x = np.concatenate((box[i], x[i, 5 + j][:, None], j[:, None].astype(x.dtype), mask[i]), 1)
+        else:  # best class only
+            j = x[:, 5:mi].argmax(1)[:, None]
+            conf = np.take_along_axis(x[:, 5:mi], j, 1)
+            x = np.concatenate((box, conf, j.astype(x.dtype), mask), 1)[conf.reshape(-1) > conf_thres]
+
+        # Filter by class
+        if classes is not None:
+            x = x[(x[:, 5:6] == np.array(classes, dtype=x.dtype)).any(1)]
+
+        # Check shape
+        if not x.shape[0]:  # no boxes
+            continue
+        x = x[np.argsort(-x[:, 4], kind="stable")[:max_nms]]  # sort by confidence and remove excess boxes
+
+        # Batched NMS
+        c = x[:, 5:6] * (0 if agnostic else max_wh)  # classes
+        i = nms(x[:, :4] + c, x[:, 4], iou_thres)  # NMS on boxes offset by class
+        output[xi] = x[i[:max_det]]  # limit detections
+        if (time.time() - t) > time_limit:
+            LOGGER.warning(f"WARNING ⚠️ NMS time limit {time_limit:.3f}s exceeded")
+            break  # time limit exceeded
+
+    return output
@@ -0,0 +1,118 @@
+# Ultralytics YOLOv5 🚀, AGPL-3.0 license
+"""Pipelined execution utils."""
+
+import queue
+import threading
+
+from utils.general import Profile
+
+
+class _StageError:
+    """Carries an exception raised inside a pipeline stage downstream so it is re-raised by the consuming thread."""
+
+    def __init__(self, e):
+        """Wraps exception `e` raised inside a pipeline stage thread."""
+        self.e = e
+
+
+_DONE = object()  # end-of-stream sentinel
+
+
+class Pipeline:
+    """
+    Runs a source iterable, a chain of stage functions and a sink as concurrent stages joined by bounded FIFO queues.
+
+    Every stage runs in exactly one thread and every queue is FIFO, so items reach the sink in the order the source
+    produced them. A full queue blocks its producer (backpressure), bounding memory to `maxsize` items per stage. The
+    sink runs in the calling thread, which keeps GUI calls like cv2.imshow() on the main thread.
+
+    Usage:
+        pipe = Pipeline(dataset, stages=(preprocess, inference, nms), sink=save)
+        n = pipe.run()
+        LOGGER.info(pipe.summary())
+    """
+
+    def __init__(self, source, stages=(), sink=None, maxsize=4, profiles=None, names=None):
+        """Initializes a pipeline with a source iterable, stage callables, optional sink callable and queue size."""
+        n = len(stages) + 2  # source + stages + sink
+        self.source = source
+        self.stages = tuple(stages)
+        self.sink = sink or (lambda x: None)
+        self.maxsize = maxsize
+        self.profiles = [p or Profile() for p in (profiles or [None] * n)]
+        self.names = names or ("source", *(f"stage{i}" for i in range(len(stages))), "sink")
+        assert len(self.profiles) == len(self.names) == n, f"expected {n} profiles and names for {len(stages)} stages"
+        self.count = 0  # items consumed by the sink
+        self._stop = threading.Event()
+
+    def _put(self, q, x):
+        """Puts `x` on queue `q`, waiting while the queue is full unless the pipeline is stopping; returns success."""
+        while not self._stop.is_set():
+            try:
+                q.put(x, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce(self, q):
+        """Source thread: pulls items from the source iterable and feeds them into the first queue."""
+        it, dt = iter(self.source), self.profiles[0]
+        try:
+            while not self._stop.is_set():
+                with dt:
+                    x = next(it, _DONE)
+                if x is _DONE or not self._put(q, x):
+                    break
+        except Exception as e:
+            self._put(q, _StageError(e))
+        self._put(q, _DONE)
+
+    def _work(self, fn, dt, qi, qo):
+        """Stage thread: applies `fn` to each item from `qi` and forwards the result to `qo`, passing errors through."""
+        while not self._stop.is_set():
+            try:
+                x = qi.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if x is not _DONE and not isinstance(x, _StageError):
+                try:
+                    with dt:
+                        x = fn(x)
+                except Exception as e:
+                    x = _StageError(e)
+            if not self._put(qo, x) or x is _DONE:
+                break
+
+    def run(self):
+        """Starts the stage threads and runs the sink on the calling thread until the source is exhausted."""
+        qs = [queue.Queue(maxsize=self.maxsize) for _ in range(len(self.stages) + 1)]
+        threads = [threading.Thread(target=self._produce, args=(qs[0],), daemon=True)]
+        for i, fn in enumerate(self.stages):
+            args = fn, self.profiles[i + 1], qs[i], qs[i + 1]
+            threads.append(threading.Thread(target=self._work, args=args, daemon=True))
+        for t in threads:
+            t.start()
+
+        try:
+            while True:
+                x = qs[-1].get()
+                if x is _DONE:
+                    break
+                if isinstance(x, _StageError):
+                    raise x.e
+                with self.profiles[-1]:
+                    self.sink(x)
+                self.count += 1
+        finally:
+            self._stop.set()  # unblock producers on early exit
+            for t in threads:
+                t.join(timeout=1.0)
+        return self.count
+
+    def summary(self):
+        """Returns a string of per-stage time and throughput per item, naming the slowest (limiting) stage."""
+        n = max(self.count, 1)
+        t = [x.t / n * 1e3 for x in self.profiles]  # ms per item
+        s = ", ".join(f"{k} {v:.1f}ms ({1e3 / v if v else float('inf'):.1f}/s)" for k, v in zip(self.names, t))
+        return f"Pipeline: {s} -> {self.names[t.index(max(t))]}-bound"
@@ -0,0 +1,196 @@
+# Ultralytics YOLOv5 🚀, AGPL-3.0 license
+"""Sliced (tiled) inference utils for high-resolution imagery."""
+
+import math
+
+import numpy as np
+import torch
+import torchvision
+
+from utils.augmentations import preprocess
+from utils.general import LOGGER, Profile, make_divisible, non_max_suppression, scale_boxes
+
+
+def slice_windows(shape, size=640, overlap=0.2):
+    """
+    Returns (n, 4) int xyxy windows of at most `size` pixels covering an image of `shape` (h, w, ...).
+
+    Windows are spread evenly with at least `overlap` fractional overlap and the last window of each row and column is
+    flush with the image edge, so every window is full size unless the image itself is smaller than `size`.
+    """
+
+    def starts(length):
+        if length <= size:
+            return np.zeros(1, dtype=int)
+        n = math.ceil((length - size) / max(size * (1 - overlap), 1)) + 1  # windows along this axis
+        return np.linspace(0, length - size, n).round().astype(int)
+
+    h, w = shape[:2]
+    y, x = np.meshgrid(starts(h), starts(w), indexing="ij")
+    x, y = x.reshape(-1), y.reshape(-1)
+    return np.stack((x, y, np.minimum(x + size, w), np.minimum(y + size, h)), 1)
+
+
+def _overlap(a, b, area_a, area_b, metric="ios", eps=1e-7):
+    """Returns the (n, m) IoS or IoU matrix of xyxy boxes `a` and `b` with precomputed areas."""
+    lt = torch.max(a[:, None, :2], b[None, :, :2])
+    rb = torch.min(a[:, None, 2:], b[None, :, 2:])
+    inter = (rb - lt).clamp(0).prod(2)
+    denom = torch.min(area_a[:, None], area_b[None]) if metric == "ios" else area_a[:, None] + area_b[None] - inter
+    return inter / (denom + eps)
+
+
+def _greedy_merge(det, thres=0.5, metric="ios", method="nms", block=256):
+    """
+    Greedily clusters (n, 6) detections sorted by descending confidence, returning one box per cluster.
+
+    Overlaps are computed for `block` rows at a time against the still unclaimed boxes only (earlier boxes are all
+    claimed or cluster heads by then), so memory is O(block * n) instead of O(n^2).
+    """
+    boxes, conf = det[:, :4], det[:, 4]
+    area = (boxes[:, 2:] - boxes[:, :2]).clamp(0).prod(1)
+    free = torch.ones(len(det), dtype=torch.bool)
+    out = []
+    for b in range(0, len(det), block):
+        cols = b + free[b:].nonzero()[:, 0]  # unclaimed boxes from this block on
+        rows = slice(b, min(b + block, len(det)))
+        match = _overlap(boxes[rows], boxes[cols], area[rows], area[cols], metric) > thres  # (block, len(cols))
+        for i in range(rows.start, rows.stop):
+            if not free[i]:
+                continue
+            m = cols[match[i - b] & free[cols]]  # unclaimed boxes in this cluster
+            free[m] = False
+            free[i] = False
+            d = det[i].clone()
+            if method == "wbf":  # confidence-weighted box, top confidence
+                m = torch.cat((m[m != i], m.new_tensor([i])))
+                w = conf[m, None]
+                d[:4] = (boxes[m] * w).sum(0) / w.sum()
+            out.append(d)
+    return torch.stack(out)
+
+
+def merge_detections(det, thres=0.5, metric="ios", method="nms", agnostic=False, max_det=1000, max_candidates=10000):
+    """
+    Merges overlapping (n, 6) xyxy, conf, cls detections from tiles and passes into global detections.
+
+    `metric` is 'iou' or 'ios' (intersection over the smaller box), which also matches boxes truncated at tile borders
+    to the full box from a neighbouring tile. `method` 'nms' keeps the most confident box of each cluster and 'wbf'
+    replaces it with the confidence-weighted mean of the cluster (weighted boxes fusion). Clusters are per class unless
+    `agnostic`. Only the `max_candidates` most confident detections are merged, and for 'nms' they are first thinned
+    by IoU NMS at `thres`, which keeps the greedy IoS pass small on images with hundreds of tiles. IoU never exceeds
+    IoS, so the boxes removed overlap a more confident kept box above `thres` under either metric.
+    """
+    if len(det) < 2:
+        return det
+    c = det[:, 5] * (not agnostic)  # classes
+    if method == "nms":
+        i = torchvision.ops.batched_nms(det[:, :4], det[:, 4], c, thres)  # sorted by descending confidence
+        if metric == "iou":
+            return det[i[:max_det]]
+        det = det[i]
+    device = det.device
+    det = det[det[:, 4].argsort(descending=True)[:max_candidates]].float().cpu()  # greedy loop runs on CPU
+    groups = [det] if agnostic else [det[det[:, 5] == c] for c in det[:, 5].unique()]
+    det = torch.cat([_greedy_merge(x, thres, metric, method) for x in groups])
+    return det[det[:, 4].argsort(descending=True)[:max_det]].to(device)
+
+
+def _model_stride(model):
+    """Returns the max stride of a DetectMultiBackend or DetectionModel as an int."""
+    s = getattr(model, "stride", 32)
+    return int(s.max() if isinstance(s, torch.Tensor) else s)
+
+
+@torch.no_grad()
+def sliced_inference(
+    model,
+    im,
+    size=640,  # tile size (pixels)
+    overlap=0.2,  # fractional tile overlap
+    batch_size=8,  # tiles per forward pass
+    conf_thres=0.25,
+    iou_thres=0.45,  # per-tile NMS IoU threshold
+    classes=None,
+    agnostic=False,
+    max_det=1000,
+    full_size=0,  # add a full-image pass letterboxed to this size, 0 to disable
+    merge="nms",  # cross-tile merge method, 'nms' or 'wbf'
+    merge_thres=0.5,  # cross-tile merge overlap threshold
+    metric="ios",  # cross-tile merge overlap metric, 'ios' or 'iou'
+    swap_rb=True,  # BGR to RGB, False for RGB inputs
+    augment=False,
+):
+    """
+    Runs `model` over overlapping tiles of one HWC uint8 image and returns merged (n, 6) detections in image pixels.
+
+    Tiles are cut at native resolution so small objects are not lost to letterboxing, run `batch_size` at a time through
+    one preallocated buffer, NMS'd per tile, shifted to image coordinates and merged across tiles with
+    merge_detections(). Compute grows linearly with the number of tiles (see slice_windows()). Forward-pass memory is
+    bounded by the batch, independent of image size; the merge holds all tile detections, at most `max_det` per tile,
+    and compares them in blocks of rows.
+    """
+    device = getattr(model, "device", None) or next(model.parameters()).device
+    half = getattr(model, "fp16", False)
+    s = make_divisible(size, _model_stride(model))  # tile input size
+    windows = slice_windows(im.shape, size, overlap)
+
+    def forward(x):
+        x = torch.from_numpy(x).to(device)
+        x = x.half() if half else x.float()
+        x /= 255
+        pred = model(x, augment=augment)
+        return non_max_suppression(pred, conf_thres, iou_thres, classes, agnostic, max_det=max_det)
+
+    dets = []
+    x = np.empty((min(batch_size, len(windows)), 3, s, s), dtype=im.dtype)  # reused batch buffer
+    for b in range(0, len(windows), batch_size):
+        wins = windows[b : b + batch_size]
+        ratio_pad = [
+            preprocess(im[y1:y2, x1:x2], (s, s), auto=False, scaleup=False, out=x[j], swap_rb=swap_rb)[1:]
+            for j, (x1, y1, x2, y2) in enumerate(wins)
+        ]
+        for d, (x1, y1, x2, y2), rp in zip(forward(x[: len(wins)]), wins, ratio_pad):
+            scale_boxes((s, s), d[:, :4], (y2 - y1, x2 - x1), rp)
+            d[:, [0, 2]] += x1
+            d[:, [1, 3]] += y1
+            dets.append(d)
+
+    if full_size:  # downscaled full-image pass for objects larger than a tile
+        f = make_divisible(full_size, _model_stride(model))
+        xf, *rp = preprocess(im, (f, f), auto=False, swap_rb=swap_rb)
+        d = forward(xf[None])[0]
+        scale_boxes((f, f), d[:, :4], im.shape, rp)
+        dets.append(d)
+
+    return merge_detections(torch.cat(dets), merge_thres, metric, merge, agnostic, max_det)
+
+
+def profile_slicing(weights="yolov5s.pt", shapes=(1280, 2560, 5120), size=640, batch_sizes=(1, 8), n=3, device=""):
+    """
+    Profiles sliced inference time and peak CUDA memory across image sizes and tile batch sizes.
+
+    Usage:
+        from utils.slicing import profile_slicing
+        profile_slicing('yolov5s.pt', shapes=(1280, 2560, 5120, 8192))
+    """
+    from models.common import DetectMultiBackend
+    from utils.torch_utils import select_device
+
+    device = select_device(device)
+    model = DetectMultiBackend(weights, device=device)
+    LOGGER.info(f"{'shape':>8}{'tiles':>8}{'batch':>8}{'ms':>10}{'ms/tile':>10}{'peak MB':>10}")
+    for shape in shapes:
+        im = np.random.randint(0, 255, (shape, shape, 3), dtype=np.uint8)
+        nt = len(slice_windows(im.shape, size))
+        for bs in batch_sizes:
+            sliced_inference(model, im, size, batch_size=bs)  # warmup
+            if device.type == "cuda":
+                torch.cuda.reset_peak_memory_stats(device)
+            dt = Profile(device=device)
+            for _ in range(n):
+                with dt:
+                    sliced_inference(model, im, size, batch_size=bs)
+            mem = torch.cuda.max_memory_allocated(device) / 1e6 if device.type == "cuda" else 0
+            t = dt.t / n * 1e3
+            LOGGER.info(f"{shape:>8}{nt:>8}{bs:>8}{t:>10.1f}{t / nt:>10.2f}{mem:>10.0f}")
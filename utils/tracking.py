@@ -0,0 +1,389 @@
+# Ultralytics YOLOv5 🚀, AGPL-3.0 license
+"""Video temporal reuse utils: motion-gated keyframe scheduling, box propagation and multi-object tracking."""
+
+import time
+
+import cv2
+import numpy as np
+import torch
+from scipy.optimize import linear_sum_assignment
+
+from utils.general import LOGGER
+from utils.metrics import box_iou
+
+
+def small_gray(im0, width=160):
+    """Returns a small grayscale copy of a BGR HWC image for cheap motion scoring."""
+    h, w = im0.shape[:2]
+    gray = cv2.cvtColor(im0, cv2.COLOR_BGR2GRAY) if im0.ndim == 3 else im0
+    return cv2.resize(gray, (width, max(round(h * width / w), 1)), interpolation=cv2.INTER_AREA)
+
+
+def motion_score(a, b, block=16):
+    """
+    Returns the largest mean absolute difference of any `block` x `block` cell between small grayscale frames, 0-1.
+
+    Taking the max over cells rather than the global mean lets a single small moving object in an otherwise static
+    scene trigger a keyframe.
+    """
+    block = max(min(block, *a.shape[:2]), 1)
+    h, w = a.shape[0] // block * block, a.shape[1] // block * block
+    d = cv2.absdiff(a[:h, :w], b[:h, :w]).astype(np.float32)
+    return float(d.reshape(h // block, block, w // block, block).mean((1, 3)).max()) / 255
+
+
+def iou_match(a, b, iou_thres=0.3, classes=True):
+    """
+    Matches (n, 4+) boxes `a` to (m, 4+) boxes `b` by maximum total IoU (Hungarian), optionally within classes.
+
+    Returns (k, 2) matched index pairs, unmatched indices of `a` and unmatched indices of `b`.
+    """
+    if not len(a) or not len(b):
+        return np.empty((0, 2), dtype=int), np.arange(len(a)), np.arange(len(b))
+    iou = box_iou(a[:, :4], b[:, :4])
+    if classes:
+        iou *= a[:, 5:6] == b[None, :, 5]
+    iou = iou.cpu().numpy()
+    i, j = linear_sum_assignment(-iou)
+    keep = iou[i, j] >= iou_thres
+    matches = np.stack((i[keep], j[keep]), 1)
+    return (
+        matches,
+        np.setdiff1d(np.arange(len(a)), matches[:, 0]),
+        np.setdiff1d(np.arange(len(b)), matches[:, 1]),
+    )
+
+
+class KeyframeScheduler:
+    """
+    Runs the detector on a video only when the scene changes and propagates boxes on the frames in between.
+
+    A frame is a keyframe when it is the first of a new source, when the block motion score against the last keyframe
+    exceeds `thres`, or after `max_interval` frames. On keyframes update() stores the detections and estimates a
+    constant per-box velocity by IoU-matching them to the previous keyframe; on other frames predict() returns the
+    stored boxes moved by velocity x frames elapsed. One scheduler per stream.
+
+    Usage:
+        scheduler = KeyframeScheduler(thres=0.03, max_interval=30)
+        for path, im0 in frames:
+            if scheduler.is_keyframe(im0, path):
+                det = scheduler.update(detector(im0))
+            else:
+                det = scheduler.predict()
+        LOGGER.info(scheduler.summary())
+    """
+
+    def __init__(self, thres=0.03, max_interval=30, width=160, block=16, momentum=0.5):
+        """Initializes a scheduler with motion threshold `thres` (0-1) and maximum frames between keyframes."""
+        self.thres = thres
+        self.max_interval = max_interval
+        self.width = width  # motion scoring width (pixels)
+        self.block = block  # motion scoring cell size (pixels at `width`)
+        self.momentum = momentum  # velocity smoothing across keyframes
+        self.frames = self.keyframes = 0
+        self.reset()
+
+    def reset(self):
+        """Forgets the reference frame and boxes, i.e. on a new video."""
+        self.key = None  # source identifier, i.e. video path
+        self.ref = None  # small grayscale last keyframe
+        self.cur = None  # small grayscale current frame
+        self.det = None  # (n, 6) last keyframe detections
+        self.v = None  # (n, 4) xyxy velocity per frame
+        self.age = 0  # frames since last keyframe
+
+    def is_keyframe(self, im0, key=None):
+        """Returns True if the detector should run on BGR frame `im0` from source `key`."""
+        if key != self.key:
+            self.reset()
+            self.key = key
+        self.cur = small_gray(im0, self.width)
+        return (
+            self.ref is None
+            or self.ref.shape != self.cur.shape
+            or self.age + 1 >= self.max_interval
+            or motion_score(self.ref, self.cur, self.block) > self.thres
+        )
+
+    def update(self, det):
+        """Stores a copy of keyframe detections `det` (n, 6) and updates per-box velocities, returns `det`."""
+        out, det = det, det.detach().clone()
+        v = torch.zeros_like(det[:, :4])
+        if self.det is not None and self.age:
+            matches, _, _ = iou_match(det, self.predict(advance=False, age=self.age + 1), iou_thres=0.1)
+            if len(matches):
+                i, j = torch.from_numpy(matches).to(det.device).T
+                v[i] = (det[i, :4] - self.det[j, :4]) / (self.age + 1)
+                v[i] = self.momentum * self.v[j] + (1 - self.momentum) * v[i]
+        self.det, self.v, self.age, self.ref = det, v, 0, self.cur
+        self.frames += 1
+        self.keyframes += 1
+        return out
+
+    def predict(self, advance=True, age=None):
+        """Returns the last keyframe detections moved by their velocities to the current frame."""
+        if advance:
+            self.age += 1
+            self.frames += 1
+        if self.det is None:
+            return torch.zeros((0, 6))
+        det = self.det.clone()
+        det[:, :4] += self.v * (self.age if age is None else age)
+        return det
+
+    def summary(self):
+        """Returns a log string with keyframe ratio and compute saving."""
+        return (
+            f"Keyframes: {self.keyframes}/{self.frames} frames ({self.keyframes / max(self.frames, 1):.1%}), "
+            f"{self.frames / max(self.keyframes, 1):.1f}x fewer detector runs"
+        )
+
+
+def profile_keyframes(
+    weights="yolov5s.pt", source="video.mp4", thresholds=(0.01, 0.03, 0.05), max_interval=30, imgsz=640, device=""
+):
+    """
+    Benchmarks keyframe scheduling on a video against running the detector on every frame.
+
+    Reports detector runs, wall time and recall / precision of the scheduled (detected or propagated) boxes against the
+    every-frame detections at IoU 0.5 for each motion threshold.
+
+    Usage:
+        from utils.tracking import profile_keyframes
+        profile_keyframes('yolov5s.pt', 'cctv.mp4', thresholds=(0.01, 0.03, 0.05))
+    """
+    from models.common import DetectMultiBackend
+    from utils.dataloaders import LoadImages
+    from utils.general import check_img_size, non_max_suppression
+    from utils.torch_utils import select_device
+
+    device = select_device(device)
+    model = DetectMultiBackend(weights, device=device)
+    imgsz = check_img_size(imgsz, s=model.stride)
+    dataset = LoadImages(source, img_size=imgsz, stride=model.stride, auto=model.pt)
+    frames = [(im, im0.copy()) for _, im, im0, _, _ in dataset]  # decode once, time the detector only
+
+    def detect(im):
+        x = torch.from_numpy(im).to(device)[None]
+        x = (x.half() if model.fp16 else x.float()) / 255
+        return non_max_suppression(model(x))[0]
+
+    t = time.time()
+    reference = [detect(im) for im, _ in frames]
+    t_ref = time.time() - t
+    LOGGER.info(f"{'thres':>8}{'runs':>8}{'saving':>8}{'time':>8}{'speedup':>9}{'recall':>8}{'precision':>10}")
+    LOGGER.info(f"{'every':>8}{len(frames):>8}{'1.0x':>8}{t_ref:>7.1f}s{'1.0x':>9}{1:>8.3f}{1:>10.3f}")
+    for thres in thresholds:
+        scheduler = KeyframeScheduler(thres, max_interval)
+        t = time.time()
+        dets = [
+            scheduler.update(detect(im)) if scheduler.is_keyframe(im0, source) else scheduler.predict()
+            for im, im0 in frames
+        ]
+        dt = time.time() - t
+        tp = sum(len(iou_match(det.to(ref.device), ref, iou_thres=0.5)[0]) for det, ref in zip(dets, reference))
+        n_ref, n_pred = sum(len(x) for x in reference), sum(len(x) for x in dets)
+        saving = scheduler.frames / max(scheduler.keyframes, 1)
+        r, p = tp / max(n_ref, 1), tp / max(n_pred, 1)
+        runs = scheduler.keyframes
+        LOGGER.info(f"{thres:>8.3f}{runs:>8}{saving:>7.1f}x{dt:>7.1f}s{t_ref / dt:>8.1f}x{r:>8.3f}{p:>10.3f}")
+
+
+class ByteTracker:
+    """
+    ByteTrack-style multi-object tracker for one stream with structure-of-arrays NumPy state.
+
+    Every track is a row in preallocated arrays (Kalman mean and covariance in xyah, IDs, hits, lost age, ...) that grow
+    by doubling, so prediction and Kalman updates are batched array ops and association is one linear assignment per
+    stage: high-confidence detections against confirmed tracks, low-confidence detections against the still unmatched
+    tracked ones, then remaining high-confidence detections against tentative tracks. Unmatched confirmed tracks are
+    kept lost for `track_buffer` frames and remaining high-confidence detections start new tentative tracks.
+
+    Usage:
+        tracker = ByteTracker()
+        for det in detections:  # (n, 6) xyxy, conf, cls per frame
+            tracks = tracker.update(det)  # (m, 7) xyxy, track id, conf, cls
+        LOGGER.info(tracker.summary())
+    """
+
+    std_position = 1 / 20  # Kalman position noise relative to box height
+    std_velocity = 1 / 160  # Kalman velocity noise relative to box height
+
+    def __init__(self, track_thres=0.5, low_thres=0.1, new_thres=0.6, track_buffer=30, capacity=256):
+        """Initializes the tracker with confidence thresholds, lost-track buffer in frames and initial capacity."""
+        self.track_thres = track_thres  # high-confidence detection threshold
+        self.low_thres = low_thres  # low-confidence detections below this are dropped
+        self.new_thres = new_thres  # minimum confidence to start a track
+        self.track_buffer = track_buffer  # frames to keep a lost track
+        self.F = np.eye(8)
+        self.F[:4, 4:] = np.eye(4)  # constant velocity, dt = 1 frame
+        self.capacity = 0
+        self.next_id = 1
+        self.updates = 0
+        self.dt = 0.0  # seconds, total update time
+        self.reset(capacity)
+
+    def reset(self, capacity=256):
+        """Drops all tracks and (re)allocates state for `capacity` tracks, i.e. on a new video."""
+        self.key = None  # source identifier, i.e. video path
+        self.frame = 0
+        self.capacity = capacity
+        self.mean = np.zeros((capacity, 8))  # cx, cy, aspect, h and their velocities
+        self.cov = np.zeros((capacity, 8, 8))
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.conf = np.zeros(capacity, dtype=np.float32)
+        self.cls = np.zeros(capacity, dtype=np.float32)
+        self.hits = np.zeros(capacity, dtype=np.int32)
+        self.lost = np.zeros(capacity, dtype=np.int32)  # frames since last update
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.confirmed = np.zeros(capacity, dtype=bool)
+
+    def _grow(self, n):
+        """Doubles state capacity until `n` more tracks fit."""
+        free = self.capacity - self.alive.sum()
+        if free >= n:
+            return
+        new = self.capacity
+        while new - self.alive.sum() < n:
+            new *= 2
+        for k in ("mean", "cov", "ids", "conf", "cls", "hits", "lost", "alive", "confirmed"):
+            x = getattr(self, k)
+            setattr(self, k, np.concatenate((x, np.zeros((new - self.capacity, *x.shape[1:]), dtype=x.dtype))))
+        self.capacity = new
+
+    @staticmethod
+    def xyxy2xyah(x):
+        """Converts (n, 4) xyxy boxes to center x, center y, aspect ratio w/h, height."""
+        w, h = x[:, 2] - x[:, 0], x[:, 3] - x[:, 1]
+        return np.stack(((x[:, 0] + x[:, 2]) / 2, (x[:, 1] + x[:, 3]) / 2, w / np.maximum(h, 1e-6), h), 1)
+
+    @staticmethod
+    def xyah2xyxy(x):
+        """Converts (n, 4) center x, center y, aspect ratio, height boxes to xyxy."""
+        w, h = x[:, 2] * x[:, 3], x[:, 3]
+        return np.stack((x[:, 0] - w / 2, x[:, 1] - h / 2, x[:, 0] + w / 2, x[:, 1] + h / 2), 1)
+
+    def _initiate(self, det):
+        """Starts tentative tracks (confirmed on the first frame) for (n, 6) detections."""
+        self._grow(len(det))
+        i = np.flatnonzero(~self.alive)[: len(det)]
+        z = self.xyxy2xyah(det[:, :4])
+        h = z[:, 3]
+        p, v = 2 * self.std_position * h, 10 * self.std_velocity * h
+        std = np.stack((p, p, np.full_like(h, 1e-2), p, v, v, np.full_like(h, 1e-5), v), 1)
+        self.mean[i] = np.concatenate((z, np.zeros_like(z)), 1)
+        self.cov[i] = std[:, :, None] ** 2 * np.eye(8)
+        self.ids[i] = np.arange(self.next_id, self.next_id + len(i))
+        self.next_id += len(i)
+        self.conf[i], self.cls[i] = det[:, 4], det[:, 5]
+        self.hits[i], self.lost[i] = 1, 0
+        self.alive[i], self.confirmed[i] = True, self.frame == 1
+
+    def _predict(self, i):
+        """Kalman predict step for track rows `i`; lost tracks stop changing height."""
+        self.mean[i[self.lost[i] > 0], 7] = 0
+        h = self.mean[i, 3]
+        p, v = self.std_position * h, self.std_velocity * h
+        std = np.stack((p, p, np.full_like(h, 1e-2), p, v, v, np.full_like(h, 1e-5), v), 1)
+        self.mean[i] = self.mean[i] @ self.F.T
+        self.cov[i] = self.F @ self.cov[i] @ self.F.T + std[:, :, None] ** 2 * np.eye(8)
+
+    def _update(self, i, det):
+        """Kalman update step for track rows `i` with matched (n, 6) detections."""
+        if not len(i):
+            return
+        z = self.xyxy2xyah(det[:, :4])
+        p = self.std_position * self.mean[i, 3]
+        std = np.stack((p, p, np.full_like(p, 1e-1), p), 1)
+        cov = self.cov[i]
+        S = cov[:, :4, :4] + std[:, :, None] ** 2 * np.eye(4)  # innovation covariance
+        Kt = np.linalg.solve(S, cov[:, :4, :])  # (n, 4, 8) Kalman gain transposed, S symmetric
+        self.mean[i] += ((z - self.mean[i, :4])[:, None] @ Kt)[:, 0]
+        self.cov[i] = cov - Kt.transpose(0, 2, 1) @ S @ Kt
+        self.conf[i], self.cls[i] = det[:, 4], det[:, 5]
+        self.hits[i] += 1
+        self.lost[i] = 0
+
+    def _associate(self, i, det, iou_thres):
+        """Matches track rows `i` to detections by IoU, returns matched pairs, unmatched rows and unmatched dets."""
+        boxes = np.concatenate((self.xyah2xyxy(self.mean[i, :4]), self.conf[i, None], self.cls[i, None]), 1)
+        m, ut, ud = iou_match(torch.from_numpy(boxes), torch.from_numpy(det), iou_thres)
+        self._update(i[m[:, 0]], det[m[:, 1]])
+        return m, i[ut], ud
+
+    def update(self, det, key=None):
+        """Updates tracks with (n, 6) xyxy, conf, cls detections of the next frame, returns (m, 7) active tracks."""
+        t = time.perf_counter()
+        if key != self.key:
+            self.reset(self.capacity)
+            self.key = key
+        self.frame += 1
+        det = det.detach().cpu().double().numpy() if isinstance(det, torch.Tensor) else np.asarray(det, np.float64)
+        hi = det[det[:, 4] >= self.track_thres]
+        lo = det[(det[:, 4] >= self.low_thres) & (det[:, 4] < self.track_thres)]
+
+        alive = np.flatnonzero(self.alive)
+        self._predict(alive)
+        confirmed, tentative = alive[self.confirmed[alive]], alive[~self.confirmed[alive]]
+
+        # 1. High-confidence detections with tracked and lost confirmed tracks
+        _, unmatched, ud = self._associate(confirmed, hi, 0.2)
+        hi = hi[ud]
+
+        # 2. Low-confidence detections with tracks still unmatched that were tracked last frame
+        tracked = unmatched[self.lost[unmatched] == 0]
+        _, unmatched_tracked, _ = self._associate(tracked, lo, 0.5)
+        unmatched = np.concatenate((unmatched[self.lost[unmatched] > 0], unmatched_tracked))
+
+        # 3. Remaining high-confidence detections with tentative tracks, unmatched tentative tracks are dropped
+        m, ut, ud = self._associate(tentative, hi, 0.3)
+        self.confirmed[tentative[m[:, 0]]] = True
+        self.alive[ut] = False
+        hi = hi[ud]
+
+        # Lost tracks age out, new tracks start from remaining high-confidence detections
+        self.lost[unmatched] += 1
+        self.alive[unmatched[self.lost[unmatched] > self.track_buffer]] = False
+        self._initiate(hi[hi[:, 4] >= self.new_thres])
+
+        i = np.flatnonzero(self.alive & self.confirmed & (self.lost == 0))
+        boxes = self.xyah2xyxy(self.mean[i, :4])
+        out = np.concatenate((boxes, self.ids[i, None], self.conf[i, None], self.cls[i, None]), 1)
+        self.updates += 1
+        self.dt += time.perf_counter() - t
+        return out.astype(np.float32)
+
+    def summary(self):
+        """Returns a log string with the mean update cost and track counts."""
+        return (
+            f"Tracking: {self.dt / max(self.updates, 1) * 1e3:.2f}ms per update, "
+            f"{self.alive.sum()} live tracks, {self.next_id - 1} IDs"
+        )
+
+
+def profile_tracker(streams=32, objects=(100, 300, 1000), frames=100, noise=2.0, drop=0.1):
+    """
+    Profiles ByteTracker update cost with synthetic linearly moving objects across `streams` concurrent trackers.
+
+    Each stream sees `objects` boxes per frame with position noise, random confidences and a `drop` fraction of missed
+    detections. Reports ms per update, ms per frame over all streams and IDs created per object (1.0 is ideal).
+
+    Usage:
+        from utils.tracking import profile_tracker
+        profile_tracker(streams=32, objects=(100, 300, 1000))
+    """
+    rng = np.random.default_rng(0)
+    LOGGER.info(f"{'streams':>8}{'objects':>8}{'ms/update':>11}{'ms/frame':>10}{'IDs/object':>12}")
+    for n in objects:
+        trackers = [ByteTracker() for _ in range(streams)]
+        xy = rng.uniform(0, 4000, (streams, n, 2))
+        wh = rng.uniform(10, 80, (streams, n, 2))
+        v = rng.normal(0, 3, (streams, n, 2))
+        for f in range(frames):
+            for s, tracker in enumerate(trackers):
+                c = xy[s] + v[s] * f + rng.normal(0, noise, (n, 2))
+                det = np.concatenate((c - wh[s] / 2, c + wh[s] / 2, rng.uniform(0.3, 1, (n, 1)), np.zeros((n, 1))), 1)
+                tracker.update(det[rng.random(n) > drop])
+        dt = sum(x.dt for x in trackers) / (streams * frames) * 1e3
+        ids = sum(x.next_id - 1 for x in trackers) / (streams * n)
+        LOGGER.info(f"{streams:>8}{n:>8}{dt:>11.3f}{dt * streams:>10.2f}{ids:>12.2f}")
@@ -24,6 +24,7 @@ import json
 import os
 import subprocess
 import sys
+from multiprocessing import get_context
 from pathlib import Path
 
 import numpy as np
@@ -38,7 +39,8 @@ ROOT = Path(os.path.relpath(ROOT, Path.cwd()))  # relative
 
 from models.common import DetectMultiBackend
 from utils.callbacks import Callbacks
-from utils.dataloaders import create_dataloader
+from utils.coco_eval import COCOEvaluator
+from utils.dataloaders import DevicePrefetcher, LoadImagesAndLabels, create_dataloader, shard_dataloader
 from utils.general import (
     LOGGER,
     TQDM_BAR_FORMAT,
@@ -56,7 +58,7 @@ from utils.general import (
     xywh2xyxy,
     xyxy2xywh,
 )
-from utils.metrics import ConfusionMatrix, ap_per_class, box_iou
+from utils.metrics import ConfusionMatrix, MetricAccumulator, ap_per_class, match_predictions
 from utils.plots import output_to_target, plot_images, plot_val_study
 from utils.torch_utils import select_device, smart_inference_mode
 
@@ -167,21 +169,9 @@ def process_batch(detections, labels, iouv):
     Notes:
         - This function is used as part of the evaluation pipeline for object detection models.
         - IoU (Intersection over Union) is a common evaluation metric for object detection performance.
+        - val.run() matches whole batches at once with utils.metrics.match_predictions().
     """
-    correct = np.zeros((detections.shape[0], iouv.shape[0])).astype(bool)
-    iou = box_iou(labels[:, 1:], detections[:, :4])
-    correct_class = labels[:, 0:1] == detections[:, 5]
-    for i in range(len(iouv)):
-        x = torch.where((iou >= iouv[i]) & correct_class)  # IoU > threshold and classes match
-        if x[0].shape[0]:
-            matches = torch.cat((torch.stack(x, 1), iou[x[0], x[1]][:, None]), 1).cpu().numpy()  # [label, detect, iou]
-            if x[0].shape[0] > 1:
-                matches = matches[matches[:, 2].argsort()[::-1]]
-                matches = matches[np.unique(matches[:, 1], return_index=True)[1]]
-                # matches = matches[matches[:, 2].argsort()[::-1]]
-                matches = matches[np.unique(matches[:, 0], return_index=True)[1]]
-            correct[matches[:, 1].astype(int), i] = True
-    return torch.tensor(correct, dtype=torch.bool, device=iouv.device)
+    return match_predictions([detections], [labels], iouv)[0][0]  # all thresholds in one pass on device
 
 
 @smart_inference_mode()
@@ -208,6 +198,11 @@ def run(
     exist_ok=False,  # existing project/name ok, do not increment
     half=True,  # use FP16 half-precision inference
     dnn=False,  # use OpenCV DNN for ONNX inference
+    prefetch=False,  # copy and normalize the next batch on device ahead of use
+    streaming=False,  # accumulate metrics in fixed confidence bins, bounded memory and intermediate mAP
+    pycocotools=False,  # evaluate --save-json results with pycocotools instead of the native COCO evaluator
+    shards=0,  # split CPU validation across this many processes
+    shard=None,  # (index, count) of this process in sharded validation, set by run_shards()
     model=None,
     dataloader=None,
     save_dir=Path(""),
@@ -243,6 +238,15 @@ def run(
         exist_ok (bool, optional): Overwrite existing project/name without incrementing. Default is False.
         half (bool, optional): Use FP16 half-precision inference. Default is True.
         dnn (bool, optional): Use OpenCV DNN for ONNX inference. Default is False.
+        prefetch (bool, optional): Stage the next batch on the device with a DevicePrefetcher. Default is False.
+        streaming (bool, optional): Accumulate metrics with a bounded-memory MetricAccumulator and show intermediate
+            mAP in the progress bar. Default is False.
+        pycocotools (bool, optional): Evaluate --save-json results with pycocotools instead of the native in-memory
+            COCOEvaluator. Default is False.
+        shards (int, optional): Split CPU validation into contiguous batch ranges run by this many processes, each
+            with its own model and a disjoint set of cores, and merge their results. Default is 0 (single process).
+        shard (tuple[int, int], optional): Index and count of this process in sharded validation. Internal, set by
+            run_shards(). Default is None.
         model (torch.nn.Module, optional): Model object for training. Default is None.
         dataloader (torch.utils.data.DataLoader, optional): Dataloader object. Default is None.
         save_dir (Path, optional): Directory to save results. Default is Path('').
@@ -253,8 +257,11 @@ def run(
     Returns:
         dict: Contains performance metrics including precision, recall, mAP50, and mAP50-95.
     """
+    run_kwargs = dict(locals())  # arguments, for sharded validation workers
+
     # Initialize/load model and set device
     training = model is not None
+    sharded = False  # validation runs in run_shards() processes, this process only merges their results
     if training:  # called by train.py
         device, pt, jit, engine = next(model.parameters()).device, True, False, False  # get model device, PyTorch model
         half &= device.type != "cpu"  # half precision only supported on CUDA
@@ -265,33 +272,39 @@ def run(
         # Directories
         save_dir = increment_path(Path(project) / name, exist_ok=exist_ok)  # increment run
         (save_dir / "labels" if save_txt else save_dir).mkdir(parents=True, exist_ok=True)  # make dir
+        if shards > 1 and device.type != "cpu":
+            LOGGER.warning("WARNING ⚠️ --shards is for CPU validation only, setting --shards=0")
+            shards = 0
+        sharded = shards > 1  # no model or dataloader here, their workers would compete with the pinned shards
 
         # Load model
-        model = DetectMultiBackend(weights, device=device, dnn=dnn, data=data, fp16=half)
-        stride, pt, jit, engine = model.stride, model.pt, model.jit, model.engine
-        imgsz = check_img_size(imgsz, s=stride)  # check image size
-        half = model.fp16  # FP16 supported on limited backends with CUDA
-        if engine:
-            batch_size = model.batch_size
-        else:
-            device = model.device
-            if not (pt or jit):
-                batch_size = 1  # export.py models default to batch-size 1
-                LOGGER.info(f"Forcing --batch-size 1 square inference (1,3,{imgsz},{imgsz}) for non-PyTorch models")
+        pt, jit, engine = False, False, False  # no model in this process when sharded
+        if not sharded:
+            model = DetectMultiBackend(weights, device=device, dnn=dnn, data=data, fp16=half)
+            stride, pt, jit, engine = model.stride, model.pt, model.jit, model.engine
+            imgsz = check_img_size(imgsz, s=stride)  # check image size
+            half = model.fp16  # FP16 supported on limited backends with CUDA
+            if engine:
+                batch_size = model.batch_size
+            else:
+                device = model.device
+                if not (pt or jit):
+                    batch_size = 1  # export.py models default to batch-size 1
+                    LOGGER.info(f"Forcing --batch-size 1 square inference (1,3,{imgsz},{imgsz}) for non-PyTorch models")
 
         # Data
         data = check_dataset(data)  # check
 
     # Configure
-    model.eval()
+    if not sharded:
+        model.eval()
     cuda = device.type != "cpu"
     is_coco = isinstance(data.get("val"), str) and data["val"].endswith(f"coco{os.sep}val2017.txt")  # COCO dataset
     nc = 1 if single_cls else int(data["nc"])  # number of classes
     iouv = torch.linspace(0.5, 0.95, 10, device=device)  # iou vector for mAP@0.5:0.95
-    niou = iouv.numel()
 
     # Dataloader
-    if not training:
+    if not training and not sharded:
         if pt and not single_cls:  # check --weights are trained on --data
             ncm = model.model.nc
             assert ncm == nc, (
@@ -312,10 +325,18 @@ def run(
             workers=workers,
             prefix=colorstr(f"{task}: "),
         )[0]
+        if shard:  # this process validates a contiguous range of batches
+            dataloader = shard_dataloader(dataloader, *shard)
+    elif sharded:  # build or validate the label index once, shards then only memory-map it
+        task = task if task in ("train", "val", "test") else "val"
+        LoadImagesAndLabels(data[task], imgsz, batch_size, single_cls=single_cls, prefix=colorstr(f"{task}: "))
 
     seen = 0
     confusion_matrix = ConfusionMatrix(nc=nc)
-    names = model.names if hasattr(model, "names") else model.module.names  # get class names
+    if sharded:
+        names = data["names"]
+    else:
+        names = model.names if hasattr(model, "names") else model.module.names  # get class names
     if isinstance(names, (list, tuple)):  # old format
         names = dict(enumerate(names))
     class_map = coco80_to_coco91_class() if is_coco else list(range(1000))
@@ -324,16 +345,20 @@ def run(
     dt = Profile(device=device), Profile(device=device), Profile(device=device)  # profiling times
     loss = torch.zeros(3, device=device)
     jdict, stats, ap, ap_class = [], [], [], []
+    metrics = MetricAccumulator(nc, len(iouv), device=device) if streaming else None
     callbacks.run("on_val_start")
-    pbar = tqdm(dataloader, desc=s, bar_format=TQDM_BAR_FORMAT)  # progress bar
+    if prefetch and not sharded:
+        dataloader = DevicePrefetcher(dataloader, device, torch.half if half else torch.float)
+    pbar = tqdm([] if sharded else dataloader, desc=s, bar_format=TQDM_BAR_FORMAT, disable=bool(shard and shard[0]))
     for batch_i, (im, targets, paths, shapes) in enumerate(pbar):
         callbacks.run("on_val_batch_start")
         with dt[0]:
-            if cuda:
-                im = im.to(device, non_blocking=True)
-                targets = targets.to(device)
-            im = im.half() if half else im.float()  # uint8 to fp16/32
-            im /= 255  # 0 - 255 to 0.0 - 1.0
+            if not prefetch:  # else already on device as fp16/32 0.0 - 1.0
+                if cuda:
+                    im = im.to(device, non_blocking=True)
+                    targets = targets.to(device)
+                im = im.half() if half else im.float()  # uint8 to fp16/32
+                im /= 255  # 0 - 255 to 0.0 - 1.0
             nb, _, height, width = im.shape  # batch size, channels, height, width
 
         # Inference
@@ -352,36 +377,46 @@ def run(
                 preds, conf_thres, iou_thres, labels=lb, multi_label=True, agnostic=single_cls, max_det=max_det
             )
 
-        # Metrics
+        # Native-space predictions and labels
+        predns, labelsns = [], []
         for si, pred in enumerate(preds):
             labels = targets[targets[:, 0] == si, 1:]
-            nl, npr = labels.shape[0], pred.shape[0]  # number of labels, predictions
+            if single_cls:
+                pred[:, 5] = 0
+            predn = pred.clone()
+            scale_boxes(im[si].shape[1:], predn[:, :4], shapes[si][0], shapes[si][1])  # native-space pred
+            tbox = xywh2xyxy(labels[:, 1:5])  # target boxes
+            scale_boxes(im[si].shape[1:], tbox, shapes[si][0], shapes[si][1])  # native-space labels
+            predns.append(predn)
+            labelsns.append(torch.cat((labels[:, 0:1], tbox), 1))  # native-space labels
+
+        # Evaluate all images of the batch at once
+        corrects = match_predictions(predns, labelsns, iouv)[0]
+
+        # Metrics
+        for si, pred in enumerate(preds):
+            predn, labelsn, correct = predns[si], labelsns[si], corrects[si]
+            nl, npr = labelsn.shape[0], pred.shape[0]  # number of labels, predictions
             path, shape = Path(paths[si]), shapes[si][0]
-            correct = torch.zeros(npr, niou, dtype=torch.bool, device=device)  # init
             seen += 1
 
             if npr == 0:
                 if nl:
-                    stats.append((correct, *torch.zeros((2, 0), device=device), labels[:, 0]))
+                    stat = (correct, *torch.zeros((2, 0), device=device), labelsn[:, 0])
+                    if streaming:
+                        metrics.update(*stat)
+                    else:
+                        stats.append(stat)
                     if plots:
-                        confusion_matrix.process_batch(detections=None, labels=labels[:, 0])
+                        confusion_matrix.process_batch(detections=None, labels=labelsn[:, 0])
                 continue
-
-            # Predictions
-            if single_cls:
-                pred[:, 5] = 0
-            predn = pred.clone()
-            scale_boxes(im[si].shape[1:], predn[:, :4], shape, shapes[si][1])  # native-space pred
-
-            # Evaluate
-            if nl:
-                tbox = xywh2xyxy(labels[:, 1:5])  # target boxes
-                scale_boxes(im[si].shape[1:], tbox, shape, shapes[si][1])  # native-space labels
-                labelsn = torch.cat((labels[:, 0:1], tbox), 1)  # native-space labels
-                correct = process_batch(predn, labelsn, iouv)
-                if plots:
-                    confusion_matrix.process_batch(predn, labelsn)
-            stats.append((correct, pred[:, 4], pred[:, 5], labels[:, 0]))  # (correct, conf, pcls, tcls)
+            if nl and plots:
+                confusion_matrix.process_batch(predn, labelsn)
+            stat = (correct, pred[:, 4], pred[:, 5], labelsn[:, 0])  # (correct, conf, pcls, tcls)
+            if streaming:
+                metrics.update(*stat)
+            else:
+                stats.append(stat)
 
             # Save/log
             if save_txt:
@@ -392,19 +427,53 @@ def run(
             callbacks.run("on_val_image_end", pred, predn, path, names, im[si])
 
         # Plot images
-        if plots and batch_i < 3:
+        if plots and batch_i < 3 and not (shard and shard[0]):
             plot_images(im, targets, paths, save_dir / f"val_batch{batch_i}_labels.jpg", names)  # labels
             plot_images(im, output_to_target(preds), paths, save_dir / f"val_batch{batch_i}_pred.jpg", names)  # pred
 
         callbacks.run("on_val_batch_end", batch_i, im, targets, paths, shapes, preds)
+        if streaming and batch_i % 50 == 49:  # intermediate mAP
+            pbar.set_postfix_str("mAP50 %.3g mAP50-95 %.3g" % metrics.summary()[2:])
+
+    # Sharded validation
+    if shard:  # partial results, merged by the caller of run_shards()
+        stats = [tuple(torch.cat(x, 0) for x in zip(*stats))] if stats else []
+        files = [dataloader.dataset.im_files[j] for b in dataloader.batch_sampler for j in b]  # this shard's images
+        cm, t = confusion_matrix.matrix, [x.t for x in dt]
+        return metrics if streaming else stats, jdict, seen, cm, t, loss, files, len(dataloader)
+    if sharded:
+        im_files, nb = [], 0
+        results = run_shards(shards, dict(run_kwargs, project=save_dir.parent, name=save_dir.name, exist_ok=True))
+        for st, jd, n, cm, t, ls, files, nbs in results:  # in shard order, same as a single-process run
+            if streaming:
+                metrics.merge(st)
+            else:
+                stats.extend(st)
+            jdict.extend(jd)
+            im_files.extend(files)
+            nb += nbs
+            seen += n
+            confusion_matrix.matrix += cm
+            loss += ls
+            for d, x in zip(dt, t):
+                d.t += x
+    else:
+        im_files, nb = dataloader.dataset.im_files, len(dataloader)
 
     # Compute metrics
-    stats = [torch.cat(x, 0).cpu().numpy() for x in zip(*stats)]  # to numpy
-    if len(stats) and stats[0].any():
-        tp, fp, p, r, f1, ap, ap_class = ap_per_class(*stats, plot=plots, save_dir=save_dir, names=names)
+    if streaming:
+        nt, found = metrics.nt.cpu().numpy(), bool(metrics.tp.any())  # number of targets per class
+    else:
+        stats = [torch.cat(x, 0).cpu().numpy() for x in zip(*stats)]  # to numpy
+        nt = np.bincount(stats[3].astype(int), minlength=nc)  # number of targets per class
+        found = bool(len(stats) and stats[0].any())
+    if found:
+        if streaming:
+            tp, fp, p, r, f1, ap, ap_class = metrics.compute(plot=plots, save_dir=save_dir, names=names)
+        else:
+            tp, fp, p, r, f1, ap, ap_class = ap_per_class(*stats, plot=plots, save_dir=save_dir, names=names)
         ap50, ap = ap[:, 0], ap.mean(1)  # AP@0.5, AP@0.5:0.95
         mp, mr, map50, map = p.mean(), r.mean(), ap50.mean(), ap.mean()
-    nt = np.bincount(stats[3].astype(int), minlength=nc)  # number of targets per class
 
     # Print results
     pf = "%22s" + "%11i" * 2 + "%11.3g" * 4  # print format
@@ -413,7 +482,7 @@ def run(
         LOGGER.warning(f"WARNING ⚠️ no labels found in {task} set, can not compute metrics without labels")
 
     # Print results per class
-    if (verbose or (nc < 50 and not training)) and nc > 1 and len(stats):
+    if (verbose or (nc < 50 and not training)) and nc > 1 and found:
         for i, c in enumerate(ap_class):
             LOGGER.info(pf % (names[c], seen, nt[c], p[i], r[i], ap50[i], ap[i]))
 
@@ -435,36 +504,71 @@ def run(
         if not os.path.exists(anno_json):
             anno_json = os.path.join(data["path"], "annotations", "instances_val2017.json")
         pred_json = str(save_dir / f"{w}_predictions.json")  # predictions
-        LOGGER.info(f"\nEvaluating pycocotools mAP... saving {pred_json}...")
+        LOGGER.info(f"\nEvaluating {'pycocotools' if pycocotools else 'COCO'} mAP... saving {pred_json}...")
         with open(pred_json, "w") as f:
             json.dump(jdict, f)
+        img_ids = [int(Path(x).stem) for x in im_files] if is_coco else None  # image IDs to evaluate
 
-        try:  # https://github.com/cocodataset/cocoapi/blob/master/PythonAPI/pycocoEvalDemo.ipynb
-            check_requirements("pycocotools>=2.0.6")
-            from pycocotools.coco import COCO
-            from pycocotools.cocoeval import COCOeval
-
-            anno = COCO(anno_json)  # init annotations api
-            pred = anno.loadRes(pred_json)  # init predictions api
-            eval = COCOeval(anno, pred, "bbox")
-            if is_coco:
-                eval.params.imgIds = [int(Path(x).stem) for x in dataloader.dataset.im_files]  # image IDs to evaluate
-            eval.evaluate()
-            eval.accumulate()
-            eval.summarize()
-            map, map50 = eval.stats[:2]  # update results (mAP@0.5:0.95, mAP@0.5)
-        except Exception as e:
-            LOGGER.info(f"pycocotools unable to run: {e}")
+        if not pycocotools:  # in-memory, same 12 stats as COCOeval
+            try:
+                map, map50 = COCOEvaluator(anno_json).evaluate(jdict, img_ids)[:2]  # update results
+            except Exception as e:
+                LOGGER.info(f"COCO evaluator unable to run: {e}")
+        else:
+            try:  # https://github.com/cocodataset/cocoapi/blob/master/PythonAPI/pycocoEvalDemo.ipynb
+                check_requirements("pycocotools>=2.0.6")
+                from pycocotools.coco import COCO
+                from pycocotools.cocoeval import COCOeval
+
+                anno = COCO(anno_json)  # init annotations api
+                pred = anno.loadRes(pred_json)  # init predictions api
+                eval = COCOeval(anno, pred, "bbox")
+                if img_ids:
+                    eval.params.imgIds = img_ids
+                eval.evaluate()
+                eval.accumulate()
+                eval.summarize()
+                map, map50 = eval.stats[:2]  # update results (mAP@0.5:0.95, mAP@0.5)
+            except Exception as e:
+                LOGGER.info(f"pycocotools unable to run: {e}")
 
     # Return results
-    model.float()  # for training
+    if not sharded:
+        model.float()  # for training
     if not training:
         s = f"\n{len(list(save_dir.glob('labels/*.txt')))} labels saved to {save_dir / 'labels'}" if save_txt else ""
         LOGGER.info(f"Results saved to {colorstr('bold', save_dir)}{s}")
     maps = np.zeros(nc) + map
     for i, c in enumerate(ap_class):
         maps[c] = ap[i]
-    return (mp, mr, map50, map, *(loss.cpu() / len(dataloader)).tolist()), maps, t
+    return (mp, mr, map50, map, *(loss.cpu() / max(nb, 1)).tolist()), maps, t
+
+
+def run_shards(shards, kwargs):
+    """
+    Runs run(**kwargs) as `shards` spawned CPU processes, each validating a contiguous range of batches.
+
+    Every process loads its own model, is pinned to a disjoint subset of the available cores with one intra-op thread
+    per core, and decodes images in-process. The label index must already exist (run() builds it before calling this)
+    so shards only memory-map it instead of each scanning the dataset and racing to save it. Returns the partial
+    results of each shard in shard order.
+    """
+    cores = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count()))
+    n = max(len(cores) // shards, 1)  # cores per shard
+    kwargs = {k: v for k, v in kwargs.items() if k not in {"model", "dataloader", "callbacks", "compute_loss"}}
+    kwargs.update(shards=0, workers=0)  # images are decoded in each shard process
+    args = [(dict(kwargs, shard=(i, shards)), cores[i * n : (i + 1) * n] or cores) for i in range(shards)]
+    LOGGER.info(f"Validating in {shards} shards of {n} CPU cores...")
+    with get_context("spawn").Pool(shards) as pool:
+        return pool.starmap(run_shard, args)
+
+
+def run_shard(kwargs, cores):
+    """Pins this process to `cores`, sets one intra-op thread per core and runs one validation shard."""
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+    torch.set_num_threads(len(cores))
+    return run(**kwargs)
 
 
 def parse_opt():
@@ -494,6 +598,12 @@ def parse_opt():
         exist_ok (bool, optional): If set, existing directory will not be incremented. Default is False.
         half (bool, optional): If set, uses FP16 half-precision inference. Default is False.
         dnn (bool, optional): If set, uses OpenCV DNN for ONNX inference. Default is False.
+        prefetch (bool, optional): If set, copies and normalizes the next batch on the device ahead of use. Default is
+            False.
+        streaming (bool, optional): If set, accumulates metrics in fixed confidence bins with bounded memory. Default
+            is False.
+        pycocotools (bool, optional): If set, evaluates COCO JSON results with pycocotools. Default is False.
+        shards (int, optional): Number of CPU processes to split validation across. Default is 0.
 
     Returns:
         argparse.Namespace: Parsed command-line options.
@@ -537,6 +647,10 @@ def parse_opt():
     parser.add_argument("--exist-ok", action="store_true", help="existing project/name ok, do not increment")
     parser.add_argument("--half", action="store_true", help="use FP16 half-precision inference")
     parser.add_argument("--dnn", action="store_true", help="use OpenCV DNN for ONNX inference")
+    parser.add_argument("--prefetch", action="store_true", help="copy and normalize next batch on device ahead of use")
+    parser.add_argument("--pycocotools", action="store_true", help="use pycocotools for --save-json COCO mAP")
+    parser.add_argument("--shards", type=int, default=0, help="split CPU validation across N processes")
+    parser.add_argument("--streaming", action="store_true", help="bounded-memory binned metrics with intermediate mAP")
     opt = parser.parse_args()
     opt.data = check_yaml(opt.data)  # check YAML
     opt.save_json |= opt.data.endswith("coco.yaml")